@@ -0,0 +1,77 @@
+"""
+Measures LATENCY_BUDGETS against a verbose model: the stub writes very long corrections, so without a
+budget they run into the read timeout and fail. Reports per-call latency, timeouts and the answer length,
+with and without budgets, and how num_predict adapts to the speed measured on the way.
+
+Usage: python benchmarks/bench_budgets.py [--calls 6] [--budget 4] [--timeout 6] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+import program  # noqa: E402
+from run_benchmarks import configure_program, summarize  # noqa: E402
+from stub_ollama import LESSON, StubOllamaServer  # noqa: E402
+
+
+def run_calls(server, args, budgets):
+    program.LATENCY_BUDGETS = budgets
+    timings, words, failures, planned = [], [], 0, []
+    server.reset_counters()
+    trace = program.OperationTrace("bench_budgets")
+    with trace.activate():
+        for i in range(args.calls):
+            started = time.perf_counter()
+            try:
+                text = program.get_correction_ollama(LESSON, ["réponse"] * len(LESSON["exercises"]), mode="single")
+                words.append(len(text.split()))
+            except program.OllamaError:
+                failures += 1
+            timings.append(time.perf_counter() - started)
+            planned.append((server.requests[-1][1].get("options") or {}).get("num_predict"))
+    return {
+        "budget_s": budgets.get("correction"),
+        "latency": summarize(timings),
+        "failures": failures,
+        "timeout_retries": trace.fields.get("timeout_retries", 0),
+        "answer_words": words,
+        "num_predict": planned,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=6)
+    parser.add_argument("--budget", type=float, default=4, help="Correction budget (s)")
+    parser.add_argument("--timeout", type=float, default=6, help="Correction read timeout (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="Stub generation speed")
+    parser.add_argument("--correction-tokens", type=int, default=2000, help="Length of the stub's corrections")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    program.METRICS_ENABLED = False
+    program.OLLAMA_TIMEOUTS = dict(program.OLLAMA_TIMEOUTS, correction=args.timeout)
+    results = {}
+    with tempfile.TemporaryDirectory() as save_dir, \
+            StubOllamaServer(latency=0.1, tokens_per_second=args.tokens_per_second, correction_tokens=args.correction_tokens) as server:
+        for name, budgets in (("no_budget", {}), ("budgeted", {"correction": args.budget})):
+            configure_program(server, os.path.join(save_dir, name)) # Each run starts without measured speeds
+            results[name] = run_calls(server, args, budgets)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, run in results.items():
+            print(f"{name:>10}: mean {run['latency']['mean_s']:.2f}s, failures {run['failures']}/{args.calls}, "
+                  f"timeout retries {run['timeout_retries']}, words {run['answer_words']}, num_predict {run['num_predict']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
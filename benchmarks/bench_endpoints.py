@@ -0,0 +1,94 @@
+"""
+Load test for OLLAMA_ENDPOINTS routing: generates lessons from many threads against 1, 2, 4, ...
+stub Ollama nodes (each generating one request at a time, like a single GPU) and reports how
+throughput scales with node count, plus a run with one node down to exercise failover.
+
+Usage: python benchmarks/bench_endpoints.py [--nodes 1,2,4] [--requests 24] [--workers 8] [--json]
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+import program  # noqa: E402
+from run_benchmarks import configure_program  # noqa: E402
+from stub_ollama import StubOllamaServer  # noqa: E402
+
+
+def run_load(servers, args, down=()):
+    """Sends args.requests lesson generations from args.workers threads; `down` servers are stopped first."""
+    for server in down:
+        server.stop()
+    program.OLLAMA_ENDPOINTS = [server.url for server in servers]
+    client = program.get_ollama_client()
+    failures = 0
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(program.generate_daily_exercises_ollama, "A1", i % program.MAX_LESSONS_PER_MODULE + 1)
+                   for i in range(args.requests)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                failures += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "nodes": len(servers),
+        "nodes_down": len(down),
+        "requests": args.requests,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "endpoints": client.pool.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", default="1,2,4", help="Comma-separated node counts to compare")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=400)
+    parser.add_argument("--parallel", type=int, default=1, help="Requests each node generates at once")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+    node_counts = [int(n) for n in args.nodes.split(",")]
+
+    program.ENDPOINT_HEALTH_CHECK_SECONDS = 0 # Failover has to come from routing alone
+    runs = []
+    with tempfile.TemporaryDirectory() as save_dir:
+        for count in node_counts + [max(node_counts)]:
+            failover = len(runs) == len(node_counts)
+            if failover and count < 2:
+                break
+            servers = [StubOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second, parallel=args.parallel).start()
+                       for _ in range(count)]
+            configure_program(servers[0], save_dir)
+            try:
+                runs.append(run_load(servers, args, down=servers[-1:] if failover else ()))
+            finally:
+                for server in servers[:-1] if failover else servers:
+                    server.stop()
+
+    base = runs[0]["requests_per_s"]
+    for run in runs:
+        run["speedup"] = round(run["requests_per_s"] / base, 2) if base else None
+    if args.json:
+        print(json.dumps(runs, indent=2))
+    else:
+        for run in runs:
+            label = f"{run['nodes']} node(s)" + (f", {run['nodes_down']} down" if run["nodes_down"] else "")
+            print(f"{label:>20}: {run['requests_per_s']:6.2f} req/s  x{run['speedup']}  failures={run['failures']}  "
+                  f"per node={[endpoint['requests'] for endpoint in run['endpoints']]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Benchmarks LessonIndex at tens of thousands of lessons: appending lessons, loading the index from disk,
+the vectorized near-duplicate check and the covered-topics lookup, compared with a pure-Python
+cosine loop over the same vectors. Uses the hashed embedding, so no Ollama server is needed.
+
+Usage: python benchmarks/bench_lesson_index.py [--sizes 1000,10000,50000] [--queries 200] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+WORDS = ("passé composé imparfait subjonctif conditionnel futur pronoms relatifs adjectifs possessifs prépositions "
+         "négation questions nombres couleurs famille nourriture restaurant voyage transport météo vêtements santé "
+         "travail école maison sport loisirs musique cinéma politesse comparatifs superlatifs articles partitifs "
+         "verbes pronominaux impératif gérondif participe accord discours indirect connecteurs logiques").split()
+
+
+def synthetic_lesson(rng, i):
+    topic = " ".join(rng.sample(WORDS, 4))
+    return {"explanation_summary": f"Lesson {i}: today you will learn about {topic}.",
+            "lesson_content": f"This lesson explains {topic} with examples. " * 3}
+
+
+def python_nearest(vectors, query):
+    """The same cosine search without NumPy's vectorization, for comparison."""
+    best, best_row = -2.0, None
+    for row, vector in enumerate(vectors):
+        score = sum(a * b for a, b in zip(vector, query))
+        if score > best:
+            best, best_row = score, row
+    return best, best_row
+
+
+def run_size(size, args, rng):
+    lessons = [synthetic_lesson(rng, i) for i in range(size)]
+    with tempfile.TemporaryDirectory() as save_dir:
+        index = program.LessonIndex(save_dir, embedder=f"hashed:{program.LESSON_INDEX_DIM}")
+        index.dim = program.LESSON_INDEX_DIM
+        started = time.perf_counter()
+        vectors = program.hashed_embedding([program.lesson_topic_text(lesson) for lesson in lessons])
+        embed_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i, (lesson, vector) in enumerate(zip(lessons, vectors)):
+            index.add(f"M{i // 1000}", i % 1000 + 1, lesson, vector=vector)
+        add_s = time.perf_counter() - started
+
+        disk_bytes = sum(os.path.getsize(os.path.join(index.index_dir, name)) for name in os.listdir(index.index_dir))
+        started = time.perf_counter()
+        loaded = program.LessonIndex(save_dir, embedder=index.embedder)
+        load_s = time.perf_counter() - started
+
+        queries = [synthetic_lesson(rng, size + i) for i in range(args.queries)]
+        for query in queries: # Embed up front, so only the search is timed
+            loaded._vector_for(query)
+        started = time.perf_counter()
+        for query in queries:
+            loaded.nearest(query)
+        query_s = (time.perf_counter() - started) / len(queries)
+
+        started = time.perf_counter()
+        for _ in range(args.queries):
+            loaded.covered_topics("M0", program.COVERED_TOPICS_IN_PROMPT)
+        topics_s = (time.perf_counter() - started) / args.queries
+
+        result = {
+            "lessons": size,
+            "embed_per_lesson_ms": round(embed_s / size * 1000, 4),
+            "add_per_lesson_ms": round(add_s / size * 1000, 4),
+            "load_s": round(load_s, 4),
+            "index_mb": round(disk_bytes / (1024 * 1024), 2),
+            "nearest_ms": round(query_s * 1000, 3),
+            "covered_topics_ms": round(topics_s * 1000, 3),
+            "loaded_lessons": len(loaded),
+        }
+        if size <= args.python_max:
+            rows = loaded._vectors[:loaded._count].tolist()
+            query = loaded._vector_for(queries[0])
+            started = time.perf_counter()
+            python_score, python_row = python_nearest(rows, query.tolist())
+            python_s = time.perf_counter() - started
+            score, entry = loaded.nearest(queries[0])
+            result["python_nearest_ms"] = round(python_s * 1000, 3)
+            result["speedup_vs_python"] = round(python_s / query_s, 1) if query_s else None
+            result["same_match"] = entry is loaded._rows[python_row] and abs(score - python_score) < 1e-4
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated index sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--python-max", type=int, default=10000, help="Largest size to also time the pure-Python search at")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+    if program.load_numpy() is None:
+        print("NumPy is not installed; the lesson index needs it.", file=sys.stderr)
+        return 2
+
+    rng = random.Random(0)
+    results = [run_size(int(size), args, rng) for size in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(", ".join(f"{key}={value}" for key, value in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
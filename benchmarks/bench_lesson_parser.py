@@ -0,0 +1,125 @@
+"""
+Benchmarks parse_lesson_md/read_answers_from_md on large synthetic lesson files
+(hundreds of exercises, multi-MB answers) and compares them with the previous
+regex-rescan implementation of read_answers_from_md.
+
+Usage: python benchmarks/bench_lesson_parser.py [--exercises 400] [--answer-kb 8] [--repeat 3] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+
+def legacy_read_answers(content, num_exercises):
+    """The read_answers_from_md algorithm before the single-pass parser, kept for comparison."""
+    answers = [""] * num_exercises
+    answer_marker_positions = [m.end() for m in re.finditer(r"\*\*Your Answer:\*\*\s*", content)]
+    for i in range(num_exercises):
+        if i < len(answer_marker_positions):
+            start_index = answer_marker_positions[i]
+            end_index = len(content)
+            if (i + 1) < len(answer_marker_positions):
+                end_index = answer_marker_positions[i + 1] - len("**Your Answer:** ")
+            potential_answer_text = content[start_index:end_index].strip()
+            next_exercise_match = re.search(r"^\d+\.\s", potential_answer_text, re.MULTILINE)
+            next_heading_match = re.search(r"^#+\s", potential_answer_text, re.MULTILINE)
+            answer_end_in_block = len(potential_answer_text)
+            if next_exercise_match:
+                answer_end_in_block = min(answer_end_in_block, next_exercise_match.start())
+            if next_heading_match:
+                answer_end_in_block = min(answer_end_in_block, next_heading_match.start())
+            answers[i] = potential_answer_text[:answer_end_in_block].strip()
+    return answers
+
+
+def build_lesson(num_exercises, answer_kb, save_dir):
+    """Writes a lesson via save_lesson_md, then fills in long answers containing lists and '#' lines."""
+    lesson_data = {
+        "explanation_summary": "Benchmark lesson.",
+        "lesson_content": "Some grammar explanation.\n" * 50,
+        "exercises": [f"Exercise prompt number {i}: fill in the blank ___." for i in range(1, num_exercises + 1)],
+    }
+    filepath = program.save_lesson_md("A1", 1, lesson_data, save_dir=save_dir, language="Benchmark")
+    with open(filepath) as f:
+        text = f.read()
+
+    paragraph = "Je suis allé au marché et j'ai acheté des pommes. " * 4
+    body = []
+    while sum(len(part) for part in body) < answer_kb * 1024:
+        body.append(f"1. {paragraph}\n2. {paragraph}\n# {paragraph}\n\n")
+    answer = "".join(body).strip()
+
+    # Replace every empty answer in one pass; offsets shift, so rebuild from the parsed spans
+    doc = program.parse_lesson_md(text)
+    pieces, last = [], 0
+    for exercise in doc.exercises:
+        start, end = exercise.answer_span
+        pieces.append(text[last:start])
+        pieces.append(" " + answer)
+        last = end
+    pieces.append(text[last:])
+    text = "".join(pieces) + "\n---\n## Correction and Explanation\n\nAll good.\n"
+    with open(filepath, "w") as f:
+        f.write(text)
+    return filepath, text, answer
+
+
+def best_of(repeat, fn):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--exercises", type=int, default=400)
+    parser.add_argument("--answer-kb", type=int, default=8, help="Approximate size of each answer")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="Don't time the previous implementation")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        filepath, text, answer = build_lesson(args.exercises, args.answer_kb, save_dir)
+        size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+
+        parse_s, doc = best_of(args.repeat, lambda: program.parse_lesson_md(text))
+        answers_s, _ = best_of(args.repeat, lambda: program.parse_lesson_md(text).answers(args.exercises))
+        read_s, answers = best_of(args.repeat, lambda: program.read_answers_from_md(filepath, args.exercises))
+        results = {
+            "benchmark": "lesson_parser",
+            "exercises": args.exercises,
+            "file_mb": round(size_mb, 2),
+            "parse_lesson_md_s": round(parse_s, 4),
+            "parse_mb_per_s": round(size_mb / parse_s, 1) if parse_s else None,
+            "answers_s": round(answers_s, 4),
+            "read_answers_from_md_s": round(read_s, 4), # Includes reading the file
+            "answers_correct": answers == [answer] * args.exercises and doc.is_corrected,
+        }
+        if not args.skip_legacy:
+            legacy_s, legacy_answers = best_of(args.repeat, lambda: legacy_read_answers(text, args.exercises))
+            results["legacy_read_answers_s"] = round(legacy_s, 4)
+            results["legacy_answers_correct"] = legacy_answers == [answer] * args.exercises
+            results["speedup_vs_legacy"] = round(legacy_s / answers_s, 1) if answers_s else None
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>24}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Measures how long the app takes to start, each sample in a fresh interpreter: the time to import program
+(and whether the HTTP stack and NumPy were imported with it), and the time from launching the process to
+the first paint of the window and to it being interactive, i.e. the current lesson shown and the buttons
+enabled. The lesson file is a filled-in lesson of --lesson-kb.
+
+The window timings need a display (on a headless machine run it under xvfb-run); without one only the
+import is measured. Point --program-dir at another checkout to compare commits.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--lesson-kb 200] [--program-dir DIR] [--json]
+"""
+import argparse
+import json
+import os
+import py_compile
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("requests", "urllib3", "numpy", "asyncio")
+LESSON_EXERCISES = 10
+
+
+def child_import(launched):
+    """Runs in the child process: imports program and reports the timings."""
+    started = time.monotonic()
+    import program  # noqa: F401
+    imported = time.monotonic()
+    return {
+        "import_s": imported - started,
+        "process_s": imported - launched, # Including the interpreter's own startup
+        "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+
+def child_window(launched, save_dir):
+    """Runs in the child process: opens the app on save_dir and waits until it is interactive."""
+    import program
+    program.SAVE_DIR = save_dir
+    program.PROGRESS_FILE = os.path.join(save_dir, "lesson_progress.json")
+    program.STATUS_INDEX_FILE = os.path.join(save_dir, "lesson_status.json")
+    program.LESSON_DB_FILE = os.path.join(save_dir, "lessons.db")
+    program.PREFETCH_DIR = os.path.join(save_dir, ".prefetch")
+    program.METRICS_FILE = os.path.join(save_dir, "metrics.jsonl")
+    program.WARMUP_ON_STARTUP = False
+    program.PREFETCH_ENABLED = False
+    program.WATCH_ANSWERS = False
+    program.KEEP_ALIVE_PING_MINUTES = 0
+    try:
+        app = program.LanguageProfessorApp()
+    except program.tk.TclError as e:
+        return {"error": f"Tk could not start ({e}); run this under a display, e.g. xvfb-run."}
+    result = {}
+
+    def poll():
+        now = time.monotonic()
+        if "first_paint_s" not in result and app.winfo_viewable():
+            result["first_paint_s"] = now - launched
+        shown = app.lesson_display_text.index("end-1c") != "1.0"
+        if "first_paint_s" in result and shown and str(app.generate_button.cget("state")) == "normal":
+            result["interactive_s"] = now - launched
+            app.quit()
+            return
+        app.after(1, poll)
+
+    app.after(1, poll)
+    app.after(60000, app.quit)
+    app.mainloop()
+    return result
+
+
+def run_child(args, mode, save_dir=None):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--program-dir", args.program_dir]
+    if save_dir:
+        command += ["--save-dir", save_dir]
+    launched = time.monotonic() # CLOCK_MONOTONIC is shared with the child process
+    output = subprocess.run(command + ["--launched", repr(launched)], capture_output=True, text=True, timeout=120)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else f"exit {output.returncode}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes per measurement")
+    parser.add_argument("--lesson-kb", type=int, default=200, help="Size of the current lesson file")
+    parser.add_argument("--program-dir", default=os.path.join(BENCH_DIR, ".."), help="Checkout whose program.py is measured")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--child", choices=("import", "window"), help=argparse.SUPPRESS)
+    parser.add_argument("--launched", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--save-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.program_dir = os.path.abspath(args.program_dir)
+
+    if args.child:
+        sys.path[0:0] = [args.program_dir] # Ahead of this checkout's program
+        result = child_import(args.launched) if args.child == "import" else child_window(args.launched, args.save_dir)
+        print(json.dumps(result))
+        sys.stdout.flush()
+        os._exit(0) # Don't wait for daemon threads or the interpreter's teardown
+
+    # Imported only here, since they import program themselves and the child must import it first
+    sys.path[0:0] = [os.path.join(BENCH_DIR, ".."), BENCH_DIR]
+    from bench_lesson_parser import build_lesson
+    from run_benchmarks import summarize
+
+    # Every run loads program from its cached bytecode, as it is after the first launch
+    py_compile.compile(os.path.join(args.program_dir, "program.py"), doraise=True)
+    imports = [run_child(args, "import") for _ in range(args.runs)]
+    results = {
+        "program_dir": args.program_dir,
+        "import": summarize([run["import_s"] for run in imports]),
+        "process_to_import": summarize([run["process_s"] for run in imports]),
+        "loaded_at_import": imports[0]["loaded"],
+    }
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        build_lesson(LESSON_EXERCISES, max(1, args.lesson_kb // LESSON_EXERCISES), save_dir)
+        with open(os.path.join(save_dir, "lesson_progress.json"), "w") as f:
+            json.dump({"module": "A1", "lesson": 1}, f)
+        windows = [run_child(args, "window", save_dir)]
+        if "error" in windows[0]:
+            results["window"] = windows[0]["error"]
+        else:
+            # Later runs find the status index written by the first one, as on any launch after the first
+            windows += [run_child(args, "window", save_dir) for _ in range(args.runs - 1)]
+            results["lesson_kb"] = round(os.path.getsize(os.path.join(save_dir, "A1_lesson_1.md")) / 1024)
+            for name in ("first_paint_s", "interactive_s"):
+                results[name[:-2]] = summarize([run[name] for run in windows if name in run])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"import program: p50 {results['import']['p50_s'] * 1000:.1f} ms "
+              f"(process start to import {results['process_to_import']['p50_s'] * 1000:.1f} ms), "
+              f"also imported: {', '.join(results['loaded_at_import']) or 'nothing heavy'}")
+        if isinstance(results.get("window"), str):
+            print(f"window: skipped, {results['window']}")
+        else:
+            print(f"window ({results['lesson_kb']} KB lesson): first paint p50 {results['first_paint']['p50_s'] * 1000:.1f} ms, "
+                  f"interactive p50 {results['interactive']['p50_s'] * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
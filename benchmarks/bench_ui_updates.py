@@ -0,0 +1,152 @@
+"""
+Measures how long the Tk loop is blocked ("frame stalls") while a correction is streamed into the lesson
+display and the lesson file is reloaded, for growing lesson files. Compares the app's batched dispatcher
+with incremental appends against the previous behaviour of re-reading the file and re-rendering the whole
+display on the Tk thread.
+
+Needs a display (on a headless machine run it under xvfb-run).
+
+Usage: python benchmarks/bench_ui_updates.py [--sizes-kb 50,500,2000] [--chunks 400] [--json]
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+from tkinter import scrolledtext
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+
+class DisplayHarness(tk.Tk):
+    """Just the lesson display and status bar of LanguageProfessorApp, driven by the app's own update methods."""
+    _post_ui = program.LanguageProfessorApp._post_ui
+    _drain_ui_queue = program.LanguageProfessorApp._drain_ui_queue
+    _show_file = program.LanguageProfessorApp._show_file
+    _render_display = program.LanguageProfessorApp._render_display
+    _append_to_lesson_display = program.LanguageProfessorApp._append_to_lesson_display
+    _queue_stream_chunk = program.LanguageProfessorApp._queue_stream_chunk
+    _begin_stream_display = program.LanguageProfessorApp._begin_stream_display
+    _flush_stream_display = program.LanguageProfessorApp._flush_stream_display
+    _end_stream_display = program.LanguageProfessorApp._end_stream_display
+    _update_lesson_display_from_file = program.LanguageProfessorApp._update_lesson_display_from_file
+
+    def __init__(self):
+        super().__init__()
+        self.geometry("900x750")
+        self._ui_queue = queue.Queue()
+        self._frame_started = None
+        self._display_path = None
+        self._display_pieces = []
+        self._stream_lock = threading.Lock()
+        self._stream_pending = []
+        self._streaming = False
+        self._closing = False
+        self._trace = None
+        self.current_file_label = tk.Label(self)
+        self.current_file_label.pack()
+        self.lesson_display_text = scrolledtext.ScrolledText(self, wrap=tk.WORD, font=("Consolas", 11), height=25)
+        self.lesson_display_text.pack(fill=tk.BOTH, expand=True)
+        self.status_label = tk.Label(self)
+        self.status_label.pack()
+        self.after(program.UI_POLL_MS, self._drain_ui_queue)
+
+    def legacy_reload(self, filepath):
+        """The previous reload: read the file on the Tk thread and replace the whole display content."""
+        started = time.perf_counter()
+        with open(filepath, "r") as f:
+            content = f.read()
+        self.lesson_display_text.config(state=tk.NORMAL)
+        self.lesson_display_text.delete(1.0, tk.END)
+        self.lesson_display_text.insert(tk.END, content)
+        self.lesson_display_text.config(state=tk.DISABLED)
+        self.update_idletasks()
+        return time.perf_counter() - started
+
+
+def build_lesson_file(save_dir, lesson, size_kb):
+    paragraph = "Être et avoir sont les deux verbes les plus importants en français. " * 8 + "\n\n"
+    path = os.path.join(save_dir, f"A1_lesson_{lesson}.md")
+    with open(path, "w") as f:
+        f.write("# Lesson\n\n" + paragraph * max(1, size_kb * 1024 // len(paragraph.encode("utf-8"))))
+    return path
+
+
+def correction_chunks(count):
+    return [f"**Exercise {i // 40 + 1}:** mot{i} " for i in range(count)]
+
+
+def run_size(app, save_dir, lesson, size_kb, chunks, chunk_delay):
+    """Streams a correction into the display, appends it to the file and reloads it; returns the frame stats."""
+    path = build_lesson_file(save_dir, lesson, size_kb)
+    app._update_lesson_display_from_file(path)
+    app.update()
+    pieces = correction_chunks(chunks)
+
+    def worker():
+        app._post_ui(app._begin_stream_display)
+        for piece in pieces:
+            app._queue_stream_chunk(piece)
+            time.sleep(chunk_delay)
+        app._post_ui(app._end_stream_display)
+        program.append_correction_to_md("A1", lesson, "".join(pieces), save_dir=save_dir)
+        app._show_file(path)
+        app._post_ui(app.quit)
+
+    app._trace = program.OperationTrace("bench_ui", size_kb=size_kb)
+    threading.Thread(target=worker, daemon=True).start()
+    app.mainloop()
+    trace, app._trace = app._trace, None
+    shown = app.lesson_display_text.get("1.0", "end-1c")
+    with open(path) as f:
+        on_disk = f.read()
+
+    # What the reload used to cost for the same file
+    app._update_lesson_display_from_file(path)
+    legacy_s = app.legacy_reload(path)
+    return {
+        "file_kb": round(len(on_disk.encode("utf-8")) / 1024),
+        "max_frame_ms": round(trace.max_frame_s * 1000, 2),
+        "stalls": trace.stalls,
+        "display_matches_file": shown == on_disk,
+        "legacy_reload_ms": round(legacy_s * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-kb", default="50,500,2000", help="Comma-separated lesson file sizes")
+    parser.add_argument("--chunks", type=int, default=400, help="Streamed correction pieces")
+    parser.add_argument("--chunk-delay", type=float, default=0.002, help="Seconds between streamed pieces")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    program.METRICS_ENABLED = False
+    try:
+        app = DisplayHarness()
+    except tk.TclError as e:
+        print(f"Tk could not start ({e}); run this under a display, e.g. xvfb-run.", file=sys.stderr)
+        return 2
+    results = []
+    with tempfile.TemporaryDirectory() as save_dir:
+        for lesson, size in enumerate(args.sizes_kb.split(","), 1):
+            results.append(run_size(app, save_dir, lesson, int(size), args.chunks, args.chunk_delay))
+    app.destroy()
+
+    if args.json:
+        print(json.dumps({"target_ms": program.UI_STALL_TARGET_MS, "runs": results}, indent=2))
+    else:
+        print(f"Frame stall target: {program.UI_STALL_TARGET_MS} ms")
+        for run in results:
+            print(f"{run['file_kb']:>6} KB: max frame {run['max_frame_ms']:7.2f} ms, {run['stalls']} stall(s), "
+                  f"full re-render {run['legacy_reload_ms']:7.2f} ms, display matches file: {run['display_matches_file']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+End-to-end benchmark suite: runs lesson generation, correction, JSON parsing, answer parsing and the
+app's generate/submit flows against an in-process stub Ollama server (stub_ollama.py), so results are
+reproducible without a GPU, and writes them as JSON for comparing commits.
+
+Usage: python benchmarks/run_benchmarks.py [--latency 0.05] [--tokens-per-second 400] [--malformed-rate 0.1]
+                                           [--repeat 5] [--only lesson_generation,...] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+import program  # noqa: E402
+from bench_lesson_parser import build_lesson  # noqa: E402
+from stub_ollama import EXERCISES, LESSON, StubOllamaServer  # noqa: E402
+
+# One right answer per locally graded type, one wrong "variant" answer and an essay, so both
+# the local grader and the model are exercised
+ANSWERS = ["suis", "allons", "true", "Ils est contents.", "Je suis fatigué.", "Samedi, je suis allé au marché avec mes amis."]
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        "n": len(ordered),
+        "mean_s": round(statistics.mean(ordered), 4),
+        "p50_s": round(ordered[len(ordered) // 2], 4),
+        "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "min_s": round(ordered[0], 4),
+    }
+
+
+def configure_program(server, save_dir):
+    """Points program at the stub server and a scratch save folder, with caching and debug output off."""
+    program.OLLAMA_API_URL = server.url
+    program.BASE_SAVE_DIR = save_dir
+    program.SAVE_DIR = os.path.join(save_dir, program.LANGUAGE, "daily-Classes")
+    program.PROGRESS_FILE = os.path.join(program.SAVE_DIR, "lesson_progress.json")
+    program.STATUS_INDEX_FILE = os.path.join(program.SAVE_DIR, "lesson_status.json")
+    program.LESSON_DB_FILE = os.path.join(program.SAVE_DIR, "lessons.db")
+    program.PREFETCH_DIR = os.path.join(program.SAVE_DIR, ".prefetch")
+    program.METRICS_FILE = os.path.join(program.SAVE_DIR, "metrics.jsonl")
+    program.PRINT_RAW_RESPONSES = False
+    program.completion_cache = program.CompletionCache(
+        cache_dir=os.path.join(save_dir, ".ollama_cache"), policy={"lesson": False, "overview": False, "correction": False}
+    )
+    program.model_router = program.ModelRouter() # Forget the installed models and latencies of earlier servers
+    program.generation_planner = program.GenerationPlanner(os.path.join(save_dir, ".generation_speed.json"))
+    program.LESSON_INDEX_ENABLED = False # The stub returns the same lesson every time, which the index would reject as a repeat
+    os.makedirs(program.SAVE_DIR, exist_ok=True)
+
+
+def json_stats_delta(before):
+    after = program.json_parse_stats.snapshot()
+    return {name: after[name] - before[name] for name in after}
+
+
+def bench_lesson_generation(server, args):
+    """Sequential generate_daily_exercises_ollama calls, including schema retries on malformed output."""
+    server.reset_counters()
+    before = program.json_parse_stats.snapshot()
+    timings, failures = [], 0
+    for i in range(args.repeat):
+        started = time.perf_counter()
+        try:
+            program.generate_daily_exercises_ollama("A1", i + 1)
+        except Exception:
+            failures += 1
+        timings.append(time.perf_counter() - started)
+    return {**summarize(timings), "failures": failures, "requests": len(server.requests), **json_stats_delta(before)}
+
+
+def bench_module_generation(server, args, save_dir):
+    """generate_module_async for a whole module, sequentially and with MODULE_GEN_CONCURRENCY workers."""
+    results = {}
+    for concurrency in sorted({1, program.MODULE_GEN_CONCURRENCY}):
+        server.reset_counters()
+        target = os.path.join(save_dir, f"module_c{concurrency}")
+        started = time.perf_counter()
+        result = asyncio.run(program.generate_module_async("A1", concurrency=concurrency, save_dir=target))
+        elapsed = time.perf_counter() - started
+        items = len(result["lessons"]) + (result["overview"] is not None)
+        results[f"concurrency_{concurrency}"] = {
+            "items": items,
+            "elapsed_s": round(elapsed, 4),
+            "items_per_s": round(items / elapsed, 2) if elapsed else None,
+            "max_in_flight": server.max_in_flight,
+        }
+    return results
+
+
+def bench_correction(server, args):
+    """get_correction_ollama in single and parallel mode, streamed, with time to first chunk."""
+    results = {}
+    for mode in ("single", "parallel"):
+        server.reset_counters()
+        timings, first_chunk = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            first = []
+
+            def on_chunk(text, first=first, started=started):
+                if not first:
+                    first.append(time.perf_counter() - started)
+
+            program.get_correction_ollama(LESSON, ANSWERS, on_chunk=on_chunk, mode=mode)
+            timings.append(time.perf_counter() - started)
+            first_chunk.append(first[0] if first else timings[-1])
+        results[mode] = {
+            **summarize(timings),
+            "first_chunk_p50_s": round(sorted(first_chunk)[len(first_chunk) // 2], 4),
+            "requests": len(server.requests),
+        }
+    return results
+
+
+def bench_model_routing(args, save_dir):
+    """
+    Checking one answer and a whole parallel-mode correction with every call on MODEL_NAME versus MODEL_ROUTES
+    sending answer checks to FAST_MODEL, on a stub where the small model is 4x faster; plus the fallback
+    when it isn't installed.
+    """
+    results = {}
+    routes = program.MODEL_ROUTES
+    cases = (
+        ("single_model", {}, {program.MODEL_NAME: 1.0}),
+        ("routed", routes, {program.MODEL_NAME: 1.0, program.FAST_MODEL: 4.0}),
+        ("fast_model_missing", routes, {program.MODEL_NAME: 1.0}),
+    )
+    try:
+        for name, model_routes, models in cases:
+            program.MODEL_ROUTES = model_routes
+            with StubOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second, models=models) as server:
+                configure_program(server, save_dir)
+                exercise = EXERCISES[3] # The sentence correction, whose answer the local grader can't accept
+                check_timings, timings = [], []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    program.correct_exercise_ollama(LESSON, 4, program.exercise_prompt_text(exercise), ANSWERS[3],
+                                                    route=program.exercise_route(exercise))
+                    check_timings.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    program.get_correction_ollama(LESSON, ANSWERS, mode="parallel")
+                    timings.append(time.perf_counter() - started)
+                models_used = {}
+                for path, payload in server.requests:
+                    if path in ("/v1/chat/completions", "/api/chat"):
+                        models_used[payload["model"]] = models_used.get(payload["model"], 0) + 1
+                results[name] = {"answer_check": summarize(check_timings), "parallel_correction": summarize(timings),
+                                 "requests_by_model": models_used, "latency": program.model_router.stats()}
+    finally:
+        program.MODEL_ROUTES = routes
+    return results
+
+
+def bench_parse_json(args):
+    """parse_ollama_json_response on clean, fenced and prose-wrapped responses."""
+    clean = json.dumps(LESSON, ensure_ascii=False)
+    inputs = {
+        "clean": clean,
+        "fenced": f"```json\n{clean}\n```",
+        "embedded": f"Here is your lesson for today:\n{clean}\nGood luck!",
+    }
+    results = {}
+    iterations = 200 * args.repeat
+    for name, text in inputs.items():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            program.parse_ollama_json_response(text)
+        elapsed = time.perf_counter() - started
+        results[name] = {"calls": iterations, "calls_per_s": round(iterations / elapsed, 1), "us_per_call": round(elapsed / iterations * 1e6, 2)}
+    return results
+
+
+def bench_read_answers(args, save_dir):
+    """read_answers_from_md on a large lesson file (see bench_lesson_parser.py for the detailed version)."""
+    filepath, text, _ = build_lesson(args.parser_exercises, args.answer_kb, os.path.join(save_dir, "parser"))
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        program.read_answers_from_md(filepath, args.parser_exercises)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {"exercises": args.parser_exercises, "file_mb": round(size_mb, 2), **summarize(timings), "mb_per_s": round(size_mb / best, 1) if best else None}
+
+
+class HeadlessApp:
+    """
+    Runs LanguageProfessorApp's worker tasks without a Tk window: the same methods, with _post_ui()
+    recording the UI callbacks instead of running them. Results are checked on disk.
+    """
+    _generate_lesson_task = program.LanguageProfessorApp._generate_lesson_task
+    _submit_answers_task = program.LanguageProfessorApp._submit_answers_task
+    _queue_stream_chunk = program.LanguageProfessorApp._queue_stream_chunk
+    _begin_stream_display = program.LanguageProfessorApp._begin_stream_display # Posted, never run
+    _end_stream_display = program.LanguageProfessorApp._end_stream_display
+    _finish_trace = program.LanguageProfessorApp._finish_trace # Posted, never run
+    _show_file = program.LanguageProfessorApp._show_file
+    _watch_current_lesson = program.LanguageProfessorApp._watch_current_lesson
+    _stop_watching = program.LanguageProfessorApp._stop_watching
+    _on_answers_saved = program.LanguageProfessorApp._on_answers_saved
+
+    def __init__(self):
+        self.progress = {"module": program.ORDERED_MODULES[0], "lesson": 1}
+        self.current_lesson_data = None
+        self.current_md_filepath = None
+        self._trace = None
+        self.prefetcher = program.LessonPrefetcher(prefetch_dir=program.PREFETCH_DIR)
+        self.status_index = program.LessonStatusIndex()
+        self._stream_lock = threading.Lock()
+        self._stream_pending = []
+        self._watcher = None
+        self._prewarmer = None
+        self.posted = []
+
+    def _post_ui(self, callback, key=None):
+        self.posted.append(callback)
+
+    def wait_for_prefetch(self, timeout=60):
+        with self.prefetcher._cond:
+            self.prefetcher._cond.wait_for(lambda: not self.prefetcher._in_flight, timeout=timeout)
+
+    def write_answers(self, answers):
+        """Fills in the answers the way the learner would in their editor."""
+        with open(self.current_md_filepath) as f:
+            text = f.read()
+        for i, answer in enumerate(answers):
+            text = program.parse_lesson_md(text).with_answer(i, answer)
+        with open(self.current_md_filepath, "w") as f:
+            f.write(text)
+
+
+def bench_app_flows(server, args, save_dir):
+    """Generate lesson -> answer -> submit through the app's own task methods, with and without a prefetched lesson."""
+    results = {}
+    saved_prefetch = program.PREFETCH_ENABLED
+    try:
+        for prefetch in (False, True):
+            program.PREFETCH_ENABLED = prefetch
+            generate_timings, submit_timings, failures = [], [], 0
+            server.reset_counters()
+            for i in range(args.repeat):
+                configure_program(server, os.path.join(save_dir, f"flow_{int(prefetch)}_{i}"))
+                app = HeadlessApp()
+                if prefetch:
+                    app.prefetcher.schedule(app.progress["module"], app.progress["lesson"], include_current=True)
+                    app.wait_for_prefetch() # The learner was busy elsewhere while it was generated
+
+                started = time.perf_counter()
+                app._generate_lesson_task()
+                generate_timings.append(time.perf_counter() - started)
+                if not app.current_md_filepath or not os.path.exists(app.current_md_filepath):
+                    failures += 1
+                    continue
+
+                app.write_answers(ANSWERS[:len(EXERCISES)])
+                started = time.perf_counter()
+                app._submit_answers_task()
+                submit_timings.append(time.perf_counter() - started)
+                if not app.status_index.status(app.progress["module"], app.progress["lesson"])["corrected"]:
+                    failures += 1
+                app.wait_for_prefetch() # Don't let this run's background work leak into the next one
+            results["prefetched" if prefetch else "cold"] = {
+                "generate_lesson": summarize(generate_timings),
+                "submit_answers": summarize(submit_timings) if submit_timings else None,
+                "failures": failures,
+                "requests": len(server.requests),
+            }
+    finally:
+        program.PREFETCH_ENABLED = saved_prefetch
+    return results
+
+
+def bench_watched_submit(server, args, save_dir):
+    """
+    Generate -> answer -> submit with per-exercise corrections, with and without WATCH_ANSWERS: the learner
+    saves the answers and presses "Check My Answers" args.switch_seconds later.
+    """
+    results = {}
+    saved = program.WATCH_ANSWERS, program.WATCH_DEBOUNCE_SECONDS, program.CORRECTION_MODE
+    program.WATCH_DEBOUNCE_SECONDS = 0.2
+    program.CORRECTION_MODE = "parallel"
+    try:
+        for watch in (False, True):
+            program.WATCH_ANSWERS = watch
+            timings, failures, requests = [], 0, 0
+            for i in range(args.repeat):
+                configure_program(server, os.path.join(save_dir, f"watch_{int(watch)}_{i}"))
+                app = HeadlessApp()
+                app._generate_lesson_task()
+                app.write_answers(ANSWERS[:len(EXERCISES)])
+                time.sleep(args.switch_seconds)
+                server.reset_counters()
+                started = time.perf_counter()
+                app._submit_answers_task()
+                timings.append(time.perf_counter() - started)
+                requests += len(server.requests)
+                if not app.status_index.status(app.progress["module"], app.progress["lesson"])["corrected"]:
+                    failures += 1
+                app._stop_watching()
+                app.prefetcher.close()
+            results["watched" if watch else "on_click"] = {
+                "submit_answers": summarize(timings),
+                "requests_after_click": requests,
+                "failures": failures,
+            }
+    finally:
+        program.WATCH_ANSWERS, program.WATCH_DEBOUNCE_SECONDS, program.CORRECTION_MODE = saved
+    return results
+
+
+BENCHMARKS = ("lesson_generation", "module_generation", "correction", "model_routing", "parse_json", "read_answers", "app_flows",
+              "watched_submit")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="Stub generation speed (0 = instant)")
+    parser.add_argument("--malformed-rate", type=float, default=0.1, help="Share of JSON responses the stub breaks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--parser-exercises", type=int, default=200)
+    parser.add_argument("--answer-kb", type=int, default=8)
+    parser.add_argument("--switch-seconds", type=float, default=2.0, help="Time between saving answers and submitting them")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="Write the results to this JSON file (default: print them)")
+    args = parser.parse_args(argv)
+    selected = [name.strip() for name in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as save_dir, \
+            StubOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second, malformed_rate=args.malformed_rate) as server:
+        configure_program(server, save_dir)
+        for name in selected:
+            print(f"Running {name}...", file=sys.stderr)
+            if name == "lesson_generation":
+                results[name] = bench_lesson_generation(server, args)
+            elif name == "module_generation":
+                results[name] = bench_module_generation(server, args, save_dir)
+            elif name == "correction":
+                results[name] = bench_correction(server, args)
+            elif name == "model_routing":
+                results[name] = bench_model_routing(args, save_dir)
+                configure_program(server, save_dir)
+            elif name == "parse_json":
+                results[name] = bench_parse_json(args)
+            elif name == "read_answers":
+                results[name] = bench_read_answers(args, save_dir)
+            elif name == "app_flows":
+                results[name] = bench_app_flows(server, args, save_dir)
+            elif name == "watched_submit":
+                results[name] = bench_watched_submit(server, args, save_dir)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stub": {"latency_s": args.latency, "tokens_per_second": args.tokens_per_second, "malformed_rate": args.malformed_rate},
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+In-process stub of the Ollama HTTP API for benchmarks, so the app can be measured without a real model.
+
+Implements the endpoints program.py uses:
+  POST /v1/chat/completions  (OpenAI-compatible, streamed as SSE or not)
+  POST /api/chat             (native; honours a JSON schema as 'format' by always returning valid JSON)
+  POST /api/generate         (model load / keep-alive requests)
+  POST /api/embed            (hashed bag-of-words vectors, so similar texts get similar embeddings)
+  GET  /api/tags
+
+Latency, token rate, malformed-JSON injection, the number of requests generated in parallel
+(like OLLAMA_NUM_PARALLEL; the rest queue), the installed models with their relative speed and the
+length of corrections (for a verbose model) are configurable, and native requests honour
+options.num_predict and options.num_ctx (cutting the answer off with done_reason "length"):
+
+    with StubOllamaServer(latency=0.2, tokens_per_second=50, malformed_rate=0.1) as server:
+        program.OLLAMA_API_URL = server.url
+"""
+import contextlib
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXERCISES = [
+    {"type": "fill_in_blank", "question": "Fill in the blank: Je ___ (être) étudiant.", "answer": "suis", "accepted_answers": []},
+    {"type": "multiple_choice", "question": "Choose the correct option: Nous ___ au cinéma.", "options": ["allons", "allez", "vont"], "answer": "allons", "accepted_answers": []},
+    {"type": "true_false", "question": "True or false: 'Elle a' is the present tense of 'avoir'.", "options": ["true", "false"], "answer": "true", "accepted_answers": []},
+    {"type": "sentence_correction", "question": "Correct the sentence: Ils est content.", "answer": "Ils sont contents.", "accepted_answers": []},
+    {"type": "short_answer", "question": "Translate: I am tired.", "answer": "Je suis fatigué.", "accepted_answers": ["Je suis fatiguée."]},
+    {"type": "essay", "question": "Write a short reflection (50 words): Describe your weekend using the passé composé."},
+]
+
+LESSON = {
+    "explanation_summary": "Today you will learn the present tense of être and avoir.",
+    "lesson_content": ("Être and avoir are the two most important verbs in French. " * 20).strip(),
+    "exercises": EXERCISES,
+}
+
+OVERVIEW = {
+    "module_title": "Welcome to the next module!",
+    "overview_text": "In this module, you will expand your skills. " * 5,
+    "topics_covered": ["Past tense", "Prepositions", "Comparatives", "Conjunctions", "Pronouns"],
+}
+
+CORRECTION = ("**Exercise 1:** Correct. Well done, the verb agrees with the subject. " * 12).strip()
+
+MALFORMED = [
+    '{"explanation_summary": ["this should have been a string"], "lesson_content": "x", "exercises": []}',
+    'Sure! Here is your lesson. ' * 12,
+    '{"explanation_summary": "Truncated lesson", "lesson_content": "The output stops in the middle',
+]
+
+
+class StubOllamaServer:
+    """A ThreadingHTTPServer on localhost pretending to be Ollama; use as a context manager or call start()/stop()."""
+
+    def __init__(self, latency=0.0, tokens_per_second=0.0, malformed_rate=0.0, seed=0, port=0, parallel=0, models=None,
+                 correction_tokens=None):
+        self.latency = latency # Seconds before the first token (prompt processing)
+        self.tokens_per_second = tokens_per_second # 0 means "infinitely fast"
+        self.malformed_rate = malformed_rate # Probability that a JSON request gets invalid output (not with a schema as 'format')
+        self._slots = threading.Semaphore(parallel) if parallel else None # 0 means unlimited
+        self.models = models or {"llama3.2:latest": 1.0} # Installed model -> speed relative to latency/tokens_per_second
+        self.correction_tokens = correction_tokens # Length of every correction in tokens; None means CORRECTION as is
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = [] # (path, payload) of every request
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = []
+            self.max_in_flight = 0
+
+    def _content_for(self, path, payload):
+        prompt = payload["messages"][0]["content"] if payload.get("messages") else ""
+        wants_json = bool(payload.get("response_format") or payload.get("format"))
+        if not wants_json:
+            if self.correction_tokens:
+                words = CORRECTION.split(" ")
+                return " ".join(words[i % len(words)] for i in range(self.correction_tokens))
+            return CORRECTION
+        if not isinstance(payload.get("format"), dict): # JSON mode alone doesn't keep a model to the schema
+            with self._lock:
+                malformed = self._random.random() < self.malformed_rate
+            if malformed:
+                with self._lock:
+                    return self._random.choice(MALFORMED)
+        return json.dumps(OVERVIEW if "overview for the" in prompt else LESSON, ensure_ascii=False)
+
+    def _tokens(self, content):
+        # Roughly one token per word, keeping the separators so the joined stream equals the content
+        tokens, current = [], ""
+        for ch in content:
+            current += ch
+            if ch == " ":
+                tokens.append(current)
+                current = ""
+        if current:
+            tokens.append(current)
+        return tokens
+
+    @staticmethod
+    def _embedding(text, dim=64):
+        vector = [0.0] * dim
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+        return vector
+
+    def _token_delay(self, speed=1.0):
+        return 1.0 / (self.tokens_per_second * speed) if self.tokens_per_second else 0.0
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": name} for name in stub.models]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests.append((self.path, payload))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    with stub._slots or contextlib.nullcontext():
+                        self._handle(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # The client cancelled the request
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _handle(self, payload):
+                model = payload.get("model") or ""
+                speed = stub.models.get(model if ":" in model else f"{model}:latest")
+                if speed is None:
+                    self._send_json({"error": f"model '{model}' not found"}, status=404)
+                    return
+                if self.path == "/api/embed":
+                    inputs = payload.get("input")
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self._send_json({"model": model, "embeddings": [stub._embedding(text) for text in inputs]})
+                    return
+                if self.path == "/api/generate":
+                    self._send_json({"model": payload.get("model"), "done": True, "done_reason": "load", "response": ""})
+                    return
+                if self.path not in ("/v1/chat/completions", "/api/chat"):
+                    self._send_json({"error": "not found"}, status=404)
+                    return
+
+                content = stub._content_for(self.path, payload)
+                tokens = stub._tokens(content)
+                prompt_tokens = len(stub._tokens(payload["messages"][0]["content"]))
+                time.sleep(stub.latency / speed)
+                native = self.path == "/api/chat"
+                streamed = payload.get("stream", native) # The native API streams by default
+                options = (payload.get("options") or {}) if native else {}
+                limit = options.get("num_predict", -1)
+                limit = len(tokens) if limit is None or limit < 0 else limit # Negative means unlimited, as in Ollama
+                if options.get("num_ctx"):
+                    limit = min(limit, max(0, options["num_ctx"] - prompt_tokens)) # The answer has to fit after the prompt
+                done_reason = "stop"
+                if len(tokens) > limit:
+                    tokens, done_reason = tokens[:limit], "length"
+                    content = "".join(tokens)
+                prompt_eval_duration = int(stub.latency / speed * 1e9)
+
+                if not streamed:
+                    time.sleep(stub._token_delay(speed) * len(tokens))
+                    eval_duration = int(stub._token_delay(speed) * len(tokens) * 1e9)
+                    if native:
+                        self._send_json({"message": {"role": "assistant", "content": content}, "done": True, "done_reason": done_reason,
+                                         "prompt_eval_count": prompt_tokens, "prompt_eval_duration": prompt_eval_duration,
+                                         "eval_count": len(tokens), "eval_duration": eval_duration})
+                    else:
+                        self._send_json({"choices": [{"message": {"role": "assistant", "content": content}}],
+                                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson" if native else "text/event-stream")
+                self.end_headers()
+                started = time.monotonic()
+                for token in tokens:
+                    if native:
+                        line = json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+                    else:
+                        line = f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n"
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(stub._token_delay(speed))
+                eval_duration = int((time.monotonic() - started) * 1e9)
+                if native:
+                    self.wfile.write((json.dumps({"message": {"role": "assistant", "content": ""}, "done": True, "done_reason": done_reason,
+                                                  "prompt_eval_count": prompt_tokens, "prompt_eval_duration": prompt_eval_duration,
+                                                  "eval_count": len(tokens), "eval_duration": eval_duration}) + "\n").encode("utf-8"))
+                else:
+                    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}
+                    self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True # No Content-Length, so the stream ends with the connection
+
+        return Handler
@@ -2,14 +2,40 @@ import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
 import os
 import json
-import requests
+import socket
 import threading
+import concurrent.futures
+import contextlib
+import contextvars
+import queue
+import select
+import ctypes # For inotify, used to notice saved answers (WATCH_ANSWERS)
+import time
+import atexit # Writes the measured generation speeds on the way out
+import hashlib
+import zlib
+import sqlite3
 import re # For parsing answers from MD file and robust JSON extraction
+import unicodedata # For accent-insensitive answer matching
+import string
 import subprocess # For opening file explorer
+import argparse # For the headless command line mode
+import sys
+
+# Imported on first use, so the window can open before they have loaded (see load_http_stack()/load_numpy())
+requests = None
+urllib3 = None # Installed with requests; its connection classes are extended for cancellation
+np = None # NumPy is optional: only the lesson topic index (LESSON_INDEX_ENABLED) needs it
 
 # --- Configuration ---
 LANGUAGE = "French"
 OLLAMA_API_URL = "http://localhost:11434"
+# Several Ollama nodes serving the same models, e.g. ["http://gpu1:11434", "http://gpu2:11434"].
+# Requests go to the least busy (and fastest) healthy node and fail over when one is down; empty means OLLAMA_API_URL only
+OLLAMA_ENDPOINTS = []
+ENDPOINT_RETRY_SECONDS = 30 # How long a node that refused a connection or timed out is skipped
+ENDPOINT_HEALTH_CHECK_SECONDS = 15 # How often every node is probed (only with more than one node; 0 disables)
+ENDPOINT_LATENCY_ALPHA = 0.3 # Weight of the newest sample in each node's moving-average latency
 MODEL_NAME = "llama3.2:latest" # Ensure this model is available in your Ollama instance
 
 # IMPORTANT: Adjust this path to where you want to save your lessons
@@ -22,11 +48,161 @@ ORDERED_MODULES = ["A1", "A2", "B1", "B2", "C1", "C2"]
 MAX_LESSONS_PER_MODULE = 5 # Define how many lessons are in each module before advancing
 
 PROGRESS_FILE = os.path.join(SAVE_DIR, "lesson_progress.json")
+STATUS_INDEX_FILE = os.path.join(SAVE_DIR, "lesson_status.json") # Cached generated/answered/corrected state per lesson
+
+# Where progress, lessons, answers and corrections are kept:
+# "files" - lesson_progress.json plus a .json and .md file per lesson
+# "sqlite" - a single SQLite database; the .md files are still written as the view you answer in (e.g. in Obsidian)
+LESSON_STORE = "files"
+LESSON_DB_FILE = os.path.join(SAVE_DIR, "lessons.db")
+
+# Per-call-type read timeouts (seconds); for streamed calls they apply between chunks
+OLLAMA_TIMEOUTS = {
+    "lesson": 90,
+    "overview": 90,
+    "correction": 120, # Increased timeout for detailed corrections
+    "embed": 60,
+    "warmup": 300, # Loading a large model from disk can take minutes on slow machines
+}
+OLLAMA_CONNECT_TIMEOUT = 10
+
+# Latency budgets: how long one call of each type should take (seconds). From the speed measured on this machine,
+# each request gets a num_predict that fits what is left of the budget after reading the prompt and a num_ctx that
+# fits prompt and answer; a prompt that doesn't fit has its lesson text shortened. Types without a budget use the
+# model's defaults. OLLAMA_TIMEOUTS still apply; a call that times out is retried once with a smaller budget.
+# Lessons and overviews are JSON, which is useless cut off, so their answers are never capped: for them the budget
+# only sizes num_ctx and the quoted lesson text, and an answer that fills num_ctx is retried with a larger one.
+LATENCY_BUDGETS = {"lesson": 30, "overview": 30, "correction": 45}
+MIN_PREDICT_TOKENS = {"lesson": 1024, "overview": 512, "correction": 200} # Answers are never capped below this
+DEFAULT_TOKENS_PER_SECOND = 15 # Assumed generation speed until one has been measured
+DEFAULT_PROMPT_TOKENS_PER_SECOND = 150 # Assumed prompt processing speed until one has been measured
+DEFAULT_CHARS_PER_TOKEN = 3.5
+GENERATION_SPEED_ALPHA = 0.2 # Weight of the newest measurement in the per-model moving averages
+GENERATION_SPEED_FILE = os.path.join(BASE_SAVE_DIR, ".generation_speed.json") # Measured speeds, kept across sessions
+GENERATION_SPEED_SAVE_SECONDS = 60 # New measurements are written at most this often, and when the program exits
+MIN_CONTEXT_TOKENS = 2048
+MAX_CONTEXT_TOKENS = 8192 # num_ctx never grows past this; longer prompts are trimmed
+MIN_QUOTED_LESSON_CHARS = 1500 # Lesson text a budgeted prompt keeps however slow the model; the call runs over budget instead
+TRUNCATED_CORRECTION_NOTE = "*(This correction was cut off at its length limit; raise LATENCY_BUDGETS[\"correction\"] for longer ones.)*"
+TIMEOUT_RETRY_SCALE = 0.5 # A timed-out call is retried with this share of its budget
+OLLAMA_MAX_RETRIES = 3 # Retries on connection errors and OLLAMA_RETRY_STATUSES (e.g. the server is busy or still loading the model)
+OLLAMA_RETRY_STATUSES = (429, 503)
+OLLAMA_BACKOFF_SECONDS = 0.5 # Waits 0.5s, 1s, 2s, ... between retries unless the server sends Retry-After
+
+# Keep the model loaded for the whole study session, so no lesson or correction pays the model load time
+OLLAMA_KEEP_ALIVE = "30m" # How long Ollama keeps the model in memory after a request (Ollama's own default is 5m)
+WARMUP_ON_STARTUP = True # Load the model in the background as soon as the app starts
+KEEP_ALIVE_PING_MINUTES = 10 # While the app is open, refresh the keep-alive this often (0 disables)
+UNLOAD_MODEL_ON_EXIT = False # Free the model's memory when the app is closed
+
+MODULE_GEN_CONCURRENCY = 4 # Max parallel Ollama requests when building a whole module; match OLLAMA_NUM_PARALLEL on the server
+
+STREAM_JSON_GENERATION = True # Validate lessons/overviews while they stream and abort clearly invalid output early
+JSON_MAX_PREAMBLE_CHARS = 200 # Non-JSON text allowed before the opening '{' (e.g. a ```json fence)
+
+PRINT_RAW_RESPONSES = True # Print raw Ollama JSON responses to the console for debugging
+
+# "single": one request with the whole lesson and every answer
+# "parallel": one small request per exercise, sent concurrently, plus a short summary request
+CORRECTION_MODE = "single"
+CORRECTION_CONCURRENCY = 4 # Max parallel per-exercise requests; match OLLAMA_NUM_PARALLEL on the server
+CORRECTION_CONTEXT_CHARS = 600 # How much of the lesson content each per-exercise request gets
+OPEN_ENDED_KEYWORDS = ("essay", "reflection", "paragraph", "write a", "describe", "composition")
+
+# Structured exercises carry an answer key and are checked locally when possible:
+# these types are graded locally when the answer matches the key or clearly picks another option;
+# for the "variant" types only a match is accepted locally. Anything else still goes to the model,
+# since it may be another valid phrasing
+LOCAL_GRADED_EXERCISE_TYPES = ("fill_in_blank", "multiple_choice", "true_false")
+LOCAL_MATCH_EXERCISE_TYPES = ("sentence_correction", "short_answer")
+# How true/false options and answers are written in the supported languages (compared without accents)
+TRUE_WORDS = ("true", "yes", "vrai", "oui", "verdadero", "cierto", "si", "wahr", "richtig", "ja", "vero",
+              "verdadeiro", "sim", "waar", "juist", "prawda", "tak", "sant", "riktig", "rigtig", "dogru", "evet")
+FALSE_WORDS = ("false", "no", "faux", "non", "falso", "falsch", "nein", "nao", "onwaar", "niet", "nee",
+               "falsz", "nie", "falskt", "usant", "falsk", "nej", "yanlis", "hayir")
+
+# Per-task model routing: a route is a call type ("lesson", "overview", "correction") or, for correcting exercises,
+# "correction:<exercise type>" (falling back to "correction"). Each route lists candidate models in order of preference;
+# candidates the server doesn't have (per /api/tags) are skipped and MODEL_NAME is always the last resort.
+FAST_MODEL = "llama3.2:1b" # Small model for quick right/wrong checks; 'ollama pull' it to use it
+MODEL_ROUTES = {
+    **{f"correction:{ex_type}": [FAST_MODEL] for ex_type in LOCAL_GRADED_EXERCISE_TYPES + LOCAL_MATCH_EXERCISE_TYPES},
+}
+# Seconds per call a route's preferred model may average before a later (faster) candidate is used instead
+MODEL_ROUTE_BUDGETS = {}
+MODEL_LATENCY_ALPHA = 0.3 # Weight of the newest sample in each model's moving-average latency
+MODEL_LATENCY_MAX_AGE = 600 # Latency older than this (seconds) is forgotten, so a passed-over model gets tried again
+MODEL_TAGS_REFRESH_SECONDS = 300 # How often the list of installed models is fetched from /api/tags
+
+# Embeddings of past lessons (needs NumPy), so new lessons don't repeat a topic that was already covered
+LESSON_INDEX_ENABLED = True
+EMBED_MODEL = "nomic-embed-text" # Ollama embedding model; without it, a hashed bag-of-words embedding is used
+LESSON_INDEX_DIM = 512 # Size of the hashed embedding
+LESSON_DUPLICATE_THRESHOLD = 0.92 # Cosine similarity to an earlier lesson above which a new lesson counts as a repeat
+HASHED_DUPLICATE_THRESHOLD = 0.75 # The same for the hashed embedding, whose similarities run lower
+LESSON_DUPLICATE_RETRIES = 1 # How often a repeated lesson is regenerated before it is accepted anyway
+COVERED_TOPICS_IN_PROMPT = 8 # At most this many earlier lesson topics are listed in the lesson prompt
+
+STREAM_CORRECTIONS = True # Show corrections token-by-token in the lesson display as they are generated
+UI_POLL_MS = 50 # How often the Tk loop applies the updates posted by worker threads (and buffered streamed text)
+UI_STALL_TARGET_MS = 50 # A Tk frame spent on UI updates longer than this is counted as a stall in the metrics
+SHUTDOWN_TIMEOUT_SECONDS = 5 # On closing the window, how long to wait for cancelled work to stop
+
+# Watch the current lesson file and start correcting answers in the background as soon as they are saved,
+# so "Check My Answers" only has to wait for what is still running. Uses per-exercise corrections.
+WATCH_ANSWERS = False
+WATCH_DEBOUNCE_SECONDS = 1.5 # The file's mtime and size must stay unchanged this long before answers are read
+WATCH_POLL_SECONDS = 1.0 # How often the file is checked where inotify isn't available
+
+# Background prefetching of upcoming lessons/module overviews while the learner works on the current one
+PREFETCH_ENABLED = True
+PREFETCH_LOOKAHEAD = 1 # How many lessons ahead of the current one to generate in the background
+PREFETCH_MAX_ITEMS = 10 # Upper bound on prefetched lessons/overviews kept on disk
+PREFETCH_DIR = os.path.join(SAVE_DIR, ".prefetch") # Hidden folder, so prefetched lessons don't show up in Obsidian
+
+# On-disk cache of parsed Ollama responses, keyed on (model, prompt, options)
+CACHE_DIR = os.path.join(BASE_SAVE_DIR, ".ollama_cache") # Shared by every language/learner on this machine
+CACHE_MAX_BYTES = 50 * 1024 * 1024 # Least recently used entries are evicted above this size
+CACHE_MAX_AGE_DAYS = 30 # Entries older than this are treated as misses and removed
+CACHE_POLICY = { # Which call types are cached; corrections depend on the student's answers, so they aren't by default
+    "lesson": False,
+    "overview": True,
+    "correction": False,
+}
+
+# Phase timings per operation (prompt build, connect, first token, generation, JSON parse, file writes, UI update)
+METRICS_ENABLED = True # Append one JSON line per operation to METRICS_FILE
+METRICS_FILE = os.path.join(SAVE_DIR, "metrics.jsonl")
+METRICS_MAX_BYTES = 1024 * 1024 # Rotated to metrics.jsonl.1, .2, ... above this size
+METRICS_BACKUP_COUNT = 3
+METRICS_IN_STATUS_BAR = True # Show a compact timing readout in the status bar after each operation
+
+# Service mode ('python program.py serve'): one Ollama machine serving a whole class over HTTP
+SERVICE_HOST = "127.0.0.1" # Use "0.0.0.0" to accept learners from other machines
+SERVICE_PORT = 8765
+SERVICE_LEARNERS_DIR = os.path.join(BASE_SAVE_DIR, "learners") # One progress file and lesson tree per learner below this
+SERVICE_WORKERS = MODULE_GEN_CONCURRENCY # Model calls running at once; match OLLAMA_NUM_PARALLEL (times the number of nodes)
+SERVICE_MAX_QUEUE = 32 # Model calls allowed to wait for a worker; more are refused with 503 and Retry-After
+SERVICE_READ_TIMEOUT = 30 # Seconds a client has to send its request
+SERVICE_MAX_BODY_BYTES = 1024 * 1024
 
 # --- Helper Functions ---
 
+def write_json_atomic(path, data):
+    """Writes JSON to a temporary file and renames it over `path`, so a crash never leaves a half-written file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 def load_progress():
-    """Loads the current lesson progress from a JSON file."""
+    """Loads the current lesson progress from a JSON file (or the lesson database)."""
+    store = get_lesson_store()
+    if store is not None:
+        return store.load_progress()
     if not os.path.exists(PROGRESS_FILE):
         progress = {"module": ORDERED_MODULES[0], "lesson": 1}
         save_progress(progress)
@@ -35,10 +211,12 @@ def load_progress():
         return json.load(f)
 
 def save_progress(progress):
-    """Saves the current lesson progress to a JSON file."""
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    with open(PROGRESS_FILE, "w") as f:
-        json.dump(progress, f, indent=2)
+    """Saves the current lesson progress to a JSON file (or the lesson database)."""
+    store = get_lesson_store()
+    if store is not None:
+        store.save_progress(progress)
+        return
+    write_json_atomic(PROGRESS_FILE, progress)
 
 def parse_ollama_json_response(content):
     """
@@ -73,67 +251,1607 @@ def parse_ollama_json_response(content):
     # If still no valid JSON, raise an error
     raise ValueError(f"No valid JSON found in Ollama response:\n{content}")
 
-def generate_daily_exercises_ollama(module, lesson):
+EXERCISE_SCHEMA = {
+    "type": "object",
+    "required": ["question"],
+    # Models often write null for the fields that don't apply, e.g. the answer of an essay
+    "properties": {
+        "type": {"type": ["string", "null"]},
+        "question": {"type": "string"},
+        "options": {"type": ["array", "null"], "items": {"type": "string"}},
+        "answer": {"type": ["string", "boolean", "number", "null"]},
+        "accepted_answers": {"type": ["array", "null"], "items": {"type": "string"}},
+    },
+}
+LESSON_SCHEMA = {
+    "type": "object",
+    "required": ["explanation_summary", "lesson_content", "exercises"],
+    "properties": {
+        "explanation_summary": {"type": "string"},
+        "lesson_content": {"type": "string"},
+        # Plain question strings are still accepted, as in lessons from older versions
+        "exercises": {"type": "array", "minItems": 1, "items": {"anyOf": [EXERCISE_SCHEMA, {"type": "string"}]}},
+    },
+}
+OVERVIEW_SCHEMA = {
+    "type": "object",
+    "required": ["module_title", "overview_text", "topics_covered"],
+    "properties": {
+        "module_title": {"type": "string"},
+        "overview_text": {"type": "string"},
+        "topics_covered": {"type": "array", "minItems": 1, "items": {"type": "string"}},
+    },
+}
+
+def _schema_types(schema):
+    """The set of JSON types a (subset-of-JSON-Schema) schema allows; empty means anything."""
+    if schema is None:
+        return set()
+    if "anyOf" in schema:
+        types = set()
+        for option in schema["anyOf"]:
+            option_types = _schema_types(option)
+            if not option_types:
+                return set()
+            types |= option_types
+        return types
+    types = schema.get("type", [])
+    types = {types} if isinstance(types, str) else set(types)
+    if "number" in types:
+        types.add("integer")
+    return types
+
+def _schema_for_type(schema, json_type):
+    """Picks the anyOf branch of `schema` that matches json_type."""
+    if schema is None or "anyOf" not in schema:
+        return schema
+    for option in schema["anyOf"]:
+        if json_type in _schema_types(option):
+            return option
+    return None
+
+def validate_json_schema(value, schema, path="$"):
+    """Checks value against the schema subset used here (type, anyOf, required, properties, items, minItems); raises ValueError."""
+    if "anyOf" in schema:
+        errors = []
+        for option in schema["anyOf"]:
+            try:
+                return validate_json_schema(value, option, path)
+            except ValueError as e:
+                errors.append(str(e))
+        raise ValueError(f"{path} matches none of the allowed forms: {'; '.join(errors)}")
+    type_names = {dict: "object", list: "array", str: "string", bool: "boolean", type(None): "null", int: "integer", float: "number"}
+    allowed = _schema_types(schema)
+    actual = type_names.get(type(value))
+    if allowed and actual not in allowed:
+        raise ValueError(f"{path} should be {' or '.join(sorted(allowed))}, got {actual}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise ValueError(f"{path} is missing '{key}'")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                validate_json_schema(value[key], sub_schema, f"{path}.{key}")
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            raise ValueError(f"{path} needs at least {schema['minItems']} item(s)")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                validate_json_schema(item, schema["items"], f"{path}[{i}]")
+    return value
+
+class IncrementalJSONValidator:
+    """
+    Follows a JSON object as it streams in, one character at a time, and raises StreamAborted as soon
+    as the output is clearly unusable: no '{' within JSON_MAX_PREAMBLE_CHARS, broken structure, or a
+    property whose value starts with the wrong type for the schema (e.g. 'exercises' as a string).
+    Text after the closing '}' is ignored, like parse_ollama_json_response does.
+    """
+
+    _VALUE_TYPES = {"\"": "string", "{": "object", "[": "array", "t": "boolean", "f": "boolean", "n": "null"}
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.stack = [] # Open containers: [kind, expecting, schema, current key]
+        self.preamble_chars = 0
+        self.in_string = False
+        self.escape = False
+        self.in_scalar = False
+        self.key_chars = None # Characters of the object key being read, if any
+        self.done = False
+
+    def feed(self, text):
+        for ch in text:
+            if self.done:
+                return
+            self._feed_char(ch)
+
+    def _fail(self, reason):
+        raise StreamAborted(f"Invalid JSON output: {reason}")
+
+    def _feed_char(self, ch):
+        if not self.stack:
+            if ch == "{":
+                self.stack.append(["{", "key", self.schema, None])
+            elif not ch.isspace():
+                self.preamble_chars += 1
+                if self.preamble_chars > JSON_MAX_PREAMBLE_CHARS:
+                    self._fail("no JSON object found at the start of the response")
+            return
+
+        frame = self.stack[-1]
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                if self.key_chars is not None:
+                    frame[3] = "".join(self.key_chars)
+                    self.key_chars = None
+                    frame[1] = "colon"
+                else:
+                    frame[1] = "comma"
+                return
+            if self.key_chars is not None:
+                self.key_chars.append(ch)
+            return
+
+        if self.in_scalar:
+            if ch not in ",}]" and not ch.isspace():
+                return
+            self.in_scalar = False
+            frame[1] = "comma"
+
+        if ch.isspace():
+            return
+        kind, expecting, schema, key = frame
+        if kind == "{":
+            if expecting == "key" and ch == '"':
+                self.in_string = True
+                self.key_chars = []
+            elif expecting in ("key", "comma") and ch == "}":
+                self._close()
+            elif expecting == "colon" and ch == ":":
+                frame[1] = "value"
+            elif expecting == "value":
+                properties = (schema or {}).get("properties", {})
+                self._start_value(ch, properties.get(key), key)
+            elif expecting == "comma" and ch == ",":
+                frame[1] = "key"
+            else:
+                self._fail(f"unexpected '{ch}' in an object")
+        else:
+            if expecting == "value" and ch == "]":
+                self._close()
+            elif expecting == "value":
+                self._start_value(ch, (schema or {}).get("items"), f"{key}[]" if key else "item")
+            elif expecting == "comma" and ch == ",":
+                frame[1] = "value"
+            elif expecting == "comma" and ch == "]":
+                self._close()
+            else:
+                self._fail(f"unexpected '{ch}' in an array")
+
+    def _start_value(self, ch, schema, name):
+        json_type = self._VALUE_TYPES.get(ch)
+        if json_type is None:
+            if ch == "-" or ch.isdigit():
+                json_type = "number"
+            else:
+                self._fail(f"unexpected '{ch}' where a value should start")
+        allowed = _schema_types(schema)
+        if allowed and json_type not in allowed:
+            self._fail(f"'{name}' should be {' or '.join(sorted(allowed))}, got {json_type}")
+        if json_type == "object":
+            self.stack.append(["{", "key", _schema_for_type(schema, "object"), None])
+        elif json_type == "array":
+            self.stack.append(["[", "value", _schema_for_type(schema, "array"), name])
+        elif json_type == "string":
+            self.in_string = True
+        else:
+            self.in_scalar = True
+
+    def _close(self):
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1][1] = "comma"
+        else:
+            self.done = True
+
+class JSONParseStats:
+    """Thread-safe counters for structured (JSON) generation: failures, early aborts, cut-off answers, schema retries and wasted tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"parse_failures": 0, "early_aborts": 0, "truncated": 0, "schema_retries": 0, "wasted_tokens": 0}
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+json_parse_stats = JSONParseStats()
+
+class CompletionCache:
+    """
+    Content-addressed on-disk cache for parsed Ollama responses.
+    Entries are JSON files named after the SHA-256 of (model, prompt, options); a hit refreshes
+    the file's mtime, which is what the size-based LRU eviction goes by.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS, policy=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self.policy = CACHE_POLICY if policy is None else policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, prompt, options=None):
+        raw = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, call_type, model, prompt, options=None):
+        """Returns the cached value, or None on a miss or when call_type isn't cached."""
+        if not self.policy.get(call_type, False):
+            return None
+        path = self._path(self.make_key(model, prompt, options))
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._count(False)
+            return None
+        if time.time() - entry.get("created", 0) > self.max_age:
+            self._remove(path)
+            self._count(False)
+            return None
+        try:
+            os.utime(path) # Mark as recently used
+        except OSError:
+            pass
+        self._count(True)
+        return entry.get("value")
+
+    def put(self, call_type, model, prompt, value, options=None):
+        """Stores a value if call_type is cached, then evicts entries to stay within the limits."""
+        if not self.policy.get(call_type, False):
+            return
+        path = self._path(self.make_key(model, prompt, options))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": time.time(), "call_type": call_type, "model": model, "value": value}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+
+    def _evict(self):
+        """Drops expired entries, then the least recently used ones until the cache fits in max_bytes."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if now - st.st_mtime > self.max_age:
+                    self._remove(path) # Not used for longer than the maximum age, so it must have expired
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+completion_cache = CompletionCache()
+
+# The OperationTrace collecting phase timings in the current thread, if any (see OperationTrace.activate)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_metrics_lock = threading.Lock()
+
+class OperationTrace:
+    """
+    Phase timings of one operation (generating a lesson, correcting answers, ...).
+    While it is activated, the code it calls records phases into it through record_phase()/phase_span():
+    prompt_build, connect (until the response headers arrive), ttft (first token of the first model call),
+    generation, json_parse, file_write and tk_update, plus the token counts Ollama reports per call
+    and the longest Tk frame its UI updates took.
+    finish() appends the result as one line to the metrics file.
+    """
+
+    def __init__(self, operation, metrics_file=None, **fields):
+        self.operation = operation
+        self.metrics_file = metrics_file # None means METRICS_FILE
+        self.fields = fields
+        self.phases = {}
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._rate_tokens = 0 # Tokens whose decode time is known
+        self._rate_seconds = 0.0
+        self.models = set() # Models the calls went to
+        self.max_frame_s = 0.0 # Longest Tk frame spent on this operation's UI updates
+        self.stalls = 0 # Frames longer than UI_STALL_TARGET_MS
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes this the trace that record_phase()/phase_span() and the Ollama client record into."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def add(self, phase, seconds, first_only=False):
+        with self._lock:
+            if first_only and phase in self.phases:
+                return
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_frame(self, seconds):
+        """Records one Tk frame spent on UI updates."""
+        with self._lock:
+            self.max_frame_s = max(self.max_frame_s, seconds)
+            if seconds * 1000 > UI_STALL_TARGET_MS:
+                self.stalls += 1
+
+    def add_call(self, prompt_tokens=None, completion_tokens=None, decode_s=None, model=None):
+        """Counts one model call with the token counts it reported and the time spent producing them."""
+        with self._lock:
+            self.calls += 1
+            if model:
+                self.models.add(model)
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            if completion_tokens and decode_s:
+                self._rate_tokens += completion_tokens
+                self._rate_seconds += decode_s
+
+    def finish(self, error=None):
+        """Closes the trace, appends it to the metrics file (if METRICS_ENABLED) and returns the record."""
+        total = time.perf_counter() - self.started
+        with self._lock:
+            record = {
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "operation": self.operation,
+                **self.fields,
+                "model": ", ".join(sorted(self.models)) or MODEL_NAME,
+                "total_s": round(total, 4),
+                "phases": {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "tokens_per_s": round(self._rate_tokens / self._rate_seconds, 1) if self._rate_seconds > 0 else None,
+            }
+            if self.max_frame_s:
+                record["ui_max_frame_ms"] = round(self.max_frame_s * 1000, 1)
+                record["ui_stalls"] = self.stalls
+        if error is not None:
+            record["error"] = str(error)
+        if METRICS_ENABLED:
+            append_metrics(record, self.metrics_file)
+        return record
+
+def current_trace():
+    return _current_trace.get()
+
+def record_phase(phase, seconds, first_only=False):
+    """Adds `seconds` to a phase of the active trace; does nothing outside of one."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds, first_only)
+
+@contextlib.contextmanager
+def phase_span(phase):
+    """Times the enclosed block as `phase` of the active trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+def append_metrics(record, path=None):
+    """Appends a record to the JSONL metrics file, rotating it to .1, .2, ... above METRICS_MAX_BYTES."""
+    path = path or METRICS_FILE
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _metrics_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) + len(line) > METRICS_MAX_BYTES:
+                for i in range(METRICS_BACKUP_COUNT - 1, 0, -1):
+                    if os.path.exists(f"{path}.{i}"):
+                        os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+                os.replace(path, f"{path}.1")
+            with open(path, "a") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}") # Metrics must never break a lesson
+
+def format_metrics_summary(record):
+    """One-line readout of a trace record for the status bar, e.g. 'model 4.2s (first token 0.8s) · 35 tok/s · UI 12ms'."""
+    phases = record["phases"]
+    parts = []
+    if "generation" in phases:
+        model = f"model {phases['generation']:.1f}s"
+        if "ttft" in phases:
+            model += f" (first token {phases['ttft']:.1f}s)"
+        parts.append(model)
+    if record.get("tokens_per_s"):
+        parts.append(f"{record['tokens_per_s']:.0f} tok/s")
+    for phase, label in (("json_parse", "parse"), ("file_write", "write"), ("tk_update", "UI")):
+        if phase in phases:
+            parts.append(f"{label} {phases[phase] * 1000:.0f}ms")
+    parts.append(f"total {record['total_s']:.1f}s")
+    return " · ".join(parts)
+
+class OllamaError(Exception):
+    """
+    Raised when an Ollama request fails. Carries the call type, the kind of failure
+    ('connection', 'timeout', 'http' or 'response'), the HTTP status if any and the number of attempts.
+    """
+
+    def __init__(self, message, call_type=None, kind="http", status_code=None, attempts=1):
+        super().__init__(message)
+        self.call_type = call_type
+        self.kind = kind
+        self.status_code = status_code
+        self.attempts = attempts
+
+    def to_dict(self):
+        return {
+            "message": str(self),
+            "call_type": self.call_type,
+            "kind": self.kind,
+            "status_code": self.status_code,
+            "attempts": self.attempts,
+        }
+
+class OllamaConnectionError(OllamaError, ConnectionError):
+    """Ollama could not be reached (refused, reset or connect timeout), even after retrying."""
+
+class StreamAborted(ValueError):
+    """Raised from an on_chunk callback to stop a streamed response; closing it frees the server slot."""
+
+class OperationCancelled(Exception):
+    """Raised in a worker whose operation was cancelled, e.g. with the Cancel button."""
+
+# The CancelToken of the operation running in the current thread, if any (see CancelToken.activate)
+_current_cancel_token = contextvars.ContextVar("current_cancel_token", default=None)
+
+class CancelToken:
+    """
+    Lets another thread cancel an operation's Ollama requests. While the token is activated, the socket of
+    each request the client sends is registered with it; cancel() shuts those sockets down, so a request
+    waiting for the model fails right away and Ollama sees the client leave and stops generating.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets = {} # Thread id -> socket of the request it is waiting on
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    @contextlib.contextmanager
+    def activate(self):
+        token = _current_cancel_token.set(self)
+        try:
+            yield self
+        finally:
+            _current_cancel_token.reset(token)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            sockets = list(self._sockets.values())
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass # Already closed
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("Cancelled.")
+
+    def wait(self, seconds):
+        """Sleeps for up to `seconds`, returning early (True) if the token is cancelled."""
+        return self._event.wait(seconds)
+
+    def attach(self, sock):
+        with self._lock:
+            self._sockets[threading.get_ident()] = sock
+        if self.cancelled:
+            self.cancel() # Cancelled while the request was being sent
+
+    def detach(self):
+        with self._lock:
+            self._sockets.pop(threading.get_ident(), None)
+
+def current_cancel_token():
+    return _current_cancel_token.get()
+
+def raise_if_cancelled():
+    """Raises OperationCancelled if the active CancelToken has been cancelled."""
+    token = _current_cancel_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+class _CancellableConnectionMixin:
+    def request(self, *args, **kwargs):
+        token = _current_cancel_token.get()
+        if token is not None:
+            token.raise_if_cancelled()
+        result = super().request(*args, **kwargs)
+        if token is not None and self.sock is not None:
+            # The socket, not the connection: a response that ends with the connection takes over the socket
+            token.attach(self.sock)
+        return result
+
+CancellableHTTPAdapter = None # Defined by load_http_stack()
+_http_stack_lock = threading.Lock()
+
+def load_http_stack():
+    """
+    Imports requests and urllib3 and defines CancellableHTTPAdapter, an HTTPAdapter whose connections register
+    with the active CancelToken when they send a request. Done on first use rather than at import time,
+    since requests and its dependencies take longer to import than the rest of the program.
+    """
+    global requests, urllib3, CancellableHTTPAdapter
+    with _http_stack_lock:
+        if CancellableHTTPAdapter is not None:
+            return
+        import requests as requests_module
+        import urllib3 as urllib3_module
+
+        class _CancellableHTTPConnection(_CancellableConnectionMixin, urllib3_module.connection.HTTPConnection):
+            pass
+
+        class _CancellableHTTPSConnection(_CancellableConnectionMixin, urllib3_module.connection.HTTPSConnection):
+            pass
+
+        class _CancellableHTTPConnectionPool(urllib3_module.connectionpool.HTTPConnectionPool):
+            ConnectionCls = _CancellableHTTPConnection
+
+        class _CancellableHTTPSConnectionPool(urllib3_module.connectionpool.HTTPSConnectionPool):
+            ConnectionCls = _CancellableHTTPSConnection
+
+        class _CancellableHTTPAdapter(requests_module.adapters.HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": _CancellableHTTPConnectionPool,
+                                                           "https": _CancellableHTTPSConnectionPool}
+
+        requests, urllib3 = requests_module, urllib3_module
+        CancellableHTTPAdapter = _CancellableHTTPAdapter
+
+def load_numpy():
+    """Imports NumPy on first use; returns it, or None if it isn't installed."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+class OllamaEndpoint:
+    """Routing state of one Ollama node in an EndpointPool."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0 # Requests sent and not yet fully received
+        self.latency = None # Moving average of the time to the response headers (s)
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0 # time.monotonic() until which the node is skipped
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "healthy": self.down_until <= time.monotonic(),
+            "outstanding": self.outstanding,
+            "latency_s": round(self.latency, 4) if self.latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+class EndpointPool:
+    """
+    Spreads requests over several Ollama nodes serving the same models.
+    Each request goes to the healthy node with the lowest (outstanding requests + 1) x latency score,
+    so busy nodes and slow nodes get less work. A node that refuses connections or times out is
+    skipped for ENDPOINT_RETRY_SECONDS; with more than one node, a background thread also probes
+    every node's /api/tags each ENDPOINT_HEALTH_CHECK_SECONDS.
+    """
+
+    def __init__(self, urls, retry_seconds=None, health_check_seconds=None):
+        self.endpoints = [OllamaEndpoint(url) for url in dict.fromkeys(url.rstrip("/") for url in urls)]
+        self.retry_seconds = ENDPOINT_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self.health_check_seconds = ENDPOINT_HEALTH_CHECK_SECONDS if health_check_seconds is None else health_check_seconds
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        if len(self.endpoints) > 1 and self.health_check_seconds:
+            threading.Thread(target=self._health_loop, daemon=True).start()
+
+    @property
+    def urls(self):
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def close(self):
+        self._closed.set()
+
+    def acquire(self, exclude=(), only=None):
+        """
+        Picks the endpoint for a request and counts it as outstanding until release().
+        Returns None if every endpoint is in `exclude`; `only` forces a specific URL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if (e.url == only if only else e.url not in exclude)]
+            if not candidates:
+                return None
+            # If every node looks down, try one anyway rather than failing without asking
+            healthy = [e for e in candidates if e.down_until <= now] or candidates
+            known = [e.latency for e in healthy if e.latency is not None]
+            default = min(known) if known else 1.0 # Unmeasured nodes are assumed fast so that they get tried
+            endpoint = min(healthy, key=lambda e: ((e.outstanding + 1) * (e.latency if e.latency is not None else default), e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, failed=False):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.down_until = time.monotonic() + self.retry_seconds
+
+    def record_latency(self, endpoint, seconds):
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = seconds
+            else:
+                endpoint.latency += ENDPOINT_LATENCY_ALPHA * (seconds - endpoint.latency)
+            endpoint.down_until = 0.0
+
+    def check_health(self, timeout=2):
+        """Probes every node's /api/tags and marks unreachable ones as down; returns stats()."""
+        load_http_stack()
+        for endpoint in self.endpoints:
+            try:
+                requests.get(f"{endpoint.url}/api/tags", timeout=timeout).raise_for_status()
+                healthy = True
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self._lock:
+                if healthy:
+                    endpoint.down_until = 0.0
+                else:
+                    endpoint.down_until = time.monotonic() + self.retry_seconds
+        return self.stats()
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_check_seconds):
+            self.check_health()
+
+    def has_other(self, exclude):
+        """True if a healthy endpoint outside `exclude` is left to fail over to."""
+        now = time.monotonic()
+        with self._lock:
+            return any(e.url not in exclude and e.down_until <= now for e in self.endpoints)
+
+    def stats(self):
+        with self._lock:
+            return [endpoint.to_dict() for endpoint in self.endpoints]
+
+def configured_endpoints():
+    """The Ollama base URLs to use: OLLAMA_ENDPOINTS, or just OLLAMA_API_URL."""
+    return [url.rstrip("/") for url in (OLLAMA_ENDPOINTS or [OLLAMA_API_URL])]
+
+def _is_read_timeout(error):
+    """True for a read timeout, which requests reports as a ConnectionError when it happens while a streamed body is read."""
+    return isinstance(error, requests.exceptions.Timeout) or any(
+        isinstance(arg, urllib3.exceptions.ReadTimeoutError) for arg in error.args)
+
+class OllamaClient:
+    """
+    The single HTTP client used for every Ollama call.
+    Owns a pooled keep-alive requests.Session and an EndpointPool, and retries transient failures
+    (connection errors and OLLAMA_RETRY_STATUSES) with exponential backoff; with several endpoints
+    a failed request moves on to another node right away.
+    """
+
+    def __init__(self, base_url=None, model=None, timeouts=None, max_retries=OLLAMA_MAX_RETRIES,
+                 backoff_seconds=OLLAMA_BACKOFF_SECONDS, pool_size=max(10, MODULE_GEN_CONCURRENCY), endpoints=None):
+        load_http_stack()
+        self.pool = EndpointPool(endpoints or ([base_url] if base_url else configured_endpoints()))
+        self.base_url = self.pool.urls[0]
+        self.model = model # None means "use MODEL_NAME at call time"
+        self.timeouts = OLLAMA_TIMEOUTS if timeouts is None else timeouts
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.session = requests.Session()
+        adapter = CancellableHTTPAdapter(pool_connections=max(pool_size, len(self.pool.endpoints)), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.pool.close()
+        self.session.close()
+
+    def _backoff(self, attempt, response=None):
+        delay = self.backoff_seconds * (2 ** attempt)
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+        token = current_cancel_token()
+        if token is None:
+            time.sleep(delay)
+        elif token.wait(delay):
+            token.raise_if_cancelled()
+
+    def _send(self, endpoint, path, payload, stream, timeout):
+        """One POST to one endpoint; a failure caused by cancelling the active CancelToken raises OperationCancelled."""
+        try:
+            return self.session.post(f"{endpoint.url}{path}", json=payload, stream=stream, timeout=timeout)
+        except (requests.exceptions.RequestException, OperationCancelled):
+            token = current_cancel_token()
+            if token is not None and token.cancelled:
+                self.pool.release(endpoint) # Not the node's fault
+                raise OperationCancelled("Cancelled.")
+            raise
+
+    def _post(self, call_type, path, payload, stream=False, endpoint_url=None):
+        """
+        POSTs with retries and returns (response, endpoint) for a 2xx status, or raises OllamaError.
+        The endpoint stays counted as busy until it is released; use _request() to have that done.
+        A node that fails is excluded for the rest of the request while another one is available;
+        `endpoint_url` pins the request to one node.
+        """
+        timeout = (OLLAMA_CONNECT_TIMEOUT, self.timeouts.get(call_type, 120))
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            raise_if_cancelled()
+            last_attempt = attempt == self.max_retries
+            endpoint = self.pool.acquire(exclude=tried, only=endpoint_url)
+            if endpoint is None: # Every node failed once; start over after backing off
+                tried.clear()
+                endpoint = self.pool.acquire()
+            tried.add(endpoint.url)
+            can_fail_over = endpoint_url is None and self.pool.has_other(tried)
+            started = time.perf_counter()
+            try:
+                response = self._send(endpoint, path, payload, stream, timeout)
+            except requests.exceptions.ReadTimeout:
+                self.pool.release(endpoint, failed=True)
+                # The server accepted the request but is generating too slowly; retrying there would only wait again
+                if can_fail_over and not last_attempt:
+                    continue
+                raise OllamaError(f"Ollama did not respond within {timeout[1]}s ({call_type}).",
+                                  call_type=call_type, kind="timeout", attempts=attempt + 1)
+            except requests.exceptions.ConnectionError:
+                self.pool.release(endpoint, failed=True)
+                if last_attempt:
+                    raise OllamaConnectionError(f"Could not connect to Ollama at {', '.join(sorted(tried))}. Is Ollama running?",
+                                                call_type=call_type, kind="connection", attempts=attempt + 1)
+                if not can_fail_over:
+                    self._backoff(attempt)
+                continue
+            except requests.exceptions.RequestException as e:
+                self.pool.release(endpoint)
+                raise OllamaError(f"Ollama API request failed: {e}", call_type=call_type, attempts=attempt + 1)
+
+            if response.status_code in OLLAMA_RETRY_STATUSES and not last_attempt:
+                response.close()
+                self.pool.release(endpoint)
+                if not can_fail_over:
+                    self._backoff(attempt, response)
+                continue
+            if response.status_code >= 400:
+                detail = response.text[:500]
+                response.close()
+                self.pool.release(endpoint)
+                raise OllamaError(f"Ollama API request failed: HTTP {response.status_code} {detail}",
+                                  call_type=call_type, kind="http", status_code=response.status_code, attempts=attempt + 1)
+            self.pool.record_latency(endpoint, time.perf_counter() - started)
+            return response, endpoint
+
+    @contextlib.contextmanager
+    def _request(self, call_type, path, payload, stream=False, endpoint_url=None, model_fallback=True):
+        """
+        _post() as a context manager: closes the response and releases its endpoint once the body has been read.
+        With model_fallback, a request for a model the server doesn't have is sent again with MODEL_NAME.
+        """
+        token = current_cancel_token()
+        try:
+            try:
+                response, endpoint = self._post(call_type, path, payload, stream=stream, endpoint_url=endpoint_url)
+            except OllamaError as e:
+                if not model_fallback or e.status_code != 404 or payload.get("model") in (None, MODEL_NAME):
+                    raise
+                # The routed model isn't installed there after all; fall back to the default one
+                model_router.mark_missing(payload["model"])
+                payload["model"] = MODEL_NAME
+                response, endpoint = self._post(call_type, path, payload, stream=stream, endpoint_url=endpoint_url)
+        except BaseException:
+            if token is not None:
+                token.detach()
+            raise
+        failed = False
+        try:
+            yield response
+        except OllamaError as e:
+            failed = e.kind in ("connection", "timeout") # The node dropped the stream
+            raise
+        finally:
+            response.close()
+            self.pool.release(endpoint, failed=failed)
+            if token is not None:
+                token.detach() # The connection goes back to the pool; cancelling must no longer touch it
+
+    def chat(self, call_type, prompt, response_format=None, on_chunk=None, model=None, options=None, usage=None):
+        """
+        Sends a single-message chat completion and returns the message content.
+        With on_chunk, the completion is streamed and on_chunk(text) is called for every piece.
+        `model` (usually from model_router.select()) overrides the client's model. With `options`
+        (e.g. from GenerationPlanner.plan()), the request goes to the native /api/chat endpoint,
+        since the OpenAI-compatible one can't set num_ctx. A `usage` dict is updated with the token
+        counts and why the model stopped (see stopped_at_length()).
+        """
+        payload = {
+            "model": model or self.model or MODEL_NAME,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if options:
+            path, stream_lines = "/api/chat", iter_ollama_native_stream
+            payload["stream"] = on_chunk is not None
+            payload["options"] = options
+            if response_format is not None:
+                payload["format"] = "json"
+            if OLLAMA_KEEP_ALIVE:
+                payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+        else:
+            path, stream_lines = "/v1/chat/completions", iter_ollama_stream
+            if response_format is not None:
+                payload["response_format"] = response_format
+            if on_chunk is not None:
+                payload["stream"] = True
+                payload["stream_options"] = {"include_usage": True} # Token counts arrive in a final event
+
+        started = time.perf_counter()
+        first_token_at = None
+        usage = {} if usage is None else usage
+        succeeded = False
+        with self._request(call_type, path, payload, stream=on_chunk is not None) as response:
+            headers_at = time.perf_counter()
+            try:
+                if on_chunk is not None:
+                    pieces = []
+                    for piece in stream_lines(response, usage):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        pieces.append(piece)
+                        on_chunk(piece)
+                    raise_if_cancelled() # A cancelled stream can also just end early
+                    succeeded = True
+                    return "".join(pieces)
+                data = response.json()
+                if options:
+                    usage.update(data)
+                    content = data["message"]["content"]
+                else:
+                    usage.update(data.get("usage") or {}, finish_reason=data["choices"][0].get("finish_reason"))
+                    content = data["choices"][0]["message"]["content"]
+                succeeded = True
+                return content
+            except StreamAborted:
+                raise # The connection is closed on the way out, which makes Ollama stop generating
+            except requests.exceptions.RequestException as e:
+                raise_if_cancelled()
+                # Retrying isn't possible once part of a stream has been shown
+                if _is_read_timeout(e):
+                    raise OllamaError(f"Ollama stopped sending for {self.timeouts.get(call_type, 120)}s ({call_type}).",
+                                      call_type=call_type, kind="timeout")
+                raise OllamaError(f"Ollama connection dropped while receiving the response: {e}",
+                                  call_type=call_type, kind="connection")
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                raise_if_cancelled()
+                raise OllamaError(f"Unexpected response from Ollama: {e}", call_type=call_type, kind="response")
+            finally:
+                self._record_call(started, headers_at, first_token_at, usage, payload["model"], succeeded, len(prompt))
+
+    def chat_native(self, call_type, prompt, format=None, options=None, model=None, usage=None):
+        """
+        Sends a single-message, non-streamed request to Ollama's native /api/chat endpoint, which
+        (unlike the OpenAI-compatible one) accepts a JSON schema as `format` to constrain the output.
+        A `usage` dict is updated with the response's token counts and done_reason, as in chat().
+        """
+        payload = {
+            "model": model or self.model or MODEL_NAME,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": False,
+        }
+        if format is not None:
+            payload["format"] = format
+        if options:
+            payload["options"] = options
+        if OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+
+        started = time.perf_counter()
+        data = {}
+        succeeded = False
+        with self._request(call_type, "/api/chat", payload) as response:
+            headers_at = time.perf_counter()
+            try:
+                data = response.json()
+                content = data["message"]["content"]
+                if usage is not None:
+                    usage.update(data)
+                succeeded = True
+                return content
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                raise_if_cancelled()
+                raise OllamaError(f"Unexpected response from Ollama: {e}", call_type=call_type, kind="response")
+            finally:
+                self._record_call(started, headers_at, None, data if isinstance(data, dict) else {}, payload["model"], succeeded,
+                                  len(prompt))
+
+    @staticmethod
+    def _record_call(started, headers_at, first_token_at, usage, model, succeeded, prompt_chars=None):
+        """
+        Feeds a completed request's duration to the model router and its speed to the generation planner,
+        and adds its timings and token counts to the active trace, if any. `usage` is either the OpenAI-style
+        usage object or a native response with eval_count/eval_duration.
+        """
+        finished = time.perf_counter()
+        completion_tokens = usage.get("completion_tokens", usage.get("eval_count"))
+        prompt_tokens = usage.get("prompt_tokens", usage.get("prompt_eval_count"))
+        if usage.get("eval_duration"):
+            decode_s = usage["eval_duration"] / 1e9 # Nanoseconds, measured by the server
+        else:
+            decode_s = finished - (first_token_at or started)
+        if succeeded:
+            model_router.record(model, finished - started)
+            # Without the server's timings, only a streamed call separates generating from reading the prompt
+            generation_planner.record(model, completion_tokens, decode_s if usage.get("eval_duration") or first_token_at else None,
+                                      prompt_tokens, (usage.get("prompt_eval_duration") or 0) / 1e9, prompt_chars)
+        trace = current_trace()
+        if trace is None:
+            return
+        trace.add("connect", headers_at - started)
+        trace.add("ttft", (first_token_at or finished) - started, first_only=True)
+        trace.add("generation", finished - started)
+        trace.add_call(prompt_tokens, completion_tokens, decode_s, model=model)
+
+    def embed(self, texts, model=None):
+        """Embeds each text with Ollama's /api/embed (default EMBED_MODEL) and returns the vectors as lists of floats."""
+        payload = {"model": model or EMBED_MODEL, "input": list(texts)}
+        if OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+        with self._request("embed", "/api/embed", payload, model_fallback=False) as response:
+            try:
+                embeddings = response.json()["embeddings"]
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                raise_if_cancelled()
+                raise OllamaError(f"Unexpected response from Ollama: {e}", call_type="embed", kind="response")
+        if len(embeddings) != len(payload["input"]):
+            raise OllamaError(f"Ollama returned {len(embeddings)} embeddings for {len(payload['input'])} texts",
+                              call_type="embed", kind="response")
+        return embeddings
+
+    def list_models(self):
+        """Names of the models installed on the server, from /api/tags (asked of one healthy node)."""
+        endpoint = self.pool.acquire()
+        failed = False
+        try:
+            response = self.session.get(f"{endpoint.url}/api/tags", timeout=(OLLAMA_CONNECT_TIMEOUT, 10))
+            response.raise_for_status()
+            return [model["name"] for model in response.json().get("models", [])]
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+            failed = isinstance(e, requests.exceptions.ConnectionError)
+            raise OllamaError(f"Could not list the installed models: {e}", call_type="tags", kind="connection" if failed else "response")
+        finally:
+            self.pool.release(endpoint, failed=failed)
+
+    def load_model(self, keep_alive=None):
+        """
+        Loads the model without generating anything (an /api/generate request with no prompt) and keeps it
+        resident for `keep_alive` (default OLLAMA_KEEP_ALIVE). Returns the seconds it took; a model that is
+        already loaded answers almost immediately, so this doubles as a readiness probe.
+        With several endpoints, the model is loaded on all of them in parallel; this only fails if none succeeds.
+        """
+        started = time.monotonic()
+        model = self.model or MODEL_NAME
+        payload = {"model": model, "keep_alive": keep_alive if keep_alive is not None else OLLAMA_KEEP_ALIVE}
+        num_ctx = generation_planner.context_size(model)
+        if num_ctx:
+            payload["options"] = {"num_ctx": num_ctx} # Loaded with the context size the budgeted requests will ask for
+        self._on_every_endpoint("/api/generate", payload)
+        return time.monotonic() - started
+
+    def unload_model(self):
+        """Asks Ollama to free the model's memory right away (on every endpoint)."""
+        self._on_every_endpoint("/api/generate", {"model": self.model or MODEL_NAME, "keep_alive": 0})
+
+    def _on_every_endpoint(self, path, payload):
+        errors = []
+
+        def send(url):
+            try:
+                with self._request("warmup", path, payload, endpoint_url=url):
+                    pass
+            except OllamaError as e:
+                errors.append(e)
+
+        urls = self.pool.urls
+        if len(urls) == 1:
+            send(urls[0])
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                list(executor.map(send, urls))
+        if len(errors) == len(urls):
+            raise errors[0]
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+def get_ollama_client():
+    """Returns the shared OllamaClient, creating it on first use."""
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None or _ollama_client.pool.urls != list(dict.fromkeys(configured_endpoints())):
+            if _ollama_client is not None:
+                _ollama_client.pool.close() # Stops its health checks; requests still running on it can finish
+            _ollama_client = OllamaClient()
+        return _ollama_client
+
+def _model_key(name):
+    """Ollama treats a model name without a tag as ':latest'."""
+    return name if ":" in name else f"{name}:latest"
+
+class ModelRouter:
+    """
+    Chooses the model for each request from MODEL_ROUTES. Candidates the server doesn't have (per /api/tags,
+    refreshed every MODEL_TAGS_REFRESH_SECONDS, or a 404 for the model) are skipped, with MODEL_NAME as the
+    last resort. A moving-average latency is kept per model: when a route has a MODEL_ROUTE_BUDGETS entry,
+    a candidate averaging more than that is passed over for the next one within budget (or not measured yet).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._installed = None # Installed models (as _model_key), or None while unknown
+        self._checked_at = None
+        self._missing = set() # Models the server answered 404 for since the last check
+        self._latency = {} # Model -> {"latency": moving average seconds per call, "calls": n, "at": time of the last sample}
+
+    @staticmethod
+    def _route_keys(route):
+        return [route, route.split(":", 1)[0]] if ":" in route else [route]
+
+    def candidates(self, route):
+        """The models configured for a route, in order of preference, ending with MODEL_NAME."""
+        for key in self._route_keys(route):
+            if key in MODEL_ROUTES:
+                return list(dict.fromkeys(list(MODEL_ROUTES[key]) + [MODEL_NAME]))
+        return [MODEL_NAME]
+
+    def installed(self):
+        """The installed models, or None if the server couldn't be asked."""
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < MODEL_TAGS_REFRESH_SECONDS:
+                return self._installed
+            self._checked_at = time.monotonic() # Also on failure, so an unreachable server isn't asked on every call
+        try:
+            names = {_model_key(name) for name in get_ollama_client().list_models()}
+        except OllamaError as e:
+            print(f"Model routing: {e}")
+            names = None
+        with self._lock:
+            self._installed = names
+            self._missing.clear()
+        return names
+
+    def mark_missing(self, model):
+        with self._lock:
+            self._missing.add(_model_key(model))
+
+    def _recent_latency(self, model, now):
+        stats = self._latency.get(model)
+        if stats is None or now - stats["at"] > MODEL_LATENCY_MAX_AGE:
+            return None
+        return stats["latency"]
+
+    def select(self, route):
+        """The model to send a request on `route` to."""
+        candidates = self.candidates(route)
+        if len(candidates) == 1:
+            return candidates[0]
+        installed = self.installed()
+        budget = next((MODEL_ROUTE_BUDGETS[key] for key in self._route_keys(route) if key in MODEL_ROUTE_BUDGETS), None)
+        with self._lock:
+            available = [model for model in candidates if _model_key(model) not in self._missing
+                         and (installed is None or _model_key(model) in installed)] or [MODEL_NAME]
+            if not budget:
+                return available[0]
+            now = time.monotonic()
+            for model in available:
+                latency = self._recent_latency(model, now)
+                if latency is None or latency <= budget:
+                    return model
+            return min(available, key=lambda model: self._recent_latency(model, now))
+
+    def record(self, model, seconds):
+        """Adds the duration of a completed call to the model's moving average."""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._latency.get(model)
+            if stats is None or now - stats["at"] > MODEL_LATENCY_MAX_AGE:
+                self._latency[model] = {"latency": seconds, "calls": 1, "at": now}
+            else:
+                stats["latency"] += MODEL_LATENCY_ALPHA * (seconds - stats["latency"])
+                stats["calls"] += 1
+                stats["at"] = now
+
+    def stats(self):
+        with self._lock:
+            return {model: {"latency_s": round(stats["latency"], 3), "calls": stats["calls"]}
+                    for model, stats in self._latency.items()}
+
+model_router = ModelRouter()
+
+class GenerationPlanner:
+    """
+    Turns LATENCY_BUDGETS into the options of each request. Per model it keeps moving averages of the
+    generation speed, the prompt processing speed and the characters per prompt token, measured from what
+    Ollama reports, and saves them to GENERATION_SPEED_FILE so the next session starts out calibrated; changes
+    are written at most every GENERATION_SPEED_SAVE_SECONDS and by flush(), which runs at exit.
+    num_ctx only ever grows (up to MAX_CONTEXT_TOKENS): Ollama reloads the model whenever it changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path # None means GENERATION_SPEED_FILE
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock() # Keeps an older snapshot from being written over a newer one
+        self._models = None # Model -> measurements; loaded on first use
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _stats(self, model):
+        """The measurements of a model (call with the lock held)."""
+        if self._models is None:
+            try:
+                with open(self.path or GENERATION_SPEED_FILE) as f:
+                    self._models = json.load(f)
+            except (OSError, ValueError):
+                self._models = {}
+        return self._models.setdefault(model, {})
+
+    def _save(self):
+        """Notes that the measurements changed and writes them if the last write is GENERATION_SPEED_SAVE_SECONDS old."""
+        with self._lock:
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= GENERATION_SPEED_SAVE_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes the measurements if they changed since the last write."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.loads(json.dumps(self._models))
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            try:
+                write_json_atomic(self.path or GENERATION_SPEED_FILE, data)
+            except OSError as e:
+                print(f"Could not save generation speeds: {e}")
+
+    @staticmethod
+    def _average(stats, name, value):
+        stats[name] = value if name not in stats else stats[name] + GENERATION_SPEED_ALPHA * (value - stats[name])
+
+    def record(self, model, completion_tokens, decode_s, prompt_tokens=None, prompt_s=None, prompt_chars=None):
+        """Adds one completed call's measurements; None stands for not measured."""
+        with self._lock:
+            stats = self._stats(model)
+            if completion_tokens and decode_s and completion_tokens >= 16: # A handful of tokens says little about speed
+                self._average(stats, "tokens_per_s", completion_tokens / decode_s)
+            if prompt_tokens and prompt_s:
+                self._average(stats, "prompt_tokens_per_s", prompt_tokens / prompt_s)
+            if prompt_tokens and prompt_chars and 1.5 <= prompt_chars / prompt_tokens <= 8: # Skips prompts Ollama had cached
+                self._average(stats, "chars_per_token", prompt_chars / prompt_tokens)
+            stats["calls"] = stats.get("calls", 0) + 1
+        self._save()
+
+    def record_timeout(self, model, num_predict, seconds):
+        """A call asking for up to num_predict tokens timed out after `seconds`: the model is slower than assumed."""
+        with self._lock:
+            stats = self._stats(model)
+            stats["tokens_per_s"] = min(stats.get("tokens_per_s", DEFAULT_TOKENS_PER_SECOND), num_predict / seconds) * 0.75
+        self._save()
+
+    def widen_context(self, model, num_ctx):
+        """Doubles num_ctx for a call whose answer filled it (up to MAX_CONTEXT_TOKENS) and keeps it for later calls."""
+        with self._lock:
+            stats = self._stats(model)
+            wider = min(MAX_CONTEXT_TOKENS, max(num_ctx * 2, stats.get("num_ctx", 0)))
+            grown = wider != stats.get("num_ctx")
+            stats["num_ctx"] = wider
+        if grown:
+            self._save()
+        return wider
+
+    def context_size(self, model):
+        """The num_ctx budgeted requests to this model use, or None before the first one."""
+        if not LATENCY_BUDGETS:
+            return None
+        with self._lock:
+            return self._stats(model).get("num_ctx")
+
+    def plan(self, call_type, model, prompt_chars, scale=1.0, min_prompt_chars=None):
+        """
+        Options for a call_type request with a prompt of prompt_chars characters, scaled to `scale` of its budget.
+        Returns (options, max_prompt_chars): options is None without a budget; max_prompt_chars is how much of the
+        prompt fits, or None if all of it does. The prompt is never planned shorter than min_prompt_chars
+        (default: all of it); num_ctx is sized for the prompt as planned plus num_predict.
+        """
+        budget = LATENCY_BUDGETS.get(call_type)
+        if not budget:
+            return None, None
+        budget = min(budget, OLLAMA_TIMEOUTS.get(call_type, budget)) # A call that isn't streamed must also beat its timeout
+        with self._lock:
+            stats = self._stats(model)
+            tokens_per_s = stats.get("tokens_per_s", DEFAULT_TOKENS_PER_SECOND)
+            prompt_tokens_per_s = stats.get("prompt_tokens_per_s", DEFAULT_PROMPT_TOKENS_PER_SECOND)
+            chars_per_token = stats.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+            min_predict = MIN_PREDICT_TOKENS.get(call_type, 128)
+
+            prompt_tokens = int(prompt_chars / chars_per_token) + 1
+            min_prompt_tokens = prompt_tokens if min_prompt_chars is None else min(prompt_tokens, int(min_prompt_chars / chars_per_token) + 1)
+            seconds = budget * scale
+            num_predict = int((seconds - prompt_tokens / prompt_tokens_per_s) * tokens_per_s)
+            fitted_tokens = prompt_tokens
+            if num_predict < min_predict:
+                # Reading the prompt would take up the budget: shorten it so the shortest useful answer still fits,
+                # but not below min_prompt_tokens; past that the call runs over its budget
+                num_predict = min_predict
+                fitted_tokens = max(min_prompt_tokens, min(prompt_tokens, int((seconds - min_predict / tokens_per_s) * prompt_tokens_per_s)))
+            if fitted_tokens + num_predict > MAX_CONTEXT_TOKENS:
+                num_predict = max(min_predict, MAX_CONTEXT_TOKENS - fitted_tokens)
+                fitted_tokens = max(min_prompt_tokens, min(fitted_tokens, MAX_CONTEXT_TOKENS - num_predict))
+            needed = fitted_tokens + num_predict
+            num_ctx = min(MAX_CONTEXT_TOKENS, max(MIN_CONTEXT_TOKENS, stats.get("num_ctx", 0), -(-needed // 1024) * 1024))
+            grown = num_ctx != stats.get("num_ctx")
+            stats["num_ctx"] = num_ctx
+        if grown:
+            self._save()
+        max_prompt_chars = int(fitted_tokens * chars_per_token) if fitted_tokens < prompt_tokens else None
+        return {"num_predict": num_predict, "num_ctx": num_ctx}, max_prompt_chars
+
+    def stats(self):
+        with self._lock:
+            if self._models is None:
+                return {}
+            return {model: {name: round(value, 2) if isinstance(value, float) else value for name, value in stats.items()}
+                    for model, stats in self._models.items()}
+
+generation_planner = GenerationPlanner()
+atexit.register(lambda: generation_planner.flush()) # Whichever planner is current by then
+
+def trim_text(text, max_chars):
+    """Shortens text to at most max_chars, cutting at a paragraph or sentence end where possible."""
+    if len(text) <= max_chars:
+        return text
+    marker = " [...]"
+    cut = text[:max(0, max_chars - len(marker))]
+    for end in ("\n\n", ". ", "\n"):
+        position = cut.rfind(end)
+        if position >= len(cut) * 0.7:
+            cut = cut[:position + 1]
+            break
+    return cut.rstrip() + marker if cut.strip() else ""
+
+def budgeted_prompt(call_type, model, build_prompt, context="", scale=1.0):
+    """
+    Builds a prompt with build_prompt(context) and plans its options (see GenerationPlanner.plan()).
+    If the prompt doesn't fit the budget, `context` - the lesson text it quotes - is shortened to make it fit,
+    keeping at least MIN_QUOTED_LESSON_CHARS of it. Returns (prompt, options).
+    """
+    prompt = build_prompt(context)
+    min_chars = len(prompt) - len(context) + min(len(context), MIN_QUOTED_LESSON_CHARS)
+    options, max_chars = generation_planner.plan(call_type, model, len(prompt), scale, min_prompt_chars=min_chars)
+    if max_chars is not None and context:
+        context = trim_text(context, max(MIN_QUOTED_LESSON_CHARS, len(context) - (len(prompt) - max_chars)))
+        prompt = build_prompt(context)
+        # Planned again for the prompt as it is now, which can't get any shorter, so num_ctx holds all of it
+        options, _ = generation_planner.plan(call_type, model, len(prompt), scale)
+    return prompt, options
+
+def run_budgeted(call_type, model, build_prompt, send, context=""):
+    """
+    Calls send(prompt, options) with a prompt and options fitted to call_type's latency budget. If the call
+    times out, it is retried once with TIMEOUT_RETRY_SCALE of the budget (and, if needed, less lesson text)
+    instead of failing.
+    """
+    prompt, options = budgeted_prompt(call_type, model, build_prompt, context)
+    started = time.perf_counter()
+    try:
+        return send(prompt, options)
+    except OllamaError as e:
+        if e.kind != "timeout" or options is None:
+            raise
+        print(f"{e} Retrying with a shorter answer.")
+        generation_planner.record_timeout(model, options["num_predict"], time.perf_counter() - started)
+    trace = current_trace()
+    if trace is not None:
+        trace.fields["timeout_retries"] = trace.fields.get("timeout_retries", 0) + 1
+    prompt, options = budgeted_prompt(call_type, model, build_prompt, context, scale=TIMEOUT_RETRY_SCALE)
+    return send(prompt, options)
+
+def iter_ollama_stream(response, usage=None):
+    """
+    Yields the content deltas of a streamed (SSE) Ollama chat completion.
+    Each event is a 'data: {...}' line; the stream ends with 'data: [DONE]'.
+    If a `usage` dict is given, it is updated with the token counts of the final usage event and the finish_reason.
+    """
+    response.encoding = "utf-8" # SSE responses often don't declare a charset
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            event = json.loads(payload)
+        except json.JSONDecodeError:
+            continue # Skip keep-alive or partial lines
+        if usage is not None and event.get("usage"):
+            usage.update(event["usage"])
+        choices = event.get("choices") or []
+        if usage is not None and choices and choices[0].get("finish_reason"):
+            usage["finish_reason"] = choices[0]["finish_reason"]
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+def iter_ollama_native_stream(response, usage=None):
+    """
+    Yields the content pieces of a streamed native (/api/chat) Ollama response: one JSON object per line,
+    the last one with "done": true and the token counts and timings, which update `usage` if given.
+    """
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if event.get("error"):
+            raise ValueError(event["error"])
+        content = (event.get("message") or {}).get("content")
+        if content:
+            yield content
+        if event.get("done"):
+            if usage is not None:
+                usage.update(event)
+            break
+
+def stopped_at_length(usage):
+    """Whether a response (its `usage` from OllamaClient.chat()) was cut off by num_predict or a full num_ctx."""
+    return "length" in (usage.get("done_reason"), usage.get("finish_reason"))
+
+def generate_json_ollama(call_type, prompt, schema, label="Response", model=None):
+    """
+    Requests a JSON object from Ollama and returns it parsed and validated against `schema`.
+    The response is streamed through an IncrementalJSONValidator so that clearly invalid output is
+    cancelled after a few tokens instead of after the full generation; an aborted or unparsable
+    attempt is retried once through the native API with the schema as `format`, which constrains
+    the model to valid output. The call is kept within call_type's latency budget (see run_budgeted), except that
+    the answer isn't capped; one that was cut off by a full num_ctx is retried with twice the context.
+    """
+    client = get_ollama_client()
+    model_name = model or client.model or MODEL_NAME
+
+    def send(prompt, options):
+        if options:
+            options = dict(options, num_predict=-1) # Unlimited: a cut-off JSON object can't be used
+        usage = {}
+        if STREAM_JSON_GENERATION:
+            validator = IncrementalJSONValidator(schema)
+            received = []
+
+            def on_chunk(piece):
+                received.append(piece)
+                validator.feed(piece)
+
+            try:
+                content = client.chat(call_type, prompt, response_format={"type": "json"}, on_chunk=on_chunk, model=model,
+                                      options=options, usage=usage)
+            except StreamAborted as e:
+                json_parse_stats.add("early_aborts")
+                json_parse_stats.add("wasted_tokens", len(received))
+                print(f"{label}: {e}. Stopped after {len(received)} tokens; retrying with a JSON schema.")
+                content = None
+        else:
+            received = None
+            content = client.chat(call_type, prompt, response_format={"type": "json"}, model=model, options=options, usage=usage)
+
+        if content is not None:
+            if PRINT_RAW_RESPONSES:
+                print(f"--- Raw Ollama {label} Content (for debugging) ---\n{content}\n--- End Raw Content ---")
+            try:
+                with phase_span("json_parse"):
+                    return validate_json_schema(parse_ollama_json_response(content), schema)
+            except ValueError as e:
+                json_parse_stats.add("parse_failures")
+                json_parse_stats.add("wasted_tokens", len(received) if received is not None else len(content) // 4)
+                print(f"{label}: {e}\nRetrying with a JSON schema.")
+                if stopped_at_length(usage) and options:
+                    json_parse_stats.add("truncated")
+                    options = dict(options, num_ctx=generation_planner.widen_context(model_name, options["num_ctx"]))
+                    print(f"{label} was cut off at the length limit; retrying with num_ctx {options['num_ctx']}.")
+
+        json_parse_stats.add("schema_retries")
+        usage = {}
+        content = client.chat_native(call_type, prompt, format=schema, options=options, model=model, usage=usage)
+        if PRINT_RAW_RESPONSES:
+            print(f"--- Raw Ollama {label} Content, schema retry (for debugging) ---\n{content}\n--- End Raw Content ---")
+        try:
+            with phase_span("json_parse"):
+                return validate_json_schema(parse_ollama_json_response(content), schema)
+        except ValueError as e:
+            json_parse_stats.add("parse_failures")
+            if stopped_at_length(usage):
+                json_parse_stats.add("truncated")
+                raise ValueError(f"{label} was cut off at the length limit ({options and options.get('num_ctx')} tokens of context).") from e
+            raise
+
+    return run_budgeted(call_type, model_name, lambda context: prompt, send)
+
+def generate_daily_exercises_ollama(module, lesson, language=None, topic_index=None):
     """
     Generates lesson content and exercises using the Ollama API.
     Returns a dictionary with 'explanation_summary', 'lesson_content', and 'exercises' keys.
+    With a LessonIndex as topic_index, the prompt lists a few topics already covered and a lesson
+    that comes out as a near-duplicate of an earlier one is regenerated.
     """
+    started = time.perf_counter()
+    language = language or LANGUAGE
+    covered = topic_index.covered_topics(module, COVERED_TOPICS_IN_PROMPT) if topic_index is not None else []
     prompt = f"""
-You are an expert {LANGUAGE} teacher. Create lesson number {lesson} for module {module} (A1, A2, B1, B2, C1, or C2).
-Write a concise explanation of what the student will learn today regarding {LANGUAGE} grammar or communication skills.
+You are an expert {language} teacher. Create lesson number {lesson} for module {module} (A1, A2, B1, B2, C1, or C2).
+Write a concise explanation of what the student will learn today regarding {language} grammar or communication skills.
 Then provide a detailed text explaining the grammar concept or communication principle.
 After the explanation, provide 5-7 varied exercises (fill-in-the-blanks, multiple choice, sentence correction, short answer, matching, etc.)
 to practice the grammar topic.
 To teach effective communication and writing, include at least one prompt for a "short reflection" or a "tiny essay" (around 50-100 words) at the end of the exercises, related to the lesson topic or a general communication skill. This will be part of the exercises.
-
+{_covered_topics_note(covered)}
 YOUR ENTIRE RESPONSE MUST BE A SINGLE JSON OBJECT. DO NOT INCLUDE ANY OTHER TEXT, CONVERSATIONAL GREETINGS, OR EXPLANATIONS OUTSIDE THE JSON.
 
-The 'exercises' array MUST contain 5-7 elements. EACH element in the 'exercises' array MUST be a string containing the full exercise question. Do NOT use placeholder text like 'No question text' or empty strings.
+The 'exercises' array MUST contain 5-7 elements. EACH element in the 'exercises' array MUST be an object with:
+- "type": one of "fill_in_blank", "multiple_choice", "true_false", "sentence_correction", "short_answer", "essay"
+- "question": the full exercise question. Do NOT use placeholder text like 'No question text' or empty strings.
+- "options": the list of choices (only for "multiple_choice" and "true_false")
+- "answer": the correct answer (the word(s) that fill the blank, the correct option, the corrected sentence); omit it for "essay"
+- "accepted_answers": other answers that are also fully correct (may be empty)
 
 Example JSON structure:
 {{
   "explanation_summary": "Today you will learn about the present simple tense for routines and habits.",
   "lesson_content": "The present simple tense is used to describe habits, routines, general truths, and scheduled events. For example, 'I eat breakfast every morning.' or 'The sun rises in the east.'",
   "exercises": [
-    "Fill in the blank: I ___ (to go) to school every day.",
-    "Choose the correct option: She (like/likes) pizza.",
-    "Write a short reflection (50 words): Describe your daily routine using the present simple tense."
+    {{"type": "fill_in_blank", "question": "Fill in the blank: I ___ (to go) to school every day.", "answer": "go", "accepted_answers": []}},
+    {{"type": "multiple_choice", "question": "Choose the correct option: She ___ pizza.", "options": ["like", "likes"], "answer": "likes", "accepted_answers": []}},
+    {{"type": "sentence_correction", "question": "Correct the sentence: He go to work by bus.", "answer": "He goes to work by bus.", "accepted_answers": []}},
+    {{"type": "essay", "question": "Write a short reflection (50 words): Describe your daily routine using the present simple tense."}}
   ]
 }}
 
 Make sure the exercises match the {module} grammar level and the overall tone is professional and encouraging.
 """
+    record_phase("prompt_build", time.perf_counter() - started)
+    cache_options = {"response_format": "json"}
+    model = model_router.select("lesson")
+    cached = completion_cache.get("lesson", model, prompt, cache_options)
+    if cached is not None:
+        return cached
     try:
-        response = requests.post(
-            f"{OLLAMA_API_URL}/v1/chat/completions",
-            json={
-                "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json"}, # Request JSON format
-            },
-            timeout=90,
-        )
-        response.raise_for_status()
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
+        lesson_data = generate_json_ollama("lesson", prompt, LESSON_SCHEMA, label="Response", model=model) # Request JSON format
+        if topic_index is not None:
+            lesson_data = _regenerate_repeated_lesson(topic_index, module, lesson, prompt, model, lesson_data)
+    except ValueError as e:
+        raise ValueError(f"Failed to parse Ollama JSON response: {e}")
+    completion_cache.put("lesson", model, prompt, lesson_data, cache_options)
+    return lesson_data
 
-        print(f"--- Raw Ollama Response Content (for debugging) ---\n{content}\n--- End Raw Content ---")
+def _covered_topics_note(topics):
+    """The prompt lines listing topics of earlier lessons, or an empty line when there are none."""
+    if not topics:
+        return ""
+    lines = "\n".join(f"- {topic}" for topic in topics)
+    return f"\nThe student has already had lessons on these topics; choose a different one:\n{lines}\n"
 
-        try:
-            return parse_ollama_json_response(content)
-        except ValueError as e:
-            raise ValueError(f"Failed to parse Ollama JSON response: {e}")
-    except requests.exceptions.ConnectionError:
-        raise ConnectionError(f"Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running?")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Ollama API request failed: {e}")
+def repeated_lesson(topic_index, module, lesson, lesson_data):
+    """Returns (similarity, row entry) of the earlier lesson that lesson_data repeats, or None if it is new enough."""
+    try:
+        with phase_span("embed"):
+            similarity, match = topic_index.nearest(lesson_data, exclude_key=LessonIndex.key(module, lesson))
+    except OllamaError as e:
+        print(f"Lesson index: {e}. Skipping the repeated topic check.")
+        return None
+    if match is None or similarity < topic_index.duplicate_threshold:
+        return None
+    return similarity, match
 
-def generate_module_overview_ollama(module_name):
+def _regenerate_repeated_lesson(topic_index, module, lesson, prompt, model, lesson_data):
+    """Regenerates the lesson (up to LESSON_DUPLICATE_RETRIES times) while it is a near-duplicate of an earlier one."""
+    for attempt in range(LESSON_DUPLICATE_RETRIES + 1):
+        repeat = repeated_lesson(topic_index, module, lesson, lesson_data)
+        if repeat is None or attempt == LESSON_DUPLICATE_RETRIES:
+            return lesson_data
+        similarity, match = repeat
+        topic_index.repeats_rejected += 1
+        print(f"Lesson {lesson} of {module} repeats {match['key']} (similarity {similarity:.2f}); regenerating.")
+        retry_prompt = prompt + f'\nThere is already a lesson about "{match["topic"]}". Choose a clearly different topic.\n'
+        lesson_data = generate_json_ollama("lesson", retry_prompt, LESSON_SCHEMA, label="Response", model=model)
+    return lesson_data
+
+def generate_module_overview_ollama(module_name, language=None):
     """
     Generates an overview for a new module using the Ollama API.
     """
+    started = time.perf_counter()
+    language = language or LANGUAGE
     prompt = f"""
-You are an expert {LANGUAGE} teacher. Create a professional and encouraging overview for the {module_name} module.
+You are an expert {language} teacher. Create a professional and encouraging overview for the {module_name} module.
 Explain what the student will explore in this module, including key grammar points, vocabulary themes, and communication skills they will develop.
 Provide a list of 5-7 main topics that will be covered.
 
@@ -142,7 +1860,7 @@ YOUR ENTIRE RESPONSE MUST BE A SINGLE JSON OBJECT. DO NOT INCLUDE ANY OTHER TEXT
 Example JSON structure:
 {{
   "module_title": "Welcome to A2: Building on Your Basics!",
-  "overview_text": "In this module, you will expand your foundational {LANGUAGE} skills...",
+  "overview_text": "In this module, you will expand your foundational {language} skills...",
   "topics_covered": [
     "Past simple tense: regular & irregular verbs",
     "Present continuous: actions happening now",
@@ -155,213 +1873,1855 @@ Example JSON structure:
   ]
 }}
 """
+    record_phase("prompt_build", time.perf_counter() - started)
+    cache_options = {"response_format": "json"}
+    model = model_router.select("overview")
+    cached = completion_cache.get("overview", model, prompt, cache_options)
+    if cached is not None:
+        return cached
     try:
-        response = requests.post(
-            f"{OLLAMA_API_URL}/v1/chat/completions",
-            json={
-                "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json"},
-            },
-            timeout=90,
-        )
-        response.raise_for_status()
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        print(f"--- Raw Ollama Module Overview Response Content (for debugging) ---\n{content}\n--- End Raw Content ---")
-        try:
-            return parse_ollama_json_response(content)
-        except ValueError as e:
-            raise ValueError(f"Failed to parse Ollama JSON response for module overview: {e}")
-    except requests.exceptions.ConnectionError:
-        raise ConnectionError(f"Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running?")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Ollama API request failed: {e}")
+        overview_data = generate_json_ollama("overview", prompt, OVERVIEW_SCHEMA, label="Module Overview Response", model=model)
+    except ValueError as e:
+        raise ValueError(f"Failed to parse Ollama JSON response for module overview: {e}")
+    completion_cache.put("overview", model, prompt, overview_data, cache_options)
+    return overview_data
+
+
+def exercise_prompt_text(ex):
+    """Returns the question text of an exercise (string or dict) as shown to the model for correction."""
+    if isinstance(ex, str):
+        ex_text = ex
+    elif isinstance(ex, dict):
+        ex_text = ex.get("text") or ex.get("question") or "*No question text*"
+        if "options" in ex and isinstance(ex["options"], list):
+            ex_text += "\nOptions: " + ", ".join(ex["options"])
+    else:
+        ex_text = "*Invalid exercise format*"
+    return ex_text.strip()
+
+def is_open_ended_exercise(ex_text):
+    """True for essay/reflection style prompts, which get writing feedback rather than a right/wrong check."""
+    lowered = ex_text.lower()
+    return any(keyword in lowered for keyword in OPEN_ENDED_KEYWORDS)
+
+def exercise_route(ex):
+    """The model route for correcting an exercise: "correction:<type>"; untyped essay prompts count as "essay"."""
+    if isinstance(ex, dict) and ex.get("type"):
+        return f"correction:{str(ex['type']).lower()}"
+    return "correction:essay" if is_open_ended_exercise(exercise_prompt_text(ex)) else "correction"
+
+def correction_route(exercises):
+    """The route for one request correcting several exercises: theirs if they all route alike, else "correction"."""
+    routes = {exercise_route(ex) for ex in exercises}
+    if len({tuple(model_router.candidates(route)) for route in routes}) == 1:
+        return routes.pop()
+    return "correction"
+
+_PUNCTUATION_TABLE = str.maketrans({**{c: " " for c in string.punctuation if c not in "'-"}, "’": "'", "‘": "'"})
+
+def normalize_answer(text, keep_accents=False):
+    """Case-, whitespace- and punctuation-insensitive form of an answer; accents are dropped unless keep_accents."""
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_PUNCTUATION_TABLE)
+    if not keep_accents:
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+_OPTION_LABEL_RE = re.compile(r"^\s*\(?([a-z]|\d{1,2})[).:](?:\s+|$)", re.IGNORECASE)
+_BARE_OPTION_LABEL_RE = re.compile(r"^\(?([a-z]|\d{1,2})[).:]?$", re.IGNORECASE)
+
+def _strip_option_label(text):
+    """'likes' for 'b) likes', '(b) likes', 'b. likes' or '2: likes'; other text is returned stripped."""
+    match = _OPTION_LABEL_RE.match(text)
+    return text[match.end():].strip() if match else text.strip()
+
+def _label_index(label, count):
+    """0-based option index for a letter or 1-based number, or None when there is no such option."""
+    index = int(label) - 1 if label.isdigit() else ord(label.lower()) - ord("a")
+    return index if 0 <= index < count else None
+
+def _truth_value(text):
+    """True or False for a true/false word in any supported language, else None."""
+    normalized = normalize_answer(_strip_option_label(str(text)))
+    if normalized in TRUE_WORDS:
+        return True
+    return False if normalized in FALSE_WORDS else None
+
+def _option_index(options, value):
+    """
+    Index of the option a key or answer refers to: by its text (with or without an 'a)' label), by its
+    letter or number, or, for a boolean or a true/false word, by the option meaning the same.
+    None when it can't be placed unambiguously.
+    """
+    truths = [_truth_value(option) for option in options]
+    if isinstance(value, bool):
+        return truths.index(value) if value in truths else None
+    value = str(value).strip()
+    texts = [normalize_answer(_strip_option_label(option)) for option in options]
+    text = normalize_answer(_strip_option_label(value))
+    if text and text in texts:
+        index = texts.index(text)
+        label = _OPTION_LABEL_RE.match(value)
+        if label and _label_index(label.group(1), len(options)) not in (None, index):
+            return None # e.g. "a) likes" when "likes" is option b
+        return index
+    label = _BARE_OPTION_LABEL_RE.match(value)
+    if label:
+        return _label_index(label.group(1), len(options))
+    truth = _truth_value(value)
+    return truths.index(truth) if truth is not None and truth in truths else None
+
+def grade_exercise(ex, answer):
+    """
+    Grades a structured exercise against its answer key without the model.
+    Returns (is_correct, feedback_markdown), or None when the exercise needs the model: free-form strings,
+    essays, no answer key, or an answer that neither matches the key nor clearly picks another option.
+    """
+    if not isinstance(ex, dict) or ex.get("answer") in (None, "") or not answer.strip(): # False and 0 are answer keys too
+        return None
+    ex_type = str(ex.get("type", "")).lower()
+    if ex_type not in LOCAL_GRADED_EXERCISE_TYPES + LOCAL_MATCH_EXERCISE_TYPES:
+        return None
+
+    keys = [ex["answer"]] + [variant for variant in ex.get("accepted_answers") or [] if variant]
+    options = [str(option) for option in ex["options"] if option is not None] if isinstance(ex.get("options"), list) else []
+    if options:
+        key_indexes = [index for index in (_option_index(options, key) for key in keys) if index is not None]
+        chosen = _option_index(options, answer)
+        if key_indexes and chosen is not None:
+            correct_text = _strip_option_label(options[key_indexes[0]])
+            if chosen not in key_indexes:
+                if ex_type in LOCAL_MATCH_EXERCISE_TYPES:
+                    return None
+                return False, f"Incorrect. The correct answer is: *{correct_text}*"
+            written = _strip_option_label(answer)
+            if normalize_answer(written) == normalize_answer(correct_text) and \
+                    normalize_answer(written, keep_accents=True) != normalize_answer(correct_text, keep_accents=True):
+                return True, f"Correct, but check your accents: *{correct_text}*"
+            return True, "Correct."
+    if isinstance(ex["answer"], bool):
+        truth = _truth_value(answer)
+        if truth is None or (truth != ex["answer"] and ex_type in LOCAL_MATCH_EXERCISE_TYPES):
+            return None
+        return (True, "Correct.") if truth == ex["answer"] else (False, f"Incorrect. The correct answer is: *{str(ex['answer']).lower()}*")
+
+    keys = [_strip_option_label(str(key)) for key in keys]
+    question = str(ex.get("question") or ex.get("text") or "")
+    if "___" in question:
+        # Also accept the whole sentence written out with the blank filled in
+        sentence = re.sub(r"\s*\([^)]*\)", "", question.split(":", 1)[-1]) # Drop hints like "(être)"
+        keys += [sentence.replace("___", key, 1) for key in keys[:]]
+    candidates = [answer] if options else [answer, _strip_option_label(answer)] # An option's label was checked above
+
+    exact_keys = {normalize_answer(key, keep_accents=True) for key in keys}
+    if any(normalize_answer(candidate, keep_accents=True) in exact_keys for candidate in candidates):
+        return True, "Correct."
+    loose_keys = {normalize_answer(key) for key in keys}
+    if any(normalize_answer(candidate) in loose_keys for candidate in candidates):
+        return True, f"Correct, but check your accents: *{keys[0]}*"
+    return None # Not the key, but possibly a valid alternative the model should judge
+
+def grade_exercises_locally(lesson_data, student_answers_parsed):
+    """Returns {index: (is_correct, feedback)} for every exercise the local grader could decide."""
+    graded = {}
+    for i, ex in enumerate(lesson_data.get("exercises", [])):
+        answer = student_answers_parsed[i] if i < len(student_answers_parsed) else ""
+        result = grade_exercise(ex, answer)
+        if result is not None:
+            graded[i] = result
+    return graded
+
+def format_local_grades(graded):
+    """Renders locally graded exercises as a Markdown list for the correction section."""
+    lines = ["### Automatically Checked Exercises"]
+    for i, (is_correct, feedback) in sorted(graded.items()):
+        lines.append(f"- **Exercise {i + 1}:** {'✅' if is_correct else '❌'} {feedback}")
+    return "\n".join(lines) + "\n\n"
+
+def get_correction_ollama(lesson_data, student_answers_parsed, on_chunk=None, language=None, mode=None):
+    """
+    Gets detailed corrections and explanations from the Ollama API based on lesson and student answers.
+    If on_chunk is given, the correction is streamed and on_chunk(text) is called for every
+    piece as it arrives; the full correction text is still returned once the stream completes.
+    With mode (default CORRECTION_MODE) "parallel", the work is split up by get_correction_parallel.
+    """
+    started = time.perf_counter()
+    language = language or LANGUAGE
+    if (mode or CORRECTION_MODE) == "parallel":
+        return get_correction_parallel(lesson_data, student_answers_parsed, on_chunk=on_chunk, language=language)
+
+    # Objective items with an answer key are graded instantly; only the rest go to the model
+    graded = grade_exercises_locally(lesson_data, student_answers_parsed)
+    local_text = format_local_grades(graded) if graded else ""
+    if local_text and on_chunk is not None:
+        on_chunk(local_text)
+    exercises = lesson_data.get("exercises", [])
+    if graded and len(graded) == len(exercises):
+        correct = sum(is_correct for is_correct, _ in graded.values())
+        summary = f"### Overall\n{correct} of {len(exercises)} answers are correct.\n"
+        if on_chunk is not None:
+            on_chunk(summary)
+        return local_text + summary
+
+    exercises_text = ""
+    route = correction_route([ex for i, ex in enumerate(exercises) if i not in graded])
+    for i, ex in enumerate(exercises):
+        if i in graded:
+            continue
+        ex_text = exercise_prompt_text(ex)
+        
+        # Append student's answer if available
+        student_ans = student_answers_parsed[i] if i < len(student_answers_parsed) else "No answer provided."
+        exercises_text += f"Exercise {i+1}: {ex_text}\nStudent's Answer: {student_ans}\n\n"
+
+    def build_prompt(lesson_content):
+        return f"""
+You are a highly professional and experienced {language} teacher. Your task is to provide detailed, constructive, and encouraging feedback on a student's language exercises and writing.
+
+Here is the lesson content, the original exercises, and the student's answers for each exercise:
+
+---
+Lesson Summary:
+{lesson_data.get('explanation_summary', '')}
+
+Lesson Content:
+{lesson_content}
+
+---
+Exercises and Student Answers:
+{exercises_text}{_local_grades_note(graded)}
+
+---
+Please provide the following:
+1.  **Detailed Correction for Each Exercise:** For each exercise, clearly state if the answer is correct or incorrect. If incorrect, provide the correct answer and a clear, concise explanation of *why* it's incorrect and the grammatical rule or concept that applies.
+2.  **Feedback on Writing/Essays:** For any essay or reflection prompts, provide specific feedback on grammar, vocabulary, sentence structure, clarity, coherence, and overall effectiveness of communication. Suggest areas for improvement.
+3.  **Overall Improvement Areas:** Summarize the student's strengths and weaknesses across all exercises. Suggest specific areas for them to focus on for future improvement (e.g., "review verb tenses," "practice sentence connectors," "expand vocabulary related to X").
+4.  **Professional and Encouraging Tone:** Maintain a supportive and professional tone throughout the correction.
+
+Respond clearly and professionally in {language}.
+"""
+
+    record_phase("prompt_build", time.perf_counter() - started) # Includes grading the objective items locally
+    # When streaming, the timeout applies between chunks rather than to the whole generation
+    return local_text + _complete_correction(build_prompt, lesson_data.get("lesson_content", ""), on_chunk=on_chunk, route=route)
+
+def _local_grades_note(graded):
+    """Tells the model how the locally graded exercises went, so the overall summary still covers them."""
+    if not graded:
+        return ""
+    results = ", ".join(f"Exercise {i + 1}: {'correct' if ok else 'incorrect'}" for i, (ok, _) in sorted(graded.items()))
+    return f"(Already graded automatically, do not correct these again: {results})\n"
+
+def _complete_correction(build_prompt, context="", on_chunk=None, route="correction"):
+    """
+    Runs one correction-type request through the cache and the shared client, on the model `route` selects and
+    within the correction latency budget. build_prompt(context) makes the prompt; `context` is the lesson text
+    it quotes, which is shortened if the prompt doesn't fit.
+    """
+    model = model_router.select(route)
+    streamed = [] # What this correction has passed to on_chunk so far
+
+    def stream(piece):
+        streamed.append(piece)
+        on_chunk(piece)
+
+    def send(prompt, options):
+        if options:
+            # Ask for an answer that ends within num_predict, rather than one that gets cut off
+            prompt += f"Keep your whole answer under {options['num_predict'] // 2} words.\n"
+        # The retry after a call timed out midway isn't streamed, so the learner doesn't get a second answer
+        # after the part already shown; the display is replaced with the saved correction at the end
+        on_piece = stream if on_chunk is not None and not streamed else None
+        cached = completion_cache.get("correction", model, prompt)
+        if cached is not None:
+            if on_piece is not None:
+                on_piece(cached)
+            return cached
+        usage = {}
+        text = get_ollama_client().chat("correction", prompt, on_chunk=on_piece, model=model, options=options, usage=usage)
+        if stopped_at_length(usage):
+            # Not cached, so submitting again gets a new attempt rather than the same cut-off text
+            note = f"\n\n{TRUNCATED_CORRECTION_NOTE}"
+            if on_piece is not None:
+                on_piece(note)
+            return text + note
+        completion_cache.put("correction", model, prompt, text)
+        return text
+
+    return run_budgeted("correction", model, build_prompt, send, context)
+
+def correct_exercise_ollama(lesson_data, number, ex_text, answer, language=None, route="correction"):
+    """Corrects a single exercise with a prompt trimmed to the lesson summary and a short excerpt."""
+    language = language or LANGUAGE
+    lesson_excerpt = lesson_data.get("lesson_content", "")[:CORRECTION_CONTEXT_CHARS]
+    if is_open_ended_exercise(ex_text):
+        task = """This is a writing task. Give specific feedback on grammar, vocabulary, sentence structure, clarity and coherence,
+quote and correct the main mistakes, and suggest how to improve the text. Keep it to one or two short paragraphs."""
+    else:
+        task = """State clearly whether the answer is correct or incorrect. If it is incorrect, give the correct answer
+and a concise explanation of *why*, naming the grammatical rule or concept that applies. Keep it to a few sentences."""
+    def build_prompt(lesson_excerpt):
+        return f"""
+You are a highly professional and experienced {language} teacher correcting one exercise from a student's lesson.
+
+Lesson Summary:
+{lesson_data.get('explanation_summary', '')}
+
+Lesson Excerpt:
+{lesson_excerpt}
+
+Exercise {number}: {ex_text}
+Student's Answer: {answer}
+
+{task}
+Maintain a supportive and professional tone. Respond in {language}. Do not add a heading.
+"""
+
+    return _complete_correction(build_prompt, lesson_excerpt, route=route)
+
+def summarize_corrections_ollama(lesson_data, feedback_by_exercise, on_chunk=None, language=None):
+    """Asks for the overall strengths/weaknesses summary, based on the per-exercise feedback only."""
+    language = language or LANGUAGE
+    feedback_text = "\n\n".join(f"Exercise {number}: {feedback[:400]}" for number, feedback in feedback_by_exercise)
+
+    def build_prompt(feedback_text):
+        return f"""
+You are a highly professional and experienced {language} teacher. A student has just completed a lesson about:
+{lesson_data.get('explanation_summary', '')}
+
+Here is the feedback they received for each exercise:
+{feedback_text}
+
+Summarize the student's strengths and weaknesses across all exercises in a few sentences, and suggest specific areas
+to focus on for future improvement (e.g., "review verb tenses," "practice sentence connectors").
+Maintain a supportive and professional tone. Respond in {language}. Do not add a heading.
+"""
+
+    return _complete_correction(build_prompt, feedback_text, on_chunk=on_chunk)
+
+def correct_exercise(lesson_data, i, answer, language=None):
+    """
+    Feedback on the answer to exercise i (0-based) as (feedback, error): graded locally when possible,
+    otherwise by the model. A failed request gives a placeholder and its exception instead of raising.
+    """
+    ex = lesson_data.get("exercises", [])[i]
+    local_grade = grade_exercise(ex, answer)
+    if not answer.strip():
+        return "*No answer provided.*", None # Nothing to send to the model
+    if local_grade is not None:
+        return f"{'✅' if local_grade[0] else '❌'} {local_grade[1]}", None
+    try:
+        feedback = correct_exercise_ollama(lesson_data, i + 1, exercise_prompt_text(ex), answer, language=language,
+                                           route=exercise_route(ex))
+        return feedback.strip(), None
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        return f"*Correction unavailable for this exercise: {e}*", e
+
+def exercise_section(i, feedback):
+    return f"### Exercise {i + 1}\n{feedback}\n\n"
+
+def get_correction_parallel(lesson_data, student_answers_parsed, on_chunk=None, language=None, concurrency=None):
+    """
+    Corrects a lesson with one small request per exercise, up to `concurrency` (default CORRECTION_CONCURRENCY)
+    at a time, then a short summary request. The results are merged into the same Markdown that goes
+    under "## Correction and Explanation". With on_chunk, each exercise's section is emitted as soon as it
+    and all exercises before it are done, followed by the streamed summary.
+    """
+    language = language or LANGUAGE
+    exercises = lesson_data.get("exercises", [])
+    sections = [None] * len(exercises)
+    emitted = 0
+    emit_lock = threading.Lock()
+
+    def emit_ready():
+        # Keep the display in exercise order even though requests finish in any order
+        nonlocal emitted
+        with emit_lock:
+            while emitted < len(sections) and sections[emitted] is not None:
+                if on_chunk is not None:
+                    on_chunk(sections[emitted])
+                emitted += 1
+
+    def correct(i):
+        answer = student_answers_parsed[i] if i < len(student_answers_parsed) else ""
+        feedback, error = correct_exercise(lesson_data, i, answer, language=language)
+        sections[i] = exercise_section(i, feedback)
+        emit_ready()
+        return feedback, error
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency or CORRECTION_CONCURRENCY) as executor:
+        # Each task runs in a copy of this thread's context, so the requests are recorded in the active trace
+        futures = [executor.submit(contextvars.copy_context().run, correct, i) for i in range(len(exercises))]
+        results = [future.result() for future in futures]
+
+    errors = [error for _, error in results if error is not None]
+    if errors and len(errors) == len(results):
+        raise errors[0] # Nothing could be corrected; report it like a single-request failure
+
+    feedback_by_exercise = [(i + 1, feedback) for i, (feedback, error) in enumerate(results) if error is None]
+    heading = "### Overall Improvement Areas\n"
+    if on_chunk is not None:
+        on_chunk(heading)
+    summary = summarize_corrections_ollama(lesson_data, feedback_by_exercise, on_chunk=on_chunk, language=language)
+    return "".join(sections) + heading + summary.strip()
+
+def save_lesson_md(module, lesson, content, save_dir=None, language=None):
+    """Saves the lesson content to a Markdown file with answer placeholders."""
+    save_dir = save_dir or SAVE_DIR
+    language = language or LANGUAGE
+    os.makedirs(save_dir, exist_ok=True)
+    filename = f"{module}_lesson_{lesson}.md"
+    filepath = os.path.join(save_dir, filename)
+
+    with open(filepath, "w") as f:
+        f.write(f"# {language} {module} Lesson {lesson}\n\n")
+        f.write(f"## What you will learn today\n{content.get('explanation_summary', 'No summary provided.')}\n\n")
+        f.write(f"## Lesson Content\n{content.get('lesson_content', 'No lesson content provided.')}\n\n")
+        f.write("## Exercises\n\n")
+
+        for i, ex in enumerate(content.get("exercises", []), 1):
+            ex_text = ""
+            if isinstance(ex, str):
+                ex_text = ex
+            elif isinstance(ex, dict):
+                ex_text = ex.get("text") or ex.get("question")
+                if ex_text is None: # If neither 'text' nor 'question' found
+                    ex_text = f"ERROR: Malformed exercise object in JSON: {ex}" # Indicate error
+                if "options" in ex and isinstance(ex["options"], list):
+                    ex_text += "\nOptions: " + ", ".join(ex["options"])
+            else:
+                ex_text = f"ERROR: Unexpected exercise format in JSON: {type(ex).__name__} - {ex}" # Indicate error
+
+            f.write(f"{i}. {ex_text.strip()}\n")
+            f.write("**Your Answer:** \n\n") # Placeholder for student's answers
+
+    return filepath
+
+def save_module_overview_md(module_name, overview_data, save_dir=None, language=None):
+    """Saves the module overview to a Markdown file."""
+    save_dir = save_dir or SAVE_DIR
+    language = language or LANGUAGE
+    os.makedirs(save_dir, exist_ok=True)
+    filename = f"{module_name}_Module_Overview.md"
+    filepath = os.path.join(save_dir, filename)
+
+    with open(filepath, "w") as f:
+        f.write(f"# {overview_data.get('module_title', f'{language} {module_name} Module Overview')}\n\n")
+        f.write(f"{overview_data.get('overview_text', 'No overview text provided.')}\n\n")
+        f.write("## Topics to be Covered\n\n")
+        for topic in overview_data.get("topics_covered", []):
+            f.write(f"- {topic}\n")
+        f.write("\n---\n")
+        f.write("Start your first lesson by clicking 'Generate New Lesson'!")
+    return filepath
+
+
+def save_lesson_json(module, lesson, content, save_dir=None):
+    """Saves the raw lesson content (including exercises) to a JSON file."""
+    save_dir = save_dir or SAVE_DIR
+    os.makedirs(save_dir, exist_ok=True)
+    filename = f"{module}_lesson_{lesson}.json"
+    filepath = os.path.join(save_dir, filename)
+    with open(filepath, "w") as f:
+        json.dump(content, f, indent=2)
+    return filepath
+
+def append_correction_to_md(module, lesson, correction_text, save_dir=None):
+    """Appends the correction and explanation text to the lesson markdown file."""
+    save_dir = save_dir or SAVE_DIR
+    filename = f"{module}_lesson_{lesson}.md"
+    filepath = os.path.join(save_dir, filename)
+
+    with open(filepath, "a") as f:
+        f.write("\n---\n")
+        f.write("## Correction and Explanation\n\n")
+        f.write(correction_text + "\n")
+
+    return filepath
+
+def save_dir_for(language, base_dir=None):
+    """Returns the lesson folder for a language, laid out like SAVE_DIR."""
+    return os.path.join(base_dir or BASE_SAVE_DIR, language, "daily-Classes")
+
+async def generate_module_async(module, concurrency=MODULE_GEN_CONCURRENCY, include_overview=True,
+                                language=None, save_dir=None, executor=None, on_item=None):
+    """
+    Generates the module overview and all MAX_LESSONS_PER_MODULE lessons of a module concurrently,
+    with at most `concurrency` Ollama requests in flight, and saves them like the app does.
+    Items whose .md file already exists are skipped, so existing answers are never overwritten and
+    an interrupted run can simply be started again.
+    Pass a shared `executor` to bound several modules by one worker pool; `on_item(item, result)` is
+    called from the worker thread as each lesson number (or "overview") finishes.
+    Returns {"overview": path, "lessons": {lesson: path}, "skipped": [...]}; a failed item maps to its exception instead.
+    """
+    import asyncio
+    language = language or LANGUAGE
+    save_dir = save_dir or SAVE_DIR
+
+    def finished(item, result):
+        if on_item is not None:
+            on_item(item, result)
+        return result
+
+    metrics_file = os.path.join(save_dir, os.path.basename(METRICS_FILE))
+
+    def build_lesson(lesson):
+        trace = OperationTrace("generate_lesson", metrics_file, source="bulk", language=language, module=module, lesson=lesson)
+        try:
+            with trace.activate():
+                lesson_data = generate_daily_exercises_ollama(module, lesson, language=language, topic_index=get_lesson_index(save_dir))
+                with phase_span("file_write"):
+                    # JSON first: the .md file marks the lesson as done when resuming
+                    save_lesson_json(module, lesson, lesson_data, save_dir=save_dir)
+                    filepath = save_lesson_md(module, lesson, lesson_data, save_dir=save_dir, language=language)
+                index_lesson(module, lesson, lesson_data, save_dir=save_dir)
+            trace.finish()
+            return finished(lesson, filepath)
+        except Exception as e:
+            trace.finish(error=e)
+            raise finished(lesson, e)
+
+    def build_overview():
+        trace = OperationTrace("module_overview", metrics_file, source="bulk", language=language, module=module)
+        try:
+            with trace.activate():
+                overview_data = generate_module_overview_ollama(module, language=language)
+                with phase_span("file_write"):
+                    filepath = save_module_overview_md(module, overview_data, save_dir=save_dir, language=language)
+            trace.finish()
+            return finished("overview", filepath)
+        except Exception as e:
+            trace.finish(error=e)
+            raise finished("overview", e)
+
+    # The blocking client runs in a dedicated pool sized to the concurrency limit (the default
+    # executor can be smaller than that on low-core machines); its pooled session is shared by the threads
+    loop = asyncio.get_running_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"module-{module}")
+
+    async def run(fn, *args):
+        return await loop.run_in_executor(executor, fn, *args)
+
+    skipped = []
+    lessons = []
+    for lesson in range(1, MAX_LESSONS_PER_MODULE + 1):
+        if os.path.exists(os.path.join(save_dir, f"{module}_lesson_{lesson}.md")):
+            skipped.append(lesson)
+        else:
+            lessons.append(lesson)
+    if include_overview and os.path.exists(os.path.join(save_dir, f"{module}_Module_Overview.md")):
+        skipped.append("overview")
+        include_overview = False
+
+    jobs = [run(build_lesson, lesson) for lesson in lessons]
+    if include_overview:
+        jobs.append(run(build_overview))
+    try:
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+    return {
+        "overview": results[-1] if include_overview else None,
+        "lessons": dict(zip(lessons, results)),
+        "skipped": skipped,
+    }
+
+ANSWER_MARKER = "**Your Answer:**"
+CORRECTION_HEADING = "## Correction and Explanation"
+_HEADING_RE = re.compile(r"^(#{1,6})[ \t]+([^\r\n]*)$", re.MULTILINE)
+
+class LessonExercise:
+    """One exercise of a parsed lesson; spans are (start, end) character offsets into the document text."""
+
+    def __init__(self, number, question_span, marker_span):
+        self.number = number
+        self.question_span = question_span
+        self.marker_span = marker_span # The '**Your Answer:**' marker itself
+        self.answer_span = (marker_span[1], marker_span[1])
+
+class LessonDocument:
+    """
+    Structured view of a lesson .md file as written by save_lesson_md/append_correction_to_md.
+    `sections` holds (level, title, start, end) for each heading outside of answers and corrections,
+    `exercises` the LessonExercise list and `correction_span` the correction block (including
+    its '---' separator), or None if the lesson hasn't been corrected yet.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.sections = []
+        self.exercises = []
+        self.correction_span = None
+
+    def section_text(self, title):
+        for _, section_title, start, end in self.sections:
+            if section_title == title:
+                return self.text[start:end]
+        return None
+
+    def answer(self, index):
+        start, end = self.exercises[index].answer_span
+        return self.text[start:end]
+
+    def answers(self, num_exercises=None):
+        """Returns the answers as strings, padded with "" (or truncated) to num_exercises if given."""
+        answers = [self.text[start:end] for start, end in (ex.answer_span for ex in self.exercises)]
+        if num_exercises is None:
+            return answers
+        return (answers + [""] * num_exercises)[:num_exercises]
+
+    @property
+    def is_corrected(self):
+        return self.correction_span is not None
+
+    def with_answer(self, index, answer):
+        """Returns the document text with the answer of exercise `index` replaced."""
+        start, end = self.exercises[index].answer_span
+        if start == end and not self.text[start - 1:start].isspace():
+            answer = " " + answer
+        return self.text[:start] + answer + self.text[end:]
+
+def _strip_span(text, start, end):
+    """Narrows (start, end) so the span excludes leading and trailing whitespace."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def _answer_span(text, marker_end, end):
+    """Stripped span of an answer; an empty answer sits right after the marker's trailing spaces."""
+    start, end = _strip_span(text, marker_end, end)
+    if start == end:
+        start = marker_end
+        while start < len(text) and text[start] in " \t":
+            start += 1
+        end = start
+    return start, end
+
+def _find_correction_start(text):
+    """Returns the offset of the correction block (its '---' separator if present), or None."""
+    pos = text.find(CORRECTION_HEADING)
+    while pos != -1:
+        line_end = text.find("\n", pos)
+        line_end = len(text) if line_end == -1 else line_end
+        if (pos == 0 or text[pos - 1] == "\n") and not text[pos + len(CORRECTION_HEADING):line_end].strip():
+            before = text[:pos].rstrip()
+            if before.endswith("---") and (len(before) == 3 or before[-4] == "\n"):
+                return len(before) - 3
+            return pos
+        pos = text.find(CORRECTION_HEADING, pos + 1)
+    return None
+
+def _find_question_start(text, number, start, end):
+    """Returns the start of the last line numbered `number` ('3. ...') in text[start:end], or None."""
+    needle = f"\n{number}."
+    pos = text.rfind(needle, start, end)
+    while pos != -1:
+        after = pos + len(needle)
+        if after < end and text[after].isspace():
+            return pos + 1
+        pos = text.rfind(needle, start, pos)
+    return None
+
+def parse_lesson_md(text):
+    """
+    Tokenizes a lesson .md file in a single linear pass.
+    The '**Your Answer:**' markers are the skeleton of the document: an answer runs from its marker up to
+    the question of the next exercise (the last line numbered n+1 before the next marker), the correction
+    block or the end of the file, so answers may contain their own numbered lists and '#' lines.
+    """
+    doc = LessonDocument(text)
+    end_of_exercises = _find_correction_start(text)
+    if end_of_exercises is None:
+        end_of_exercises = len(text)
+    else:
+        doc.correction_span = (end_of_exercises, len(text))
+
+    exercises = doc.exercises
+    search_from = 0
+    while True:
+        marker_start = text.find(ANSWER_MARKER, search_from, end_of_exercises)
+        if marker_start == -1:
+            break
+        question_start = _find_question_start(text, len(exercises) + 1, search_from, marker_start)
+        if question_start is None:
+            question_start = text.rfind("\n", search_from, marker_start) + 1 or search_from # Use the marker's line
+        if exercises:
+            exercises[-1].answer_span = _answer_span(text, exercises[-1].marker_span[1], question_start)
+        marker_span = (marker_start, marker_start + len(ANSWER_MARKER))
+        exercises.append(LessonExercise(len(exercises) + 1, _strip_span(text, question_start, marker_start), marker_span))
+        search_from = marker_span[1]
+    if exercises:
+        exercises[-1].answer_span = _answer_span(text, exercises[-1].marker_span[1], end_of_exercises)
+
+    # Headings only count as sections before the first exercise; after that they belong to answers
+    preamble_end = exercises[0].question_span[0] if exercises else end_of_exercises
+    section = None
+    for match in _HEADING_RE.finditer(text, 0, preamble_end):
+        if section is not None:
+            doc.sections.append(section + (match.start(),))
+        section = (len(match.group(1)), match.group(2).strip(), min(match.end() + 1, preamble_end))
+    if section is not None:
+        doc.sections.append(section + (preamble_end,))
+    return doc
+
+def read_answers_from_md(filepath, num_exercises, show_errors=True):
+    """
+    Reads the student's answers from the markdown file based on the '**Your Answer:**' marker.
+    Returns a list of strings, one for each answer. With show_errors=False (off the Tk thread),
+    errors are raised instead of shown.
+    """
+    try:
+        with open(filepath, "r") as f:
+            content = f.read()
+        return parse_lesson_md(content).answers(num_exercises)
+    except Exception as e:
+        if not show_errors:
+            raise
+        messagebox.showerror("Error Reading Answers", f"Could not read answers from MD file: {e}")
+        return [""] * num_exercises # Return empty answers on error
+
+_LESSON_FILENAME_RE = re.compile(r"^([A-Z]\d)_lesson_(\d+)\.md$")
+
+class LessonStatusIndex:
+    """
+    Generated/answered/corrected state per (module, lesson), persisted in STATUS_INDEX_FILE.
+    Each entry remembers the mtime and size of the .md file it was computed from, so a single
+    os.stat tells whether it is still valid; a lesson body is only parsed again after it changes
+    (e.g. when the learner saves answers in Obsidian). The index file is only read on first use, so
+    creating one (e.g. while the app's window is being built) doesn't touch the disk.
+    """
+
+    def __init__(self, save_dir=None, index_file=None):
+        self.save_dir = save_dir or SAVE_DIR
+        self.index_file = index_file or (STATUS_INDEX_FILE if save_dir is None else os.path.join(save_dir, "lesson_status.json"))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = None # Filename -> entry; loaded by _load()
+
+    def _load(self):
+        """Reads the saved index the first time it is needed (call with the lock held)."""
+        if self._entries is not None:
+            return
+        try:
+            with open(self.index_file, "r") as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+
+    @staticmethod
+    def _filename(module, lesson):
+        return f"{module}_lesson_{lesson}.md"
+
+    @staticmethod
+    def _state(generated=False, answered=False, corrected=False):
+        return {"generated": generated, "answered": answered, "corrected": corrected}
+
+    def _stat(self, filename):
+        try:
+            st = os.stat(os.path.join(self.save_dir, filename))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _compute(self, filename, stat):
+        """Parses the lesson file once and stores the resulting entry."""
+        try:
+            with open(os.path.join(self.save_dir, filename), "r") as f:
+                doc = parse_lesson_md(f.read())
+        except OSError:
+            return self._state()
+        state = self._state(True, any(doc.answers()), doc.is_corrected)
+        self._entries[filename] = dict(state, mtime_ns=stat[0], size=stat[1])
+        self._dirty = True
+        return state
+
+    def _lookup(self, filename, stat=None):
+        self._load()
+        stat = stat or self._stat(filename)
+        if stat is None:
+            if self._entries.pop(filename, None) is not None:
+                self._dirty = True
+            return self._state()
+        entry = self._entries.get(filename)
+        if entry is not None and (entry.get("mtime_ns"), entry.get("size")) == stat:
+            return self._state(entry["generated"], entry["answered"], entry["corrected"])
+        return self._compute(filename, stat)
+
+    def status(self, module, lesson):
+        """Returns {'generated', 'answered', 'corrected'} for a lesson."""
+        with self._lock:
+            state = self._lookup(self._filename(module, lesson))
+        self.save()
+        return state
+
+    def status_of_file(self, filepath):
+        """Like status(), for a lesson .md path; anything that isn't a lesson file reports all False."""
+        if not filepath or os.path.dirname(os.path.abspath(filepath)) != os.path.abspath(self.save_dir):
+            return self._state()
+        match = _LESSON_FILENAME_RE.match(os.path.basename(filepath))
+        return self.status(match.group(1), int(match.group(2))) if match else self._state()
+
+    def record(self, module, lesson, generated=True, answered=False, corrected=False):
+        """Stores a lesson's state right after the app wrote its file, so it doesn't have to be read back."""
+        filename = self._filename(module, lesson)
+        stat = self._stat(filename)
+        if stat is None:
+            return
+        with self._lock:
+            self._load()
+            self._entries[filename] = dict(self._state(generated, answered, corrected), mtime_ns=stat[0], size=stat[1])
+            self._dirty = True
+        self.save()
+
+    def all_statuses(self):
+        """Returns {(module, lesson): state} for every lesson file, in curriculum order, from one directory scan."""
+        statuses = {}
+        with self._lock:
+            self._load()
+            try:
+                dir_entries = list(os.scandir(self.save_dir))
+            except OSError:
+                dir_entries = []
+            seen = set()
+            for dir_entry in dir_entries:
+                match = _LESSON_FILENAME_RE.match(dir_entry.name)
+                if not match or match.group(1) not in ORDERED_MODULES:
+                    continue
+                st = dir_entry.stat()
+                seen.add(dir_entry.name)
+                statuses[(match.group(1), int(match.group(2)))] = self._lookup(dir_entry.name, (st.st_mtime_ns, st.st_size))
+            for filename in set(self._entries) - seen: # Lesson files deleted since the last scan
+                del self._entries[filename]
+                self._dirty = True
+        self.save()
+        return dict(sorted(statuses.items(), key=lambda item: (ORDERED_MODULES.index(item[0][0]), item[0][1])))
+
+    def save(self):
+        """Writes the index if it changed; written atomically so a crash can't leave it half-written."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            tmp_path = self.index_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_file)
+            self._dirty = False
+
+_LESSON_JSON_RE = re.compile(r"^([A-Z]\d)_lesson_(\d+)\.json$")
+
+class SQLiteLessonStore:
+    """
+    Keeps progress, lesson data, answers, corrections and timings in one SQLite database (WAL mode).
+    Every update is a single transaction, so a crash can't leave progress or a lesson half-written,
+    and history queries use indexes instead of globbing SAVE_DIR.
+    The lesson .md files stay an export view of this data (see export_markdown).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        module TEXT NOT NULL,
+        lesson INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS lessons (
+        module TEXT NOT NULL,
+        lesson INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        answers TEXT,
+        correction TEXT,
+        generated_at REAL NOT NULL,
+        corrected_at REAL,
+        generation_s REAL,
+        correction_s REAL,
+        PRIMARY KEY (module, lesson)
+    );
+    CREATE INDEX IF NOT EXISTS lessons_by_generated_at ON lessons (generated_at);
+    CREATE INDEX IF NOT EXISTS lessons_by_corrected_at ON lessons (corrected_at);
+    CREATE TABLE IF NOT EXISTS overviews (
+        module TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        generated_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, db_path=None, save_dir=None):
+        self.save_dir = save_dir or SAVE_DIR
+        self.db_path = db_path or (LESSON_DB_FILE if save_dir is None else os.path.join(save_dir, "lessons.db"))
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # One connection shared by the UI and worker threads, serialized by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; WAL keeps the database consistent
+            self._conn.executescript(self.SCHEMA)
+        self.import_files()
+
+    def _transaction(self, statements):
+        """Runs [(sql, params), ...] atomically."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def import_files(self):
+        """
+        Imports lesson_progress.json and any {module}_lesson_{n}.json not in the database yet
+        (files from before switching to SQLite, or written by 'python -m program generate').
+        """
+        statements = []
+        progress_file = os.path.join(self.save_dir, os.path.basename(PROGRESS_FILE))
+        if not self._query("SELECT 1 FROM progress") and os.path.exists(progress_file):
+            with open(progress_file, "r") as f:
+                progress = json.load(f)
+            statements.append(("INSERT INTO progress (id, module, lesson, updated_at) VALUES (1, ?, ?, ?)",
+                               (progress["module"], progress["lesson"], time.time())))
+        known = {(row["module"], row["lesson"]) for row in self._query("SELECT module, lesson FROM lessons")}
+        try:
+            names = os.listdir(self.save_dir)
+        except OSError:
+            names = []
+        for name in names:
+            match = _LESSON_JSON_RE.match(name)
+            if not match or (match.group(1), int(match.group(2))) in known:
+                continue
+            path = os.path.join(self.save_dir, name)
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            statements.append(("INSERT INTO lessons (module, lesson, data, generated_at) VALUES (?, ?, ?, ?)",
+                               (match.group(1), int(match.group(2)), json.dumps(data), os.path.getmtime(path))))
+        if statements:
+            self._transaction(statements)
+
+    def load_progress(self):
+        rows = self._query("SELECT module, lesson FROM progress WHERE id = 1")
+        if not rows:
+            progress = {"module": ORDERED_MODULES[0], "lesson": 1}
+            self.save_progress(progress)
+            return progress
+        return {"module": rows[0]["module"], "lesson": rows[0]["lesson"]}
+
+    def save_progress(self, progress):
+        self._transaction([(
+            "INSERT INTO progress (id, module, lesson, updated_at) VALUES (1, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET module = excluded.module, lesson = excluded.lesson, updated_at = excluded.updated_at",
+            (progress["module"], progress["lesson"], time.time()),
+        )])
+
+    def save_lesson(self, module, lesson, data, generation_s=None):
+        """Stores a newly generated lesson, replacing any previous lesson (and correction) at that position."""
+        self._transaction([(
+            "INSERT OR REPLACE INTO lessons (module, lesson, data, generated_at, generation_s) VALUES (?, ?, ?, ?, ?)",
+            (module, lesson, json.dumps(data), time.time(), generation_s),
+        )])
+
+    def save_correction(self, module, lesson, answers, correction, correction_s=None):
+        self._transaction([(
+            "UPDATE lessons SET answers = ?, correction = ?, corrected_at = ?, correction_s = ? WHERE module = ? AND lesson = ?",
+            (json.dumps(answers), correction, time.time(), correction_s, module, lesson),
+        )])
+
+    def save_overview(self, module, data):
+        self._transaction([(
+            "INSERT OR REPLACE INTO overviews (module, data, generated_at) VALUES (?, ?, ?)",
+            (module, json.dumps(data), time.time()),
+        )])
+
+    def get_lesson(self, module, lesson):
+        """Returns the lesson row as a dict ('data' and 'answers' decoded), or None."""
+        rows = self._query("SELECT * FROM lessons WHERE module = ? AND lesson = ?", (module, lesson))
+        if not rows:
+            return None
+        row = dict(rows[0])
+        row["data"] = json.loads(row["data"])
+        row["answers"] = json.loads(row["answers"]) if row["answers"] else None
+        return row
+
+    def lessons(self):
+        """(module, lesson, data) of every stored lesson, in generation order."""
+        return [(row["module"], row["lesson"], json.loads(row["data"]))
+                for row in self._query("SELECT module, lesson, data FROM lessons ORDER BY generated_at")]
+
+    def history(self, limit=50, corrected_only=False):
+        """Most recently generated lessons first, without their content."""
+        where = "WHERE corrected_at IS NOT NULL" if corrected_only else ""
+        rows = self._query(
+            f"SELECT module, lesson, generated_at, corrected_at, generation_s, correction_s FROM lessons {where} "
+            "ORDER BY generated_at DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    def export_markdown(self, save_dir=None, overwrite=False, language=None):
+        """
+        Renders the stored lessons (with answers and corrections) and overviews to .md files.
+        Existing files are left alone unless overwrite is set, since they may hold unsaved answers.
+        Returns the number of files written.
+        """
+        save_dir = save_dir or self.save_dir
+        written = 0
+        for row in self._query("SELECT * FROM lessons ORDER BY module, lesson"):
+            filepath = os.path.join(save_dir, f"{row['module']}_lesson_{row['lesson']}.md")
+            if os.path.exists(filepath) and not overwrite:
+                continue
+            save_lesson_md(row["module"], row["lesson"], json.loads(row["data"]), save_dir=save_dir, language=language)
+            if row["answers"]:
+                with open(filepath, "r") as f:
+                    text = f.read()
+                for i, answer in enumerate(json.loads(row["answers"])):
+                    doc = parse_lesson_md(text)
+                    if i < len(doc.exercises) and answer:
+                        text = doc.with_answer(i, answer)
+                with open(filepath, "w") as f:
+                    f.write(text)
+            if row["correction"]:
+                append_correction_to_md(row["module"], row["lesson"], row["correction"], save_dir=save_dir)
+            written += 1
+        for row in self._query("SELECT * FROM overviews"):
+            filepath = os.path.join(save_dir, f"{row['module']}_Module_Overview.md")
+            if os.path.exists(filepath) and not overwrite:
+                continue
+            save_module_overview_md(row["module"], json.loads(row["data"]), save_dir=save_dir, language=language)
+            written += 1
+        return written
+
+_lesson_store = None
+_lesson_store_lock = threading.Lock()
+
+def get_lesson_store():
+    """Returns the shared SQLiteLessonStore when LESSON_STORE is "sqlite", otherwise None."""
+    global _lesson_store
+    if LESSON_STORE != "sqlite":
+        return None
+    with _lesson_store_lock:
+        if _lesson_store is None:
+            _lesson_store = SQLiteLessonStore()
+        return _lesson_store
+
+def lesson_topic_text(lesson_data):
+    """The part of a lesson that says what it is about: the summary plus the start of the explanation."""
+    return f"{lesson_data.get('explanation_summary', '')}\n{str(lesson_data.get('lesson_content', ''))[:500]}".strip()
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+def hashed_embedding(texts, dim=LESSON_INDEX_DIM):
+    """
+    Words and word pairs hashed into `dim` signed buckets, as unit float32 rows; works without an embedding model.
+    Short words are skipped and counts are dampened, so shared filler words don't make every lesson look alike.
+    """
+    load_numpy()
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = [word for word in re.findall(r"\w+", text.casefold()) if len(word) > 3]
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(token.encode("utf-8")) # Stable across runs, unlike hash()
+            matrix[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    return _unit_rows(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+class LessonIndex:
+    """
+    Embeddings of the lessons saved in one folder, used to keep new lessons off topics already covered.
+    The vectors are unit-length float32 rows of one in-memory matrix, so comparing a new lesson with every
+    earlier one is a single matrix-vector product. They are appended to .lesson_index/vectors.f32 (with one
+    JSON line per row in rows.jsonl) as lessons are saved; a regenerated lesson hides its old row, and the
+    files are rewritten once a quarter of the rows are hidden.
+    Vectors come from EMBED_MODEL, or from hashed_embedding() if Ollama doesn't have it. An index built with the
+    fallback is rebuilt with EMBED_MODEL once Ollama can provide it.
+    """
+
+    _FILENAME_RE = re.compile(r"^(.+)_lesson_(\d+)\.json$")
+
+    def __init__(self, save_dir=None, embedder=None):
+        load_numpy()
+        self.save_dir = save_dir or SAVE_DIR
+        self.index_dir = os.path.join(self.save_dir, ".lesson_index")
+        self.embedder = embedder # "ollama:<model>" or "hashed:<dim>"; None picks one on first use
+        self.dim = None
+        self.repeats_rejected = 0
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32) # Grown by doubling; rows [0, _count) are used
+        self._alive = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._rows = [] # {"key", "module", "lesson", "topic"} per row
+        self._live = {} # Key -> row of its current vector
+        self._recent = {} # Topic text -> vector, so a checked lesson isn't embedded again when it is saved
+        self._header_written = False
+        self._load()
+        if self.dim is None and (self.embedder or "").startswith("hashed:"):
+            self.dim = int(self.embedder.split(":", 1)[1])
+
+    @staticmethod
+    def key(module, lesson):
+        return f"{module}_lesson_{lesson}"
+
+    @property
+    def duplicate_threshold(self):
+        return HASHED_DUPLICATE_THRESHOLD if (self.embedder or "").startswith("hashed:") else LESSON_DUPLICATE_THRESHOLD
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        try:
+            with open(self._path("index.json")) as f:
+                header = json.load(f)
+            with open(self._path("rows.jsonl")) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            vectors = np.fromfile(self._path("vectors.f32"), dtype=np.float32)
+        except (OSError, ValueError):
+            return # No index yet (or a damaged one); it is rebuilt from the lesson files by sync()
+        if self.embedder is not None and header.get("embedder") != self.embedder:
+            return
+        if self.embedder is None and header.get("embedder") != f"ollama:{EMBED_MODEL}":
+            # Built with the fallback (or another model): kept only while EMBED_MODEL still can't be used
+            self._choose_embedder()
+            if header.get("embedder") != self.embedder:
+                return
+        self.embedder, self.dim = header["embedder"], header["dim"]
+        self._header_written = True
+        count = min(len(rows), vectors.size // self.dim) # A crash can leave one file a row ahead
+        self._reserve(count)
+        self._vectors[:count] = vectors[:count * self.dim].reshape(count, self.dim)
+        self._rows = rows[:count]
+        self._count = count
+        for row, entry in enumerate(self._rows):
+            previous = self._live.get(entry["key"])
+            if previous is not None:
+                self._alive[previous] = False
+            self._live[entry["key"]] = row
+            self._alive[row] = True
+
+    def _reserve(self, count):
+        if count <= len(self._vectors) and self._vectors.shape[1] == self.dim:
+            return
+        vectors = np.zeros((max(64, count, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+        alive = np.zeros(len(vectors), dtype=bool)
+        if self._count:
+            vectors[:self._count] = self._vectors[:self._count]
+            alive[:self._count] = self._alive[:self._count]
+        self._vectors, self._alive = vectors, alive
+
+    def _choose_embedder(self):
+        try:
+            dim = len(get_ollama_client().embed(["probe"])[0])
+            embedder = f"ollama:{EMBED_MODEL}"
+        except OllamaError as e:
+            print(f"Lesson index: {EMBED_MODEL} is not available ({e}); using hashed word embeddings.")
+            dim = LESSON_INDEX_DIM
+            embedder = f"hashed:{dim}"
+        with self._lock:
+            if self.embedder is None:
+                self.embedder, self.dim = embedder, dim
+
+    def embed(self, texts):
+        """Unit float32 vectors for the texts, from this index's embedder."""
+        if self.embedder is None:
+            self._choose_embedder()
+        if self.embedder.startswith("ollama:"):
+            vectors = get_ollama_client().embed(texts, model=self.embedder.split(":", 1)[1])
+            return _unit_rows(np.asarray(vectors, dtype=np.float32))
+        return hashed_embedding(texts, self.dim)
+
+    def _vector_for(self, lesson_data):
+        text = lesson_topic_text(lesson_data)
+        with self._lock:
+            vector = self._recent.get(text)
+        if vector is None:
+            vector = self.embed([text])[0]
+            with self._lock:
+                if len(self._recent) >= 32:
+                    self._recent.pop(next(iter(self._recent)))
+                self._recent[text] = vector
+        return vector
+
+    def add(self, module, lesson, lesson_data, vector=None):
+        """Indexes a saved lesson (replacing an earlier version of it) and appends it to the index files."""
+        if vector is None:
+            vector = self._vector_for(lesson_data)
+        entry = {"key": self.key(module, lesson), "module": module, "lesson": lesson,
+                 "topic": " ".join(str(lesson_data.get("explanation_summary", "")).split())[:160]}
+        with self._lock:
+            if not self._header_written:
+                # A new index: drop the rows of one built with another embedder before declaring this one's
+                os.makedirs(self.index_dir, exist_ok=True)
+                for name in ("vectors.f32", "rows.jsonl"):
+                    open(self._path(name), "w").close()
+                write_json_atomic(self._path("index.json"), {"embedder": self.embedder, "dim": self.dim})
+                self._header_written = True
+            self._reserve(self._count + 1)
+            row = self._count
+            self._vectors[row] = vector
+            self._alive[row] = True
+            previous = self._live.get(entry["key"])
+            if previous is not None:
+                self._alive[previous] = False
+            self._live[entry["key"]] = row
+            self._rows.append(entry)
+            self._count += 1
+            if self._count >= 64 and self._count - len(self._live) > self._count // 4:
+                self._compact()
+            else:
+                with open(self._path("vectors.f32"), "ab") as f:
+                    f.write(self._vectors[row].tobytes())
+                with open(self._path("rows.jsonl"), "a") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _compact(self):
+        """Drops hidden rows and rewrites both files. Called with the lock held."""
+        keep = np.flatnonzero(self._alive[:self._count])
+        vectors = self._vectors[keep]
+        self._rows = [self._rows[row] for row in keep]
+        self._count = len(keep)
+        self._vectors[:self._count] = vectors
+        self._alive[:] = False
+        self._alive[:self._count] = True
+        self._live = {entry["key"]: row for row, entry in enumerate(self._rows)}
+        for name, write in (("vectors.f32", lambda f: f.write(vectors.tobytes())),
+                            ("rows.jsonl", lambda f: f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in self._rows))):
+            tmp_path = self._path(name) + ".tmp"
+            with open(tmp_path, "wb" if name.endswith(".f32") else "w") as f:
+                write(f)
+            os.replace(tmp_path, self._path(name))
+
+    def _saved_lessons(self):
+        """Yields (module, lesson, lesson_data) of the lessons saved in save_dir that aren't indexed yet."""
+        store = get_lesson_store()
+        if store is not None and os.path.abspath(store.save_dir) == os.path.abspath(self.save_dir):
+            # With the database, the lesson data lives there rather than in .json files
+            for module, lesson, lesson_data in store.lessons():
+                if self.key(module, lesson) not in self._live:
+                    yield module, lesson, lesson_data
+            return
+        try:
+            names = os.listdir(self.save_dir)
+        except OSError:
+            return
+        for name in sorted(names):
+            match = self._FILENAME_RE.match(name)
+            if match is None or self.key(match.group(1), int(match.group(2))) in self._live:
+                continue
+            try:
+                with open(os.path.join(self.save_dir, name)) as f:
+                    lesson_data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield match.group(1), int(match.group(2)), lesson_data
+
+    def sync(self, batch_size=64):
+        """Indexes the lessons saved in save_dir (or the lesson database) that aren't indexed yet; returns how many were added."""
+        pending = [item for item in self._saved_lessons() if isinstance(item[2], dict)]
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = self.embed([lesson_topic_text(lesson_data) for _, _, lesson_data in batch])
+            for (module, lesson, lesson_data), vector in zip(batch, vectors):
+                self.add(module, lesson, lesson_data, vector=vector)
+        return len(pending)
+
+    def similarities(self, vector):
+        """Cosine similarity of a unit vector to every indexed lesson (hidden rows get -inf), as one matrix product."""
+        with self._lock:
+            scores = self._vectors[:self._count] @ vector
+            scores[~self._alive[:self._count]] = -np.inf
+        return scores
+
+    def nearest(self, lesson_data, exclude_key=None):
+        """Returns (similarity, row entry) of the indexed lesson closest to lesson_data, or (None, None) if there is none."""
+        if not self._live or (len(self._live) == 1 and exclude_key in self._live):
+            return None, None
+        scores = self.similarities(self._vector_for(lesson_data))
+        if exclude_key in self._live:
+            scores[self._live[exclude_key]] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return None, None
+        return float(scores[best]), self._rows[best]
+
+    def covered_topics(self, module, limit):
+        """Topics of the latest indexed lessons, those of `module` first."""
+        with self._lock:
+            rows = sorted(self._live.values(), reverse=True)
+            entries = [self._rows[row] for row in rows]
+        ordered = [e for e in entries if e["module"] == module] + [e for e in entries if e["module"] != module]
+        return list(dict.fromkeys(e["topic"] for e in ordered if e["topic"]))[:limit]
+
+    def __len__(self):
+        return len(self._live)
+
+_lesson_indexes = {}
+_lesson_index_lock = threading.Lock()
+
+def index_lesson(module, lesson, lesson_data, save_dir=None):
+    """Adds a just-saved lesson to its folder's LessonIndex, if there is one; indexing problems never fail the save."""
+    index = get_lesson_index(save_dir)
+    if index is not None:
+        try:
+            with phase_span("embed"):
+                index.add(module, lesson, lesson_data)
+        except OllamaError as e:
+            print(f"Lesson index: could not index lesson {lesson} of {module}: {e}")
+
+def get_lesson_index(save_dir=None):
+    """
+    Returns the shared LessonIndex of a lesson folder (default SAVE_DIR), bringing it up to date with the saved
+    lesson files on first use; None when LESSON_INDEX_ENABLED is off, NumPy is missing or Ollama can't embed.
+    """
+    if not LESSON_INDEX_ENABLED or load_numpy() is None:
+        return None
+    save_dir = save_dir or SAVE_DIR
+    with _lesson_index_lock:
+        index = _lesson_indexes.get(save_dir)
+        if index is None:
+            index = LessonIndex(save_dir)
+            try:
+                index.sync()
+            except OllamaError as e:
+                print(f"Lesson index: {e}. Lessons are generated without the covered topics.")
+                return None
+            _lesson_indexes[save_dir] = index
+        return index
+
+def upcoming_positions(module, lesson, depth):
+    """
+    Returns up to `depth` (module, lesson) positions that follow the given one,
+    rolling over into the next module after MAX_LESSONS_PER_MODULE lessons.
+    """
+    positions = []
+    module_idx = ORDERED_MODULES.index(module)
+    for _ in range(depth):
+        if lesson < MAX_LESSONS_PER_MODULE:
+            lesson += 1
+        elif module_idx < len(ORDERED_MODULES) - 1:
+            module_idx += 1
+            lesson = 1
+        else:
+            break # All modules completed
+        positions.append((ORDERED_MODULES[module_idx], lesson))
+    return positions
+
+class LessonPrefetcher:
+    """
+    Generates upcoming lessons and module overviews on a background thread and keeps
+    the results in a small on-disk queue (PREFETCH_DIR), so that advancing and generating
+    the next lesson doesn't have to wait for Ollama.
+    Every entry records the LANGUAGE and the preferred lesson model it was generated with; entries that
+    don't match the current configuration are discarded.
+    """
+
+    def __init__(self, prefetch_dir=PREFETCH_DIR, max_items=PREFETCH_MAX_ITEMS):
+        self.prefetch_dir = prefetch_dir
+        self.max_items = max_items
+        self._queue = queue.Queue()
+        self._in_flight = set() # Keys queued or currently being generated
+        self._cond = threading.Condition()
+        self._worker = None
+        self._cancel_token = CancelToken() # Cancelled by close()
+        self._item_token = None # CancelToken of the item being generated
+        self._interrupted = None # (key, generate) of an item stopped by pause(), generated again first
+        self._paused = 0 # Nesting depth of paused()
+        self._stale_checked = False # Stale entries are removed on the first schedule(), off the startup path
+
+    def _fingerprint(self):
+        return {"language": LANGUAGE, "model": model_router.candidates("lesson")[0]}
+
+    def _key_path(self, key):
+        return os.path.join(self.prefetch_dir, f"{key}.json")
+
+    @staticmethod
+    def _lesson_key(module, lesson):
+        return f"{module}_lesson_{lesson}"
+
+    @staticmethod
+    def _overview_key(module):
+        return f"{module}_Module_Overview"
+
+    def _invalidate_stale(self):
+        """Removes every queued entry generated with a different language or model."""
+        if not os.path.isdir(self.prefetch_dir):
+            return
+        for name in os.listdir(self.prefetch_dir):
+            if name.endswith(".json") and self._read_entry(os.path.join(self.prefetch_dir, name)) is None:
+                self._remove(os.path.join(self.prefetch_dir, name))
+
+    def _read_entry(self, path):
+        """Returns the entry's data, or None if it is missing, unreadable or stale."""
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("fingerprint") != self._fingerprint():
+            return None
+        return entry.get("data")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _store(self, key, data):
+        """Writes an entry atomically, evicting the oldest entries to stay within max_items."""
+        os.makedirs(self.prefetch_dir, exist_ok=True)
+        entries = sorted(
+            (os.path.join(self.prefetch_dir, name) for name in os.listdir(self.prefetch_dir) if name.endswith(".json")),
+            key=os.path.getmtime,
+        )
+        while entries and len(entries) >= self.max_items:
+            self._remove(entries.pop(0))
+        path = self._key_path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": self._fingerprint(), "data": data}, f)
+        os.replace(tmp_path, path)
+
+    def _has(self, key):
+        return os.path.exists(self._key_path(key))
+
+    def _enqueue(self, key, generate):
+        with self._cond:
+            if self._cancel_token.cancelled or key in self._in_flight or self._has(key):
+                return
+            self._in_flight.add(key)
+        self._queue.put((key, generate))
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+        Holds prefetching back while an interactive request runs, so it doesn't wait behind a background one on
+        the server: the item being generated is cancelled (and generated again later) and no new one starts.
+        """
+        with self._cond:
+            self._paused += 1
+            token = self._item_token
+        if token is not None:
+            token.cancel()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._paused -= 1
+                self._cond.notify_all()
+
+    def _next_item(self):
+        """Waits until prefetching isn't paused and returns the next (key, generate) with its CancelToken, or None when idle."""
+        with self._cond:
+            while self._paused and not self._cancel_token.cancelled:
+                self._cond.wait(0.25)
+            item, self._interrupted = self._interrupted, None
+        if item is None:
+            try:
+                item = self._queue.get(timeout=5)
+            except queue.Empty:
+                return None
+        with self._cond:
+            if self._paused or self._cancel_token.cancelled: # Paused again meanwhile
+                self._interrupted = item
+                return item, None
+            self._item_token = CancelToken()
+            return item, self._item_token
+
+    def _run(self):
+        """Worker loop; generates one item at a time and none while paused(), so interactive requests keep priority."""
+        while not self._cancel_token.cancelled:
+            next_item = self._next_item()
+            if next_item is None:
+                return # Idle; a new worker is started on the next schedule()
+            (key, generate), token = next_item
+            if token is None:
+                continue
+            trace = OperationTrace("prefetch", item=key)
+            interrupted = False
+            try:
+                with trace.activate(), token.activate():
+                    data = generate()
+                    with phase_span("file_write"):
+                        self._store(key, data)
+                trace.finish()
+            except OperationCancelled as e:
+                trace.finish(error=e)
+                interrupted = not self._cancel_token.cancelled
+            except Exception as e:
+                trace.finish(error=e)
+                print(f"Prefetch of {key} failed: {e}")
+            finally:
+                with self._cond:
+                    self._item_token = None
+                    if interrupted:
+                        self._interrupted = (key, generate)
+                    else:
+                        self._in_flight.discard(key)
+                    self._cond.notify_all()
+
+    def close(self, timeout=None):
+        """Cancels the item being generated, drops the queued ones and waits up to `timeout` for the worker to stop."""
+        self._cancel_token.cancel()
+        with self._cond:
+            token, self._item_token = self._item_token, None
+            if self._interrupted is not None:
+                self._in_flight.discard(self._interrupted[0])
+                self._interrupted = None
+        if token is not None:
+            token.cancel()
+        with self._cond:
+            while True:
+                try:
+                    key, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._in_flight.discard(key)
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def schedule(self, module, lesson, include_current=False, depth=PREFETCH_LOOKAHEAD):
+        """
+        Queues background generation of the lessons after (module, lesson), plus the
+        overview of any module the lookahead rolls over into.
+        With include_current, the given lesson itself is queued as well.
+        """
+        if not PREFETCH_ENABLED:
+            return
+        if not self._stale_checked:
+            self._stale_checked = True
+            self._invalidate_stale()
+        positions = upcoming_positions(module, lesson, depth)
+        if include_current:
+            positions.insert(0, (module, lesson))
+        for next_module, next_lesson in positions:
+            if os.path.exists(os.path.join(SAVE_DIR, f"{next_module}_lesson_{next_lesson}.md")):
+                continue # Already generated for real
+            if next_lesson == 1 and next_module != module:
+                self._enqueue(self._overview_key(next_module), lambda m=next_module: generate_module_overview_ollama(m))
+            self._enqueue(self._lesson_key(next_module, next_lesson), lambda m=next_module, l=next_lesson: generate_daily_exercises_ollama(m, l, topic_index=get_lesson_index()))
 
+    def _take(self, key, timeout):
+        # If the item is still being generated, wait for it instead of generating it twice (unless prefetching
+        # is paused, when it wouldn't get done). The wait is sliced so that cancelling the caller's operation ends it.
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while key in self._in_flight and not self._paused:
+                raise_if_cancelled()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(min(remaining, 0.25))
+        path = self._key_path(key)
+        data = self._read_entry(path)
+        self._remove(path)
+        return data
 
-def get_correction_ollama(lesson_data, student_answers_parsed):
+    def take_lesson(self, module, lesson, timeout=120, topic_index=None):
+        """
+        Removes and returns a prefetched lesson, or None if there isn't a valid one. It may have been generated
+        before the lessons ahead of it were indexed, so with a topic_index a repeat of one of them is dropped.
+        """
+        lesson_data = self._take(self._lesson_key(module, lesson), timeout)
+        if lesson_data is not None and topic_index is not None and repeated_lesson(topic_index, module, lesson, lesson_data):
+            print(f"Prefetched lesson {lesson} of {module} repeats an earlier one; generating it again.")
+            return None
+        return lesson_data
+
+    def take_overview(self, module, timeout=120):
+        """Removes and returns a prefetched module overview, or None if there isn't a valid one."""
+        return self._take(self._overview_key(module), timeout)
+
+_INOTIFY_MASK = 0x2 | 0x8 | 0x80 | 0x100 # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+class FileWatcher:
     """
-    Gets detailed corrections and explanations from the Ollama API based on lesson and student answers.
+    Calls on_change() on a background thread whenever `path` has been saved and then left unchanged for
+    `debounce` seconds; the state it finds when the watch starts counts as a change too. Changes are noticed
+    with inotify where available and by polling the file's mtime and size otherwise.
     """
-    exercises_text = ""
-    for i, ex in enumerate(lesson_data.get("exercises", [])):
-        if isinstance(ex, str):
-            ex_text = ex
-        elif isinstance(ex, dict):
-            ex_text = ex.get("text") or ex.get("question") or "*No question text*"
-            if "options" in ex and isinstance(ex["options"], list):
-                ex_text += "\nOptions: " + ", ".join(ex["options"])
-        else:
-            ex_text = "*Invalid exercise format*"
-        
-        # Append student's answer if available
-        student_ans = student_answers_parsed[i] if i < len(student_answers_parsed) else "No answer provided."
-        exercises_text += f"Exercise {i+1}: {ex_text.strip()}\nStudent's Answer: {student_ans}\n\n"
 
-    prompt = f"""
-You are a highly professional and experienced {LANGUAGE} teacher. Your task is to provide detailed, constructive, and encouraging feedback on a student's language exercises and writing.
+    def __init__(self, path, on_change, debounce=None, poll_interval=None):
+        self.path = path
+        self.on_change = on_change
+        self.debounce = WATCH_DEBOUNCE_SECONDS if debounce is None else debounce
+        self.poll_interval = WATCH_POLL_SECONDS if poll_interval is None else poll_interval
+        self._stop = threading.Event()
+        self._fd = self._open_inotify()
+        self.mode = "poll" if self._fd is None else "inotify"
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
-Here is the lesson content, the original exercises, and the student's answers for each exercise:
+    def _open_inotify(self):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None # Not Linux
+        if fd < 0:
+            return None
+        # The folder rather than the file: some editors save by renaming a new file over the old one
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if libc.inotify_add_watch(fd, os.fsencode(folder), _INOTIFY_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
 
----
-Lesson Summary:
-{lesson_data.get('explanation_summary', '')}
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
 
-Lesson Content:
-{lesson_data.get('lesson_content', '')}
+    def _wait(self, timeout):
+        """Sleeps up to `timeout` seconds; with inotify, returns early when something in the folder changes."""
+        if self._fd is None:
+            self._stop.wait(timeout)
+            return
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self._fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass # Drained
 
----
-Exercises and Student Answers:
-{exercises_text}
+    def _run(self):
+        reported = None # Stat of the last state passed to on_change
+        pending, pending_since = None, None # A new stat waiting to stay unchanged for the debounce period
+        try:
+            while not self._stop.is_set():
+                current = self._stat()
+                now = time.monotonic()
+                if current is None or current == reported:
+                    pending = None
+                elif current != pending:
+                    pending, pending_since = current, now
+                elif now - pending_since >= self.debounce:
+                    reported, pending = current, None
+                    self.on_change()
+                    continue
+                if pending is not None:
+                    self._wait(min(self.poll_interval, max(0.0, pending_since + self.debounce - now)))
+                else:
+                    self._wait(self.poll_interval if self._fd is None else 1.0) # With inotify, just to notice stop()
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
 
----
-Please provide the following:
-1.  **Detailed Correction for Each Exercise:** For each exercise, clearly state if the answer is correct or incorrect. If incorrect, provide the correct answer and a clear, concise explanation of *why* it's incorrect and the grammatical rule or concept that applies.
-2.  **Feedback on Writing/Essays:** For any essay or reflection prompts, provide specific feedback on grammar, vocabulary, sentence structure, clarity, coherence, and overall effectiveness of communication. Suggest areas for improvement.
-3.  **Overall Improvement Areas:** Summarize the student's strengths and weaknesses across all exercises. Suggest specific areas for them to focus on for future improvement (e.g., "review verb tenses," "practice sentence connectors," "expand vocabulary related to X").
-4.  **Professional and Encouraging Tone:** Maintain a supportive and professional tone throughout the correction.
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
 
-Respond clearly and professionally in {LANGUAGE}.
-"""
-    try:
-        response = requests.post(
-            f"{OLLAMA_API_URL}/v1/chat/completions",
-            json={
-                "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}],
-            },
-            timeout=120, # Increased timeout for detailed corrections
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
-    except requests.exceptions.ConnectionError:
-        raise ConnectionError(f"Could not connect to Ollama at {OLLAMA_API_URL}. Is Ollama running?")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Ollama API request failed: {e}")
-
-def save_lesson_md(module, lesson, content):
-    """Saves the lesson content to a Markdown file with answer placeholders."""
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    filename = f"{module}_lesson_{lesson}.md"
-    filepath = os.path.join(SAVE_DIR, filename)
+class _StreamRecorder:
+    """Text streamed by a background request, which a reader can replay and then follow until it completes."""
 
-    with open(filepath, "w") as f:
-        f.write(f"# {LANGUAGE} {module} Lesson {lesson}\n\n")
-        f.write(f"## What you will learn today\n{content.get('explanation_summary', 'No summary provided.')}\n\n")
-        f.write(f"## Lesson Content\n{content.get('lesson_content', 'No lesson content provided.')}\n\n")
-        f.write("## Exercises\n\n")
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._done = False
+        self._error = None
+        self._text = None # The complete text, which differs from the chunks if the request was retried midway
 
-        for i, ex in enumerate(content.get("exercises", []), 1):
-            ex_text = ""
-            if isinstance(ex, str):
-                ex_text = ex
-            elif isinstance(ex, dict):
-                ex_text = ex.get("text") or ex.get("question")
-                if ex_text is None: # If neither 'text' nor 'question' found
-                    ex_text = f"ERROR: Malformed exercise object in JSON: {ex}" # Indicate error
-                if "options" in ex and isinstance(ex["options"], list):
-                    ex_text += "\nOptions: " + ", ".join(ex["options"])
-            else:
-                ex_text = f"ERROR: Unexpected exercise format in JSON: {type(ex).__name__} - {ex}" # Indicate error
+    def write(self, text):
+        with self._cond:
+            self._chunks.append(text)
+            self._cond.notify_all()
 
-            f.write(f"{i}. {ex_text.strip()}\n")
-            f.write("**Your Answer:** \n\n") # Placeholder for student's answers
+    def finish(self, error=None, text=None):
+        with self._cond:
+            self._done, self._error, self._text = True, error, text
+            self._cond.notify_all()
 
-    return filepath
+    def follow(self, on_chunk=None):
+        """Passes every chunk so far and the rest as it arrives to on_chunk; returns the text or raises its error."""
+        position = 0
+        while True:
+            with self._cond:
+                while position == len(self._chunks) and not self._done:
+                    self._cond.wait(0.25)
+                    raise_if_cancelled()
+                chunks, position, done = self._chunks[position:], len(self._chunks), self._done
+            if on_chunk is not None:
+                for chunk in chunks:
+                    on_chunk(chunk)
+            if done:
+                if self._error is not None:
+                    raise self._error
+                return self._text if self._text is not None else "".join(self._chunks)
 
-def save_module_overview_md(module_name, overview_data):
-    """Saves the module overview to a Markdown file."""
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    filename = f"{module_name}_Module_Overview.md"
-    filepath = os.path.join(SAVE_DIR, filename)
+def _wait_cancellable(futures):
+    """Waits for the futures, raising OperationCancelled if the active CancelToken is cancelled meanwhile."""
+    pending = set(futures)
+    while pending:
+        _, pending = concurrent.futures.wait(pending, timeout=0.25)
+        raise_if_cancelled()
 
-    with open(filepath, "w") as f:
-        f.write(f"# {overview_data.get('module_title', f'{LANGUAGE} {module_name} Module Overview')}\n\n")
-        f.write(f"{overview_data.get('overview_text', 'No overview text provided.')}\n\n")
-        f.write("## Topics to be Covered\n\n")
-        for topic in overview_data.get("topics_covered", []):
-            f.write(f"- {topic}\n")
-        f.write("\n---\n")
-        f.write("Start your first lesson by clicking 'Generate New Lesson'!")
-    return filepath
+class CorrectionPrewarmer:
+    """
+    Corrects a lesson's answers in the background while the learner is still working on them (WATCH_ANSWERS).
+    update() is called whenever the lesson file is saved: exercises whose answer changed are cancelled and
+    corrected again, the others keep running or stay done. Once every exercise has an answer, the overall
+    summary is started too. result() then only waits for what is still missing and returns the same
+    Markdown as get_correction_parallel.
+    """
 
+    def __init__(self, lesson_data, filepath, language=None):
+        self.lesson_data = lesson_data
+        self.filepath = filepath
+        self.language = language or LANGUAGE
+        self._num_exercises = len(lesson_data.get("exercises", []))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=CORRECTION_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._jobs = {} # Exercise index -> (answer, CancelToken, future of correct_exercise's result)
+        self._summary = None # (answers, CancelToken, _StreamRecorder) of the overall summary
+        self._closed = False
 
-def save_lesson_json(module, lesson, content):
-    """Saves the raw lesson content (including exercises) to a JSON file."""
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    filename = f"{module}_lesson_{lesson}.json"
-    filepath = os.path.join(SAVE_DIR, filename)
-    with open(filepath, "w") as f:
-        json.dump(content, f, indent=2)
-    return filepath
+    def _start(self, i, answer):
+        token = CancelToken()
 
-def append_correction_to_md(module, lesson, correction_text):
-    """Appends the correction and explanation text to the lesson markdown file."""
-    filename = f"{module}_lesson_{lesson}.md"
-    filepath = os.path.join(SAVE_DIR, filename)
+        def correct():
+            with token.activate():
+                token.raise_if_cancelled()
+                return correct_exercise(self.lesson_data, i, answer, language=self.language)
 
-    with open(filepath, "a") as f:
-        f.write("\n---\n")
-        f.write("## Correction and Explanation\n\n")
-        f.write(correction_text + "\n")
+        # A copy of the caller's context, so exercises started by result() are recorded in its trace
+        return answer, token, self._executor.submit(contextvars.copy_context().run, correct)
 
-    return filepath
+    def _start_summary(self, answers, futures):
+        token = CancelToken()
+        recorder = _StreamRecorder()
 
-def read_answers_from_md(filepath, num_exercises):
-    """
-    Reads the student's answers from the markdown file based on the '**Your Answer:**' marker.
-    Returns a list of strings, one for each answer.
-    """
-    answers = [""] * num_exercises
-    try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        def summarize():
+            with token.activate():
+                try:
+                    _wait_cancellable(futures)
+                    results = [future.result() for future in futures]
+                    feedback_by_exercise = [(i + 1, feedback) for i, (feedback, error) in enumerate(results) if error is None]
+                    text = summarize_corrections_ollama(self.lesson_data, feedback_by_exercise, on_chunk=recorder.write,
+                                                        language=self.language)
+                    recorder.finish(text=text)
+                except BaseException as e:
+                    recorder.finish(e)
 
-        # Find all positions of the answer markers
-        answer_marker_positions = [m.end() for m in re.finditer(r"\*\*Your Answer:\*\*\s*", content)]
+        # Its own thread: it waits on the exercise futures, so it mustn't take one of their workers
+        threading.Thread(target=summarize, daemon=True).start()
+        return answers, token, recorder
 
-        for i in range(num_exercises):
-            if i < len(answer_marker_positions):
-                start_index = answer_marker_positions[i]
-                
-                # Determine the end of the current answer
-                end_index = len(content) # Default to end of file
-                
-                # Look for the next answer marker
-                if (i + 1) < len(answer_marker_positions):
-                    end_index = answer_marker_positions[i+1] - len("**Your Answer:** ") # Subtract marker length to get just answer content
-                
-                # Extract the potential answer text
-                potential_answer_text = content[start_index:end_index].strip()
+    def update(self):
+        """Re-reads the answers and (re)starts the exercises whose answer changed; returns how many answers that is."""
+        answers = tuple(read_answers_from_md(self.filepath, self._num_exercises, show_errors=False))
+        started = 0
+        with self._lock:
+            if self._closed:
+                return 0
+            for i, answer in enumerate(answers):
+                job = self._jobs.get(i)
+                if job is not None and job[0] == answer:
+                    continue
+                if job is not None:
+                    job[1].cancel()
+                self._jobs[i] = self._start(i, answer)
+                started += bool(answer.strip())
+            if self._summary is not None and self._summary[0] != answers:
+                self._summary[1].cancel()
+                self._summary = None
+            if self._summary is None and answers and all(answer.strip() for answer in answers):
+                self._summary = self._start_summary(answers, [self._jobs[i][2] for i in range(len(answers))])
+        return started
 
-                # Now, refine this potential_answer_text to only include the actual answer
-                # An answer ends when the next exercise number starts, or a new section starts (e.g., ##)
-                # or if the block ends.
-                
-                # Find the start of the next exercise number (e.g., "2.", "3.")
-                # This regex looks for a line starting with a number, a dot, and a space.
-                next_exercise_match = re.search(r"^\d+\.\s", potential_answer_text, re.MULTILINE)
-                
-                # Find the start of a new markdown heading (e.g., "##", "###")
-                next_heading_match = re.search(r"^#+\s", potential_answer_text, re.MULTILINE)
-                
-                answer_end_in_block = len(potential_answer_text)
-                
-                if next_exercise_match:
-                    answer_end_in_block = min(answer_end_in_block, next_exercise_match.start())
-                if next_heading_match:
-                    answer_end_in_block = min(answer_end_in_block, next_heading_match.start())
-                
-                answers[i] = potential_answer_text[:answer_end_in_block].strip()
-            else:
-                answers[i] = "" # No answer marker found for this exercise
+    @staticmethod
+    def _failed(job):
+        _, token, future = job
+        if token.cancelled or future.cancelled():
+            return True
+        return future.done() and (future.exception() is not None or future.result()[1] is not None)
 
-    except Exception as e:
-        messagebox.showerror("Error Reading Answers", f"Could not read answers from MD file: {e}")
-        return [""] * num_exercises # Return empty answers on error
-    
-    return answers
+    def result(self, answers, on_chunk=None):
+        """
+        The correction of `answers`, reusing the background work for every exercise whose answer is unchanged.
+        Returns (correction, reused): the Markdown and the number of exercises that had been started earlier.
+        Cancelling the caller's operation only stops the wait; the background work carries on.
+        """
+        answers = tuple(answers[i] if i < len(answers) else "" for i in range(self._num_exercises))
+        reused = 0
+        with self._lock:
+            for i, answer in enumerate(answers):
+                job = self._jobs.get(i)
+                if job is None or job[0] != answer or self._failed(job):
+                    if job is not None:
+                        job[1].cancel()
+                    self._jobs[i] = self._start(i, answer) # Failed ones are retried rather than shown as unavailable
+                else:
+                    reused += 1
+            futures = [self._jobs[i][2] for i in range(len(answers))]
+            summary = self._summary if reused == len(answers) and self._summary is not None and self._summary[0] == answers else None
+
+        sections, results = [], []
+        for i, future in enumerate(futures):
+            _wait_cancellable([future])
+            feedback, error = future.result()
+            results.append((feedback, error))
+            sections.append(exercise_section(i, feedback))
+            if on_chunk is not None:
+                on_chunk(sections[-1])
+        errors = [error for _, error in results if error is not None]
+        if errors and len(errors) == len(results):
+            raise errors[0] # Nothing could be corrected; report it like a single-request failure
+
+        heading = "### Overall Improvement Areas\n"
+        if on_chunk is not None:
+            on_chunk(heading)
+        text = None
+        if summary is not None:
+            try:
+                text = summary[2].follow(on_chunk)
+            except OperationCancelled:
+                raise_if_cancelled() # Only our own cancellation ends the wait; a superseded summary is redone
+            except Exception:
+                pass
+        if text is None:
+            feedback_by_exercise = [(i + 1, feedback) for i, (feedback, error) in enumerate(results) if error is None]
+            text = summarize_corrections_ollama(self.lesson_data, feedback_by_exercise, on_chunk=on_chunk, language=self.language)
+        return "".join(sections) + heading + text.strip(), reused
+
+    def close(self):
+        """Cancels all background work."""
+        with self._lock:
+            self._closed = True
+            for _, token, _ in self._jobs.values():
+                token.cancel()
+            if self._summary is not None:
+                self._summary[1].cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 def open_file_in_explorer(path):
     """Opens the given file or directory in the default file explorer."""
@@ -385,12 +3745,43 @@ class LanguageProfessorApp(tk.Tk):
         self.style = ttk.Style(self)
         self.style.theme_use('clam') # 'clam', 'alt', 'default', 'classic'
 
-        self.progress = load_progress()
+        self.progress = None # Loaded by the startup task once the window is on screen
         self.current_lesson_data = None # To store the lesson data after generation
         self.current_md_filepath = None # To store the path of the current lesson's MD file
+        self.prefetcher = LessonPrefetcher()
+        self.status_index = LessonStatusIndex() # Reads its file on first use, in the startup task
+
+        # Worker threads never touch widgets: they post callbacks to this queue, which the Tk loop drains every UI_POLL_MS
+        self._ui_queue = queue.Queue()
+        self._frame_started = None # When the current batch of UI updates started being applied
+        self._display_path = None # File shown in the lesson display
+        self._display_pieces = [] # Text shown in the lesson display, so reloading a file that grew only appends the rest
+
+        # Streamed correction text is buffered by the worker thread and flushed along with each batch of UI updates
+        self._stream_lock = threading.Lock()
+        self._stream_pending = []
+        self._streaming = False
+        self._background_status = None # Last message from background work (model loading, answer checks) in the status bar
+        self._trace = None # OperationTrace of the running operation; UI updates add their time to it
+
+        # Only one operation (generate, submit, next) runs at a time; it reads and updates progress and lesson data
+        self._operation_lock = threading.Lock()
+        self._operation_thread = None
+        self._cancel_token = None # CancelToken of the running operation
+        self._closing = False
+
+        # With WATCH_ANSWERS, saved answers are corrected in the background before "Check My Answers" is pressed
+        self._watcher = None
+        self._prewarmer = None
 
         self._create_widgets()
-        self._load_current_lesson_display()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(UI_POLL_MS, self._drain_ui_queue)
+        # Progress, the lesson file and the HTTP stack are only loaded after the window has been drawn
+        self._set_ui_state(True, "Loading lesson...")
+        self.bind("<Map>", self._on_first_map)
+        if KEEP_ALIVE_PING_MINUTES:
+            self.after(KEEP_ALIVE_PING_MINUTES * 60 * 1000, self._keep_model_alive)
 
     def _create_widgets(self):
         # Main Frame
@@ -410,6 +3801,9 @@ class LanguageProfessorApp(tk.Tk):
         self.next_lesson_button = ttk.Button(top_frame, text="Next Lesson/Module", command=self._next_lesson_threaded, state=tk.DISABLED)
         self.next_lesson_button.pack(side=tk.LEFT, padx=10)
 
+        self.cancel_button = ttk.Button(top_frame, text="Cancel", command=self._cancel_operation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=10)
+
         self.open_folder_button = ttk.Button(top_frame, text="Open Lesson Folder", command=lambda: open_file_in_explorer(SAVE_DIR))
         self.open_folder_button.pack(side=tk.RIGHT, padx=5)
 
@@ -439,66 +3833,253 @@ class LanguageProfessorApp(tk.Tk):
         self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
 
     def _get_progress_text(self):
+        if self.progress is None:
+            return "Current Progress: loading..."
         return f"Current Progress: Module {self.progress['module']}, Lesson {self.progress['lesson']}"
 
+    def _on_first_map(self, event):
+        """Starts the startup task once the window is mapped; <Map> also fires for each child widget."""
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        self.after_idle(lambda: self._start_operation(self._startup_task, "Loading lesson..."))
+
+    def _startup_task(self):
+        """Loads progress and the current lesson on a worker thread, so the first frame doesn't wait for them."""
+        trace = OperationTrace("startup")
+        self._trace = trace
+        try:
+            with trace.activate():
+                self.progress = load_progress()
+                self._post_ui(lambda: self.progress_label.config(text=self._get_progress_text()))
+                self._load_current_lesson_display()
+                trace.fields.update(module=self.progress["module"], lesson=self.progress["lesson"])
+            # While the learner works on the current lesson, get the next one(s) ready
+            self.prefetcher.schedule(self.progress["module"], self.progress["lesson"], include_current=True)
+            self._post_ui(lambda: self._set_ui_state(False, "Ready."))
+            self._post_ui(lambda: self._finish_trace(trace))
+        except Exception as e:
+            self._post_ui(lambda error=e: messagebox.showerror("Startup Error", str(error)))
+            self._post_ui(lambda: self._set_ui_state(False, "Error while loading the lesson."))
+            self._post_ui(lambda error=e: self._finish_trace(trace, error))
+        if WARMUP_ON_STARTUP:
+            self._post_ui(self._warm_up_model_threaded)
+
+    def _post_ui(self, callback, key=None):
+        """
+        Queues a UI update from any thread. Of several updates with the same key waiting in one batch,
+        only the last one is applied (e.g. reloading the display twice).
+        """
+        self._ui_queue.put((key, callback))
+
+    def _drain_ui_queue(self):
+        """Applies every queued UI update and the buffered streamed text in one Tk frame, then reschedules itself."""
+        self._frame_started = time.perf_counter()
+        batch = []
+        while True:
+            try:
+                batch.append(self._ui_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            last = {key: i for i, (key, _) in enumerate(batch) if key is not None}
+            for i, (key, callback) in enumerate(batch):
+                if key is None or last[key] == i:
+                    callback()
+            if self._streaming:
+                self._flush_stream_display()
+        finally:
+            if self._trace is not None and (batch or self._streaming):
+                self._trace.add_frame(time.perf_counter() - self._frame_started)
+            self._frame_started = None
+            if not self._closing:
+                self.after(UI_POLL_MS, self._drain_ui_queue)
+
+    def _show_file(self, filepath):
+        """Called from a worker thread: reads the file there and queues showing it in the lesson display."""
+        try:
+            with open(filepath, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = None
+        except Exception as e:
+            self._post_ui(lambda error=e: messagebox.showerror("Error", f"Could not load lesson file: {error}"))
+            return
+        self._post_ui(lambda: self._render_display(filepath, content), key="display")
+
     def _update_lesson_display_from_file(self, filepath):
         """Updates the main display area by reading the content of the MD file."""
-        self.current_file_label.config(text=f"Current lesson file: {filepath}")
         try:
             with open(filepath, "r") as f:
                 content = f.read()
-            self.lesson_display_text.config(state=tk.NORMAL)
-            self.lesson_display_text.delete(1.0, tk.END)
-            self.lesson_display_text.insert(tk.END, content)
-            self.lesson_display_text.config(state=tk.DISABLED)
         except FileNotFoundError:
-            self.lesson_display_text.config(state=tk.NORMAL)
-            self.lesson_display_text.delete(1.0, tk.END)
-            self.lesson_display_text.insert(tk.END, "Lesson file not found. Generate a new lesson.")
-            self.lesson_display_text.config(state=tk.DISABLED)
+            content = None
         except Exception as e:
             messagebox.showerror("Error", f"Could not load lesson file: {e}")
+            return
+        self._render_display(filepath, content)
+
+    def _render_display(self, filepath, content):
+        """
+        Shows a file's content (None if it doesn't exist) in the lesson display. When the same file is shown
+        and has only grown, e.g. by an appended correction, just the new text is inserted.
+        """
+        started = time.perf_counter()
+        self.current_file_label.config(text=f"Current lesson file: {filepath}")
+        if content is None:
+            filepath, content = None, "Lesson file not found. Generate a new lesson."
+        shown = "".join(self._display_pieces)
+        self.lesson_display_text.config(state=tk.NORMAL)
+        if filepath is not None and filepath == self._display_path and content.startswith(shown):
+            if len(content) > len(shown):
+                self.lesson_display_text.insert(tk.END, content[len(shown):])
+                self.lesson_display_text.see(tk.END)
+        else:
+            self.lesson_display_text.delete(1.0, tk.END)
+            self.lesson_display_text.insert(tk.END, content)
+        self.lesson_display_text.config(state=tk.DISABLED)
+        self._display_path = filepath
+        self._display_pieces = [content]
+        if self._trace is not None:
+            self._trace.add("tk_update", time.perf_counter() - started)
 
     def _load_current_lesson_display(self):
-        """Loads and displays the last generated lesson from the MD file if it exists."""
+        """Called from a worker thread: loads and displays the last generated lesson from the MD file if it exists."""
         module = self.progress["module"]
         lesson = self.progress["lesson"]
         self.current_md_filepath = os.path.join(SAVE_DIR, f"{module}_lesson_{lesson}.md")
-        self._update_lesson_display_from_file(self.current_md_filepath)
+        self._show_file(self.current_md_filepath)
+        store = get_lesson_store()
+        if store is not None:
+            # The database keeps the lesson data, so a lesson generated in an earlier session can still be corrected
+            row = store.get_lesson(module, lesson)
+            if row is not None and os.path.exists(self.current_md_filepath):
+                self.current_lesson_data = row["data"]
         
-        # Check if correction already exists to enable Next Lesson button
-        if os.path.exists(self.current_md_filepath):
-            with open(self.current_md_filepath, 'r') as f:
-                content = f.read()
-            if "## Correction and Explanation" in content:
-                self.next_lesson_button.config(state=tk.NORMAL)
-            else:
-                self.next_lesson_button.config(state=tk.DISABLED)
-        else:
-            self.next_lesson_button.config(state=tk.DISABLED)
+        # The Next Lesson button follows from the status once the startup task sets the UI state; an
+        # uncorrected lesson is watched for saved answers
+        if not self.status_index.status(module, lesson)["corrected"]:
+            self._watch_current_lesson()
+
+    def _watch_current_lesson(self):
+        """With WATCH_ANSWERS, starts correcting the current lesson's answers in the background whenever it is saved."""
+        self._stop_watching()
+        if not WATCH_ANSWERS or not self.current_lesson_data or not self.current_md_filepath:
+            return
+        self._prewarmer = CorrectionPrewarmer(self.current_lesson_data, self.current_md_filepath)
+        self._watcher = FileWatcher(self.current_md_filepath, self._on_answers_saved)
+
+    def _stop_watching(self):
+        watcher, prewarmer = self._watcher, self._prewarmer
+        self._watcher = self._prewarmer = None
+        if watcher is not None:
+            watcher.stop()
+        if prewarmer is not None:
+            prewarmer.close()
+
+    def _on_answers_saved(self):
+        """Runs on the watcher thread after the lesson file was saved."""
+        prewarmer = self._prewarmer
+        if prewarmer is None:
+            return
+        try:
+            started = prewarmer.update()
+        except Exception:
+            return # E.g. the file was moved away; the next save is picked up again
+        if started:
+            message = f"Checking {started} saved answer(s) in the background..."
+            self._post_ui(lambda: self._show_background_status(message), key="watch")
+
 
+    def _start_operation(self, task, status_message):
+        """
+        Runs task on a worker thread under a fresh CancelToken, unless another operation is still running.
+        Returns False if it was refused.
+        """
+        if self._closing or not self._operation_lock.acquire(blocking=False):
+            return False
+        token = CancelToken()
+        self._cancel_token = token
+        self._set_ui_state(True, status_message)
+        self._operation_thread = threading.Thread(target=self._run_operation, args=(task, token), daemon=True)
+        self._operation_thread.start()
+        return True
+
+    def _run_operation(self, task, token):
+        try:
+            with token.activate():
+                task()
+        finally:
+            self._operation_lock.release()
+
+    def _cancel_operation(self):
+        """Cancels the running operation; its Ollama request is closed so the server stops generating."""
+        if self._cancel_token is not None and not self._cancel_token.cancelled:
+            self._cancel_token.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status_label.config(text="Cancelling...")
+
+    def _on_cancelled(self, trace, error):
+        """Restores the display after a cancelled operation; nothing partial has been written to the lesson file."""
+        self._update_lesson_display_from_file(self.current_md_filepath)
+        self._set_ui_state(False, "Cancelled.")
+        self._finish_trace(trace, error)
+
+    def _on_close(self):
+        """Cancels running work, waits briefly for the worker threads to stop and closes the window."""
+        self._closing = True
+        if self._cancel_token is not None:
+            self._cancel_token.cancel()
+        self._stop_watching()
+        self.prefetcher.close(timeout=SHUTDOWN_TIMEOUT_SECONDS)
+        thread = self._operation_thread
+        if thread is not None:
+            thread.join(SHUTDOWN_TIMEOUT_SECONDS) # Workers only queue UI updates, so they never wait for this thread
+        self.destroy()
 
     def _generate_lesson_threaded(self):
         """Starts lesson generation in a separate thread to keep GUI responsive."""
-        self._set_ui_state(True, "Generating lesson...")
-        threading.Thread(target=self._generate_lesson_task).start()
+        self._start_operation(self._generate_lesson_task, "Generating lesson...")
 
     def _generate_lesson_task(self):
         """Task for generating a new lesson."""
         module = self.progress["module"]
         lesson = self.progress["lesson"]
+        trace = OperationTrace("generate_lesson", module=module, lesson=lesson)
+        self._trace = trace
         try:
-            self.current_lesson_data = generate_daily_exercises_ollama(module, lesson)
-            self.current_md_filepath = save_lesson_md(module, lesson, self.current_lesson_data)
-            save_lesson_json(module, lesson, self.current_lesson_data)
+            started = time.monotonic()
+            with trace.activate():
+                lesson_data = self.prefetcher.take_lesson(module, lesson, topic_index=get_lesson_index())
+                trace.fields["source"] = "prefetch" if lesson_data is not None else "model"
+                if lesson_data is None:
+                    with self.prefetcher.paused():
+                        lesson_data = generate_daily_exercises_ollama(module, lesson, topic_index=get_lesson_index())
+                raise_if_cancelled() # Don't replace the current lesson once the learner has cancelled
+                with phase_span("file_write"):
+                    store = get_lesson_store()
+                    if store is not None:
+                        store.save_lesson(module, lesson, lesson_data, generation_s=time.monotonic() - started)
+                    else:
+                        save_lesson_json(module, lesson, lesson_data)
+                    self.current_lesson_data = lesson_data
+                    self.current_md_filepath = save_lesson_md(module, lesson, lesson_data)
+                    self.status_index.record(module, lesson)
+                index_lesson(module, lesson, lesson_data)
+            self.prefetcher.schedule(module, lesson)
+            self._watch_current_lesson()
             
-            self.after(0, lambda: self._update_lesson_display_from_file(self.current_md_filepath))
-            self.after(0, lambda: self._set_ui_state(False, "Lesson generated. Please fill in answers in the MD file."))
-            self.after(0, lambda: self.next_lesson_button.config(state=tk.DISABLED)) # Disable next lesson until answers are submitted
-            self.after(0, lambda: messagebox.showinfo("Success", f"Lesson {lesson} for module {module} generated and saved to:\n{self.current_md_filepath}\n\nPlease open this file in Obsidian to write your answers."))
+            self._show_file(self.current_md_filepath)
+            self._post_ui(lambda: self._set_ui_state(False, "Lesson generated. Please fill in answers in the MD file."))
+            self._post_ui(lambda: self._finish_trace(trace))
+            self._post_ui(lambda: self.next_lesson_button.config(state=tk.DISABLED)) # Disable next lesson until answers are submitted
+            self._post_ui(lambda: messagebox.showinfo("Success", f"Lesson {lesson} for module {module} generated and saved to:\n{self.current_md_filepath}\n\nPlease open this file in Obsidian to write your answers."))
+        except OperationCancelled as e:
+            self._post_ui(lambda error=e: self._on_cancelled(trace, error))
         except Exception as e:
-            self.after(0, lambda: messagebox.showerror("Generation Error", str(e)))
-            self.after(0, lambda: self._set_ui_state(False, "Error during generation."))
+            self._post_ui(lambda error=e: messagebox.showerror("Generation Error", str(error)))
+            self._post_ui(lambda: self._set_ui_state(False, "Error during generation."))
+            self._post_ui(lambda error=e: self._finish_trace(trace, error))
 
     def _submit_answers_threaded(self):
         """Starts answer submission in a separate thread to keep GUI responsive."""
@@ -507,55 +4088,168 @@ class LanguageProfessorApp(tk.Tk):
             return
 
         # Check if correction already exists in the MD file
-        if os.path.exists(self.current_md_filepath):
-            with open(self.current_md_filepath, 'r') as f:
-                content = f.read()
-            if "## Correction and Explanation" in content:
-                messagebox.showinfo("Already Corrected", "This lesson has already been corrected. Please generate a new lesson or advance to the next one.")
-                return
+        if self.status_index.status_of_file(self.current_md_filepath)["corrected"]:
+            messagebox.showinfo("Already Corrected", "This lesson has already been corrected. Please generate a new lesson or advance to the next one.")
+            return
 
-        self._set_ui_state(True, "Submitting answers and getting correction...")
-        threading.Thread(target=self._submit_answers_task).start()
+        self._start_operation(self._submit_answers_task, "Submitting answers and getting correction...")
 
     def _submit_answers_task(self):
         """Task for submitting answers and getting corrections."""
         module = self.progress["module"]
         lesson = self.progress["lesson"]
+        trace = OperationTrace("submit_answers", module=module, lesson=lesson, mode=CORRECTION_MODE)
+        self._trace = trace
         
         try:
-            # Determine the number of exercises from the lesson data
-            num_exercises = len(self.current_lesson_data.get("exercises", []))
-            student_answers_parsed = read_answers_from_md(self.current_md_filepath, num_exercises)
-            
-            correction = get_correction_ollama(self.current_lesson_data, student_answers_parsed)
-            append_correction_to_md(module, lesson, correction)
+            with trace.activate():
+                # Determine the number of exercises from the lesson data
+                num_exercises = len(self.current_lesson_data.get("exercises", []))
+                with phase_span("read_answers"):
+                    try:
+                        # Raised rather than shown here: only the Tk thread may open a dialog (see the handler below)
+                        student_answers_parsed = read_answers_from_md(self.current_md_filepath, num_exercises, show_errors=False)
+                    except (OSError, ValueError) as e:
+                        raise ValueError(f"Could not read answers from MD file: {e}") from e
+                started = time.monotonic()
+
+                # Answers corrected in the background since they were saved are reused (WATCH_ANSWERS)
+                prewarmer = self._prewarmer
+                if prewarmer is not None and prewarmer.filepath != self.current_md_filepath:
+                    prewarmer = None
+                on_chunk = self._queue_stream_chunk if STREAM_CORRECTIONS else None
+                if on_chunk is not None:
+                    self._post_ui(self._begin_stream_display)
+                try:
+                    with self.prefetcher.paused():
+                        if prewarmer is not None:
+                            correction, trace.fields["prewarmed"] = prewarmer.result(student_answers_parsed, on_chunk=on_chunk)
+                        else:
+                            correction = get_correction_ollama(self.current_lesson_data, student_answers_parsed, on_chunk=on_chunk)
+                finally:
+                    if on_chunk is not None:
+                        self._post_ui(self._end_stream_display)
+                raise_if_cancelled()
+                # Only the complete correction is written, so a dropped stream never leaves a half-written file
+                with phase_span("file_write"):
+                    store = get_lesson_store()
+                    if store is not None:
+                        store.save_correction(module, lesson, student_answers_parsed, correction, correction_s=time.monotonic() - started)
+                    append_correction_to_md(module, lesson, correction)
+                    self.status_index.record(module, lesson, answered=any(student_answers_parsed), corrected=True)
+            self._stop_watching()
             
-            self.after(0, lambda: self._update_lesson_display_from_file(self.current_md_filepath))
-            self.after(0, lambda: self._set_ui_state(False, "Correction received and appended to MD file."))
-            self.after(0, lambda: self.next_lesson_button.config(state=tk.NORMAL)) # Enable next lesson button
-            self.after(0, lambda: messagebox.showinfo("Success", "Answers submitted and correction received! Check the lesson display below."))
+            self._show_file(self.current_md_filepath)
+            self._post_ui(lambda: self._set_ui_state(False, "Correction received and appended to MD file."))
+            self._post_ui(lambda: self._finish_trace(trace))
+            self._post_ui(lambda: self.next_lesson_button.config(state=tk.NORMAL)) # Enable next lesson button
+            self._post_ui(lambda: messagebox.showinfo("Success", "Answers submitted and correction received! Check the lesson display below."))
+        except OperationCancelled as e:
+            self._post_ui(lambda error=e: self._on_cancelled(trace, error))
         except Exception as e:
-            self.after(0, lambda: messagebox.showerror("Submission Error", str(e)))
-            self.after(0, lambda: self._set_ui_state(False, "Error during submission."))
+            self._show_file(self.current_md_filepath) # Drops any partly streamed correction; nothing was written
+            self._post_ui(lambda error=e: messagebox.showerror("Submission Error", str(error)))
+            self._post_ui(lambda: self._set_ui_state(False, "Error during submission."))
+            self._post_ui(lambda error=e: self._finish_trace(trace, error))
+
+    def _warm_up_model_threaded(self):
+        """Loads the model in the background and reports readiness in the status bar."""
+        self._show_background_status(f"Loading model {MODEL_NAME}...")
+        threading.Thread(target=self._warm_up_model_task, daemon=True).start()
+
+    def _warm_up_model_task(self):
+        try:
+            seconds = get_ollama_client().load_model()
+            message = f"Model {MODEL_NAME} ready" + (f" (loaded in {seconds:.1f}s)." if seconds >= 1 else ".")
+        except OllamaError as e:
+            if e.status_code == 404:
+                message = f"Model {MODEL_NAME} not found. Run 'ollama pull {MODEL_NAME}'."
+            else:
+                message = f"Ollama not ready: {e}"
+        self._post_ui(lambda: self._show_background_status(message))
+
+    def _show_background_status(self, message):
+        """Shows a message from background work, unless the status bar is busy reporting an operation."""
+        current = self.status_label.cget("text")
+        if current in ("Ready.", self._background_status):
+            self.status_label.config(text=message)
+        self._background_status = message
+
+    def _keep_model_alive(self):
+        """Periodically refreshes the keep-alive so the model stays loaded while the learner is writing answers."""
+        threading.Thread(target=self._keep_alive_task, daemon=True).start()
+        self.after(KEEP_ALIVE_PING_MINUTES * 60 * 1000, self._keep_model_alive)
+
+    @staticmethod
+    def _keep_alive_task():
+        try:
+            get_ollama_client().load_model()
+        except OllamaError as e:
+            print(f"Keep-alive request failed: {e}")
+
+    def _queue_stream_chunk(self, text):
+        """Called from the worker thread for every streamed piece of the correction."""
+        with self._stream_lock:
+            self._stream_pending.append(text)
+
+    def _begin_stream_display(self):
+        """Prepares the lesson display for a streamed correction; each batch of UI updates then flushes the buffer."""
+        self._streaming = True
+        self.status_label.config(text="Receiving correction...")
+        self._append_to_lesson_display("\n---\n## Correction and Explanation\n\n")
+
+    def _flush_stream_display(self):
+        """Appends all buffered streamed text to the display in a single Tk update."""
+        with self._stream_lock:
+            pending, self._stream_pending = self._stream_pending, []
+        if pending:
+            self._append_to_lesson_display("".join(pending))
+
+    def _end_stream_display(self):
+        """Stops flushing after writing out anything still buffered."""
+        self._streaming = False
+        self._flush_stream_display()
+
+    def _append_to_lesson_display(self, text):
+        """Appends text at the end of the read-only lesson display and keeps it scrolled to the bottom."""
+        started = time.perf_counter()
+        self.lesson_display_text.config(state=tk.NORMAL)
+        self.lesson_display_text.insert(tk.END, text)
+        self.lesson_display_text.see(tk.END)
+        self.lesson_display_text.config(state=tk.DISABLED)
+        self._display_pieces.append(text)
+        if self._trace is not None:
+            self._trace.add("tk_update", time.perf_counter() - started)
+
+    def _finish_trace(self, trace, error=None):
+        """Writes the operation's metrics once its UI updates are done and shows the readout in the status bar."""
+        if self._frame_started is not None:
+            trace.add_frame(time.perf_counter() - self._frame_started) # The updates applied so far in this frame
+        if self._trace is trace:
+            self._trace = None
+        record = trace.finish(error)
+        if METRICS_IN_STATUS_BAR:
+            self.status_label.config(text=f"{self.status_label.cget('text')}  [{format_metrics_summary(record)}]")
 
     def _next_lesson_threaded(self):
         """Starts advancing to the next lesson/module in a separate thread."""
-        self._set_ui_state(True, "Advancing to next lesson/module...")
-        threading.Thread(target=self._next_lesson_task).start()
+        self._start_operation(self._next_lesson_task, "Advancing to next lesson/module...")
 
     def _next_lesson_task(self):
         """Task for advancing to the next lesson or module."""
         current_module_idx = ORDERED_MODULES.index(self.progress["module"])
         
+        self._stop_watching() # The next lesson's file doesn't exist yet
         if self.progress["lesson"] < MAX_LESSONS_PER_MODULE:
             # Advance lesson within current module
             self.progress["lesson"] += 1
             save_progress(self.progress)
-            self.after(0, lambda: self.progress_label.config(text=self._get_progress_text()))
-            self.after(0, lambda: self._set_ui_state(False, "Ready for the next lesson. Generate it now!"))
-            self.after(0, lambda: self.next_lesson_button.config(state=tk.DISABLED))
-            self.after(0, lambda: self._update_lesson_display_from_file("")) # Clear display
-            self.after(0, lambda: messagebox.showinfo("Progress", f"Moved to Module {self.progress['module']}, Lesson {self.progress['lesson']}. Click 'Generate New Lesson' to start!"))
+            self.prefetcher.schedule(self.progress["module"], self.progress["lesson"], include_current=True)
+            self._post_ui(lambda: self.progress_label.config(text=self._get_progress_text()))
+            self._post_ui(lambda: self._set_ui_state(False, "Ready for the next lesson. Generate it now!"))
+            self._post_ui(lambda: self.next_lesson_button.config(state=tk.DISABLED))
+            self._show_file("") # Clear display
+            self._post_ui(lambda: messagebox.showinfo("Progress", f"Moved to Module {self.progress['module']}, Lesson {self.progress['lesson']}. Click 'Generate New Lesson' to start!"))
         else:
             # Advance to next module
             if current_module_idx < len(ORDERED_MODULES) - 1:
@@ -563,25 +4257,44 @@ class LanguageProfessorApp(tk.Tk):
                 self.progress["module"] = next_module
                 self.progress["lesson"] = 1 # Reset lesson to 1 for the new module
                 save_progress(self.progress)
-                self.after(0, lambda: self.progress_label.config(text=self._get_progress_text()))
+                self._post_ui(lambda: self.progress_label.config(text=self._get_progress_text()))
                 
                 # Generate and display module overview
+                trace = OperationTrace("module_overview", module=next_module)
+                self._trace = trace
                 try:
-                    overview_data = generate_module_overview_ollama(next_module)
-                    overview_filepath = save_module_overview_md(next_module, overview_data)
-                    self.after(0, lambda: self._update_lesson_display_from_file(overview_filepath))
-                    self.after(0, lambda: self._set_ui_state(False, f"Welcome to {next_module} module! Generate your first lesson."))
-                    self.after(0, lambda: self.next_lesson_button.config(state=tk.DISABLED)) # Disable until new lesson is generated
-                    self.after(0, lambda: messagebox.showinfo("Module Advanced", f"Congratulations! You've completed {ORDERED_MODULES[current_module_idx]} and moved to {next_module}!\n\nCheck the display for an overview of what you'll learn."))
+                    with trace.activate():
+                        overview_data = self.prefetcher.take_overview(next_module)
+                        trace.fields["source"] = "prefetch" if overview_data is not None else "model"
+                        if overview_data is None:
+                            with self.prefetcher.paused():
+                                overview_data = generate_module_overview_ollama(next_module)
+                        with phase_span("file_write"):
+                            store = get_lesson_store()
+                            if store is not None:
+                                store.save_overview(next_module, overview_data)
+                            overview_filepath = save_module_overview_md(next_module, overview_data)
+                    self.prefetcher.schedule(next_module, 1, include_current=True)
+                    self._show_file(overview_filepath)
+                    self._post_ui(lambda: self._set_ui_state(False, f"Welcome to {next_module} module! Generate your first lesson."))
+                    self._post_ui(lambda: self._finish_trace(trace))
+                    self._post_ui(lambda: self.next_lesson_button.config(state=tk.DISABLED)) # Disable until new lesson is generated
+                    self._post_ui(lambda: messagebox.showinfo("Module Advanced", f"Congratulations! You've completed {ORDERED_MODULES[current_module_idx]} and moved to {next_module}!\n\nCheck the display for an overview of what you'll learn."))
+                except OperationCancelled as e:
+                    # Progress has already moved on; the overview just isn't shown
+                    self._show_file("")
+                    self._post_ui(lambda: self._set_ui_state(False, f"Cancelled. Welcome to {next_module} module! Generate your first lesson."))
+                    self._post_ui(lambda error=e: self._finish_trace(trace, error))
                 except Exception as e:
-                    self.after(0, lambda: messagebox.showerror("Module Overview Error", str(e)))
-                    self.after(0, lambda: self._set_ui_state(False, "Error generating module overview."))
+                    self._post_ui(lambda error=e: messagebox.showerror("Module Overview Error", str(error)))
+                    self._post_ui(lambda: self._set_ui_state(False, "Error generating module overview."))
+                    self._post_ui(lambda error=e: self._finish_trace(trace, error))
             else:
                 # All modules completed
-                self.after(0, lambda: self._set_ui_state(False, "All modules completed!"))
-                self.after(0, lambda: messagebox.showinfo("Congratulations", "You have completed all available modules!"))
-                self.after(0, lambda: self.next_lesson_button.config(state=tk.DISABLED))
-                self.after(0, lambda: self.generate_button.config(state=tk.DISABLED)) # Maybe disable generate too
+                self._post_ui(lambda: self._set_ui_state(False, "All modules completed!"))
+                self._post_ui(lambda: messagebox.showinfo("Congratulations", "You have completed all available modules!"))
+                self._post_ui(lambda: self.next_lesson_button.config(state=tk.DISABLED))
+                self._post_ui(lambda: self.generate_button.config(state=tk.DISABLED)) # Maybe disable generate too
 
     def _set_ui_state(self, disabled, status_message=""):
         """Disables/enables UI elements during API calls and updates status bar."""
@@ -589,24 +4302,502 @@ class LanguageProfessorApp(tk.Tk):
         self.generate_button.config(state=state)
         self.submit_button.config(state=state)
         self.open_folder_button.config(state=state)
+        self.cancel_button.config(state=tk.NORMAL if disabled else tk.DISABLED)
         self.status_label.config(text=status_message)
         
         # Next lesson button state is managed separately based on correction presence
         # and whether a new lesson needs to be generated.
         # It's re-enabled only after a correction is received for the current lesson.
-        if not disabled and self.current_md_filepath and os.path.exists(self.current_md_filepath):
-            with open(self.current_md_filepath, 'r') as f:
-                content = f.read()
-            if "## Correction and Explanation" in content:
-                self.next_lesson_button.config(state=tk.NORMAL)
-            else:
-                self.next_lesson_button.config(state=tk.DISABLED)
+        if not disabled and self.status_index.status_of_file(self.current_md_filepath)["corrected"]:
+            self.next_lesson_button.config(state=tk.NORMAL)
         else:
             self.next_lesson_button.config(state=tk.DISABLED)
 
 
-if __name__ == "__main__":
+# --- HTTP Service ---
+
+class ServiceError(Exception):
+    """An error answered with an HTTP status and a JSON {"error": message} body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ServiceOverloaded(ServiceError):
+    """The model request queue is full; the client should retry later."""
+
+    def __init__(self, message="The lesson server is busy. Please retry shortly."):
+        super().__init__(503, message)
+
+class ModelRequestQueue:
+    """
+    The service's front door to Ollama: at most `workers` model calls run at once on a thread pool and
+    at most `max_queue` more wait for a slot; beyond that requests are rejected (ServiceOverloaded) instead
+    of piling up. Calls with the same key that are already in flight share one result, e.g. a whole class
+    reaching the same module overview at once. Must be used from a single event loop.
+    """
+
+    def __init__(self, workers=None, max_queue=None):
+        self.workers = workers or SERVICE_WORKERS
+        self.max_queue = SERVICE_MAX_QUEUE if max_queue is None else max_queue
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="service")
+        self._in_flight = {} # key -> asyncio future of the running call
+        self.pending = 0 # Running plus waiting calls
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def run(self, key, fn, *args):
+        import asyncio
+        if key is not None and key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise ServiceOverloaded()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        self.pending += 1
+        if key is not None:
+            self._in_flight[key] = future
+
+        def done(_):
+            # Also runs when every waiting client has disconnected, since the call itself can't be stopped
+            self.pending -= 1
+            self.completed += 1
+            if key is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+        future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {"workers": self.workers, "max_queue": self.max_queue, "pending": self.pending,
+                "completed": self.completed, "coalesced": self.coalesced, "rejected": self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+class Learner:
+    """One learner's progress and lesson folder in service mode (laid out like SAVE_DIR)."""
+
+    def __init__(self, learner_id, base_dir, language):
+        import asyncio
+        self.learner_id = learner_id
+        self.base_dir = os.path.join(base_dir, learner_id)
+        self.default_language = language
+        self.lock = asyncio.Lock() # One operation at a time per learner, e.g. against double submissions
+        self._status_indexes = {}
+
+    def load_progress(self):
+        path = os.path.join(self.base_dir, "lesson_progress.json")
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"module": ORDERED_MODULES[0], "lesson": 1, "language": self.default_language}
+
+    def save_progress(self, progress):
+        write_json_atomic(os.path.join(self.base_dir, "lesson_progress.json"), progress)
+
+    def save_dir(self, progress):
+        return save_dir_for(progress.get("language", self.default_language), self.base_dir)
+
+    def status_index(self, progress):
+        save_dir = self.save_dir(progress)
+        if save_dir not in self._status_indexes:
+            self._status_indexes[save_dir] = LessonStatusIndex(save_dir)
+        return self._status_indexes[save_dir]
+
+    def lesson_data(self, progress):
+        path = os.path.join(self.save_dir(progress), f"{progress['module']}_lesson_{progress['lesson']}.json")
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+class LessonService:
+    """
+    Serves the lesson engine to many learners over HTTP (JSON in and out):
+      GET  /health
+      GET  /learners/<id>/progress
+      POST /learners/<id>/generate-lesson   {"regenerate": false}
+      POST /learners/<id>/submit-answers    {"answers": ["...", ...]}  (omit to read them from the .md file)
+      POST /learners/<id>/next-lesson
+    Each learner gets their own progress file and lesson folders below base_dir/<id>/; a new learner
+    may pick a language with {"language": "Spanish"} on their first generate-lesson call.
+    """
+
+    _ROUTE_RE = re.compile(r"^/learners/([A-Za-z0-9_-]{1,64})/(progress|generate-lesson|submit-answers|next-lesson)$")
+
+    def __init__(self, base_dir=None, language=None, workers=None, max_queue=None):
+        self.base_dir = base_dir or SERVICE_LEARNERS_DIR
+        self.language = language or LANGUAGE
+        self.queue = ModelRequestQueue(workers, max_queue)
+        self._learners = {}
+
+    def learner(self, learner_id):
+        if learner_id not in self._learners:
+            self._learners[learner_id] = Learner(learner_id, self.base_dir, self.language)
+        return self._learners[learner_id]
+
+    async def dispatch(self, method, path, body):
+        """Routes one request; returns (status, payload) or raises ServiceError."""
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, {"status": "ok", "model": MODEL_NAME, "queue": self.queue.stats(),
+                         "endpoints": get_ollama_client().pool.stats(), "models": model_router.stats(),
+                         "generation": generation_planner.stats()}
+        match = self._ROUTE_RE.match(path)
+        if not match:
+            raise ServiceError(404, f"Unknown path: {path}")
+        learner_id, action = match.groups()
+        expected = "GET" if action == "progress" else "POST"
+        if method != expected:
+            raise ServiceError(405, f"Use {expected} for {action}.")
+        learner = self.learner(learner_id)
+        async with learner.lock:
+            handler = getattr(self, f"_{action.replace('-', '_')}")
+            return 200, await handler(learner, body)
+
+    # The handlers read and write the learner's files on worker threads (asyncio.to_thread), like the model calls,
+    # so that no learner's disk I/O holds up the event loop
+
+    async def _progress(self, learner, body):
+        import asyncio
+
+        def load():
+            progress = learner.load_progress()
+            return {**progress, "status": learner.status_index(progress).status(progress["module"], progress["lesson"])}
+
+        return await asyncio.to_thread(load)
+
+    async def _generate_lesson(self, learner, body):
+        import asyncio
+
+        def load():
+            progress = learner.load_progress()
+            if "language" in body and not learner.lesson_data(progress):
+                progress["language"] = str(body["language"])
+            return progress, None if body.get("regenerate") else learner.lesson_data(progress)
+
+        progress, lesson_data = await asyncio.to_thread(load)
+        module, lesson, language = progress["module"], progress["lesson"], progress["language"]
+        generated = lesson_data is None
+        if generated:
+            # Learners at the same lesson at the same time share one generation
+            lesson_data = await self.queue.run(("lesson", MODEL_NAME, language, module, lesson),
+                                               generate_daily_exercises_ollama, module, lesson, language)
+
+            def save():
+                save_dir = learner.save_dir(progress)
+                save_lesson_json(module, lesson, lesson_data, save_dir=save_dir)
+                save_lesson_md(module, lesson, lesson_data, save_dir=save_dir, language=language)
+                learner.status_index(progress).record(module, lesson)
+                learner.save_progress(progress)
+
+            await asyncio.to_thread(save)
+        return {"module": module, "lesson": lesson, "language": language, "generated": generated, "lesson_data": lesson_data}
+
+    async def _submit_answers(self, learner, body):
+        import asyncio
+
+        def load():
+            progress = learner.load_progress()
+            lesson_data = learner.lesson_data(progress)
+            if lesson_data is None:
+                raise ServiceError(409, "Generate the lesson first.")
+            if learner.status_index(progress).status(progress["module"], progress["lesson"])["corrected"]:
+                raise ServiceError(409, "This lesson has already been corrected. Advance to the next one.")
+            return progress, lesson_data
+
+        progress, lesson_data = await asyncio.to_thread(load)
+        module, lesson, language = progress["module"], progress["lesson"], progress["language"]
+        status_index = learner.status_index(progress)
+        md_path = os.path.join(learner.save_dir(progress), f"{module}_lesson_{lesson}.md")
+        num_exercises = len(lesson_data.get("exercises", []))
+        answers = body.get("answers")
+        if answers is not None:
+            if not isinstance(answers, list) or not all(isinstance(answer, str) for answer in answers):
+                raise ServiceError(400, "'answers' must be a list of strings.")
+            answers = (answers + [""] * num_exercises)[:num_exercises]
+        answers = await asyncio.to_thread(self._record_answers, md_path, num_exercises, answers)
+
+        key = ("correction", MODEL_NAME, language, hashlib.sha256(json.dumps([lesson_data, answers]).encode("utf-8")).hexdigest())
+        correction = await self.queue.run(key, lambda: get_correction_ollama(lesson_data, answers, language=language))
+
+        def save():
+            append_correction_to_md(module, lesson, correction, save_dir=learner.save_dir(progress))
+            status_index.record(module, lesson, answered=any(answers), corrected=True)
+
+        await asyncio.to_thread(save)
+        return {"module": module, "lesson": lesson, "correction": correction}
+
+    @staticmethod
+    def _record_answers(md_path, num_exercises, answers=None):
+        """
+        Returns the answers in the lesson file, or writes the given ones into it, so that it stays a complete
+        record as if they had been typed in. A missing or unreadable file is a ServiceError.
+        """
+        try:
+            if answers is None:
+                return read_answers_from_md(md_path, num_exercises, show_errors=False)
+            with open(md_path, "r") as f:
+                text = f.read()
+            for i, answer in enumerate(answers):
+                text = parse_lesson_md(text).with_answer(i, answer.strip())
+            with open(md_path, "w") as f:
+                f.write(text)
+            return answers
+        except FileNotFoundError:
+            raise ServiceError(409, "The lesson file is missing. Generate the lesson again with {\"regenerate\": true}.")
+        except (OSError, ValueError) as e:
+            raise ServiceError(409, f"Could not read the answers from the lesson file: {e}")
+
+    async def _next_lesson(self, learner, body):
+        import asyncio
+
+        def advance():
+            """Saves the progress moved on by one lesson; returns it and whether a module was completed (None: the course)."""
+            progress = learner.load_progress()
+            if not learner.status_index(progress).status(progress["module"], progress["lesson"])["corrected"]:
+                raise ServiceError(409, "Submit your answers for the current lesson first.")
+            if progress["lesson"] < MAX_LESSONS_PER_MODULE:
+                progress["lesson"] += 1
+                learner.save_progress(progress)
+                return progress, False
+            module_idx = ORDERED_MODULES.index(progress["module"])
+            if module_idx == len(ORDERED_MODULES) - 1:
+                return progress, None
+            progress["module"], progress["lesson"] = ORDERED_MODULES[module_idx + 1], 1
+            learner.save_progress(progress)
+            return progress, True
+
+        progress, new_module = await asyncio.to_thread(advance)
+        if new_module is None:
+            return {"progress": progress, "overview": None, "completed": True}
+        if not new_module:
+            return {"progress": progress, "overview": None}
+        module, language = progress["module"], progress["language"]
+        overview_data = await self.queue.run(("overview", MODEL_NAME, language, module),
+                                             generate_module_overview_ollama, module, language)
+        await asyncio.to_thread(save_module_overview_md, module, overview_data, save_dir=learner.save_dir(progress),
+                                language=language)
+        return {"progress": progress, "overview": overview_data}
+
+    async def handle_connection(self, reader, writer):
+        """Reads one HTTP/1.1 request, answers it and closes the connection."""
+        import asyncio
+        headers = {}
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), SERVICE_READ_TIMEOUT)
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), SERVICE_READ_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > SERVICE_MAX_BODY_BYTES:
+                raise ServiceError(413, "Request body too large.")
+            raw = await asyncio.wait_for(reader.readexactly(length), SERVICE_READ_TIMEOUT) if length else b""
+            body = json.loads(raw) if raw.strip() else {}
+            if not isinstance(body, dict):
+                raise ServiceError(400, "The request body must be a JSON object.")
+            status, payload = await self.dispatch(method, target, body)
+        except ServiceError as e:
+            status, payload = e.status, {"error": str(e)}
+        except OllamaError as e:
+            status, payload = 502, {"error": str(e), "ollama": e.to_dict()}
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            status, payload = 400, {"error": f"Malformed request: {e}"}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+                  413: "Payload Too Large", 500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}.get(status, "")
+        head = [f"HTTP/1.1 {status} {reason}", "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(data)}", "Connection: close"]
+        if status == 503:
+            head.append("Retry-After: 5")
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass # The client went away; the result is still saved for the learner
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None, ready=None):
+        """Serves until cancelled. `ready(server)` is called once the socket is listening."""
+        import asyncio
+        server = await asyncio.start_server(self.handle_connection, host or SERVICE_HOST, SERVICE_PORT if port is None else port)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.queue.shutdown()
+
+
+# --- Headless Command Line ---
+
+def parse_module_range(spec):
+    """Parses a module spec like 'A1-B2', 'B1' or 'A1,C1-C2' into an ordered list of modules."""
+    modules = []
+    for part in spec.split(","):
+        part = part.strip().upper()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        last = last or first
+        if first not in ORDERED_MODULES or last not in ORDERED_MODULES:
+            raise ValueError(f"Unknown module in '{part}'. Valid modules: {', '.join(ORDERED_MODULES)}")
+        start, end = ORDERED_MODULES.index(first), ORDERED_MODULES.index(last)
+        if start > end:
+            raise ValueError(f"Module range '{part}' is reversed.")
+        modules.extend(m for m in ORDERED_MODULES[start:end + 1] if m not in modules)
+    return sorted(modules, key=ORDERED_MODULES.index)
+
+async def generate_curriculum_async(languages, modules, workers, base_dir=None, include_overviews=True, on_item=None):
+    """
+    Pre-generates every lesson (and module overview) for each language/module pair, all sharing
+    one pool of `workers` threads. Each language is written to its own save_dir_for() tree.
+    Returns {language: {module: generate_module_async result}}.
+    """
+    import asyncio
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="curriculum")
+    pairs = [(language, module) for language in languages for module in modules]
+    try:
+        results = await asyncio.gather(*(
+            generate_module_async(
+                module,
+                include_overview=include_overviews,
+                language=language,
+                save_dir=save_dir_for(language, base_dir),
+                executor=executor,
+                on_item=(lambda item, result, language=language, module=module: on_item(language, module, item, result)) if on_item else None,
+            )
+            for language, module in pairs
+        ))
+    finally:
+        executor.shutdown(wait=True)
+    curriculum = {language: {} for language in languages}
+    for (language, module), result in zip(pairs, results):
+        curriculum[language][module] = result
+    return curriculum
+
+def run_generate_command(args):
+    """Implements 'python -m program generate': bulk pre-generation with a throughput summary."""
+    import asyncio
+    global MODEL_NAME, PRINT_RAW_RESPONSES
+    languages = [language.strip() for language in args.languages.split(",") if language.strip()]
+    modules = parse_module_range(args.modules)
+    if args.model:
+        MODEL_NAME = args.model
+    PRINT_RAW_RESPONSES = args.verbose
+
+    print(f"Generating {', '.join(modules)} for {', '.join(languages)} with {MODEL_NAME} ({args.workers} workers)...")
+    print_lock = threading.Lock()
+
+    def report(language, module, item, result):
+        label = "overview" if item == "overview" else f"lesson {item}"
+        status = f"FAILED: {result}" if isinstance(result, Exception) else "ok"
+        with print_lock:
+            print(f"  [{language}] {module} {label}: {status}")
+
+    started = time.monotonic()
+    curriculum = asyncio.run(generate_curriculum_async(
+        languages, modules, args.workers, base_dir=args.base_dir, include_overviews=not args.no_overviews, on_item=report,
+    ))
+    elapsed = time.monotonic() - started
+
+    print("\nSummary")
+    totals = {"generated": 0, "failed": 0, "skipped": 0}
+    for language, by_module in curriculum.items():
+        counts = {"generated": 0, "failed": 0, "skipped": 0}
+        for result in by_module.values():
+            items = list(result["lessons"].values())
+            if result["overview"] is not None:
+                items.append(result["overview"])
+            failed = sum(isinstance(item, Exception) for item in items)
+            counts["failed"] += failed
+            counts["generated"] += len(items) - failed
+            counts["skipped"] += len(result["skipped"])
+        for key in totals:
+            totals[key] += counts[key]
+        print(f"  {language}: {counts['generated']} generated, {counts['skipped']} already done, {counts['failed']} failed"
+              f" -> {save_dir_for(language, args.base_dir)}")
+    rate = totals["generated"] / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"  Total: {totals['generated']} generated, {totals['skipped']} already done, {totals['failed']} failed "
+          f"in {elapsed:.1f}s ({rate:.1f} items/min, {args.workers} workers)")
+    return 1 if totals["failed"] else 0
+
+def run_serve_command(args):
+    """Implements 'python -m program serve': the multi-learner HTTP service."""
+    import asyncio
+    global PRINT_RAW_RESPONSES
+    PRINT_RAW_RESPONSES = args.verbose
+    service = LessonService(base_dir=args.base_dir, workers=args.workers, max_queue=args.max_queue)
+
+    def ready(server):
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Serving {LANGUAGE} lessons with {MODEL_NAME} on http://{host}:{port} "
+              f"({service.queue.workers} workers, queue of {service.queue.max_queue}); learners in {service.base_dir}")
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, ready=ready))
+    except KeyboardInterrupt:
+        print("Stopped.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="program", description=f"{LANGUAGE} Language Professor. Run without a command to start the app.")
+    subparsers = parser.add_subparsers(dest="command")
+    generate_parser = subparsers.add_parser("generate", help="Pre-generate lessons and module overviews without the GUI.")
+    generate_parser.add_argument("--languages", default=LANGUAGE, help="Comma-separated languages, e.g. French,Spanish")
+    generate_parser.add_argument("--modules", default=f"{ORDERED_MODULES[0]}-{ORDERED_MODULES[-1]}", help="Module range or list, e.g. A1-B2 or A1,C1")
+    generate_parser.add_argument("--workers", type=int, default=MODULE_GEN_CONCURRENCY, help="Max parallel Ollama requests")
+    generate_parser.add_argument("--model", help=f"Ollama model to use (default: {MODEL_NAME})")
+    generate_parser.add_argument("--base-dir", default=BASE_SAVE_DIR, help="Root folder; each language gets its own tree below it")
+    generate_parser.add_argument("--no-overviews", action="store_true", help="Only generate lessons")
+    generate_parser.add_argument("--verbose", action="store_true", help="Print raw Ollama responses")
+    export_parser = subparsers.add_parser("export", help="Render the lesson database (LESSON_STORE = \"sqlite\") to .md files.")
+    export_parser.add_argument("--overwrite", action="store_true", help="Also rewrite .md files that already exist")
+    serve_parser = subparsers.add_parser("serve", help="Serve lessons to many learners over HTTP.")
+    serve_parser.add_argument("--host", default=SERVICE_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    serve_parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Max parallel Ollama requests")
+    serve_parser.add_argument("--max-queue", type=int, default=SERVICE_MAX_QUEUE, help="Ollama requests allowed to wait before refusing with 503")
+    serve_parser.add_argument("--base-dir", default=SERVICE_LEARNERS_DIR, help="Folder holding one subfolder per learner")
+    serve_parser.add_argument("--verbose", action="store_true", help="Print raw Ollama responses")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        store = SQLiteLessonStore() # Works even if LESSON_STORE is "files", e.g. after switching back
+        print(f"Wrote {store.export_markdown(overwrite=args.overwrite)} file(s) to {SAVE_DIR}")
+        return 0
+    if args.command == "generate":
+        try:
+            return run_generate_command(args)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.command == "serve":
+        return run_serve_command(args)
+
     # Ensure the save directory exists before starting the app
     os.makedirs(SAVE_DIR, exist_ok=True)
     app = LanguageProfessorApp()
     app.mainloop()
+    if UNLOAD_MODEL_ON_EXIT:
+        try:
+            get_ollama_client().unload_model()
+        except OllamaError:
+            pass # Ollama will unload it after OLLAMA_KEEP_ALIVE anyway
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ VENV_DIR="venv"
 SCRIPT_NAME="program.py"
 REQUIREMENTS_FILE="requirements.txt"
 REQUIRED_PACKAGES="requests"
+REQUIREMENTS_STAMP="$VENV_DIR/.requirements.sha256"
 
 # Function to detect and install tkinter
 install_tkinter() {
@@ -55,18 +56,25 @@ if [ ! -f "$REQUIREMENTS_FILE" ]; then
     echo "$REQUIRED_PACKAGES" > $REQUIREMENTS_FILE
 fi
 
-# Step 4: Install pip packages
-echo "📥 Installing required packages..."
-pip install --upgrade pip
-pip install -r $REQUIREMENTS_FILE
+# Step 4: Install pip packages, only when requirements.txt changed since the last install
+REQUIREMENTS_HASH=$(sha256sum "$REQUIREMENTS_FILE" | cut -d' ' -f1)
+if [ "$REQUIREMENTS_HASH" != "$(cat "$REQUIREMENTS_STAMP" 2>/dev/null)" ]; then
+    echo "📥 Installing required packages..."
+    pip install --upgrade pip
+    pip install -r $REQUIREMENTS_FILE && echo "$REQUIREMENTS_HASH" > "$REQUIREMENTS_STAMP"
+else
+    echo "✅ Required packages already installed."
+fi
 
 # Step 5: Ensure tkinter is installed (may require sudo)
-install_tkinter
+if ! python -c "import tkinter" 2>/dev/null; then
+    install_tkinter
+fi
 
-# Step 6: Run the program
+# Step 6: Run the program (as a module, so its compiled bytecode is cached between launches)
 if [ -f "$SCRIPT_NAME" ]; then
     echo "🚀 Running $SCRIPT_NAME..."
-    python $SCRIPT_NAME
+    python -m "${SCRIPT_NAME%.py}"
 else
     echo "❌ $SCRIPT_NAME not found."
 fi
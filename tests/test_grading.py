@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+LIKES = {"type": "multiple_choice", "question": "She ___ tea.", "options": ["like", "likes", "liking"], "answer": "likes"}
+LABELED = dict(LIKES, options=["a) like", "b) likes", "c) liking"])
+VRAI_FAUX = {"type": "true_false", "question": "'Elle a' is avoir.", "options": ["Vrai", "Faux"], "answer": True}
+
+
+@pytest.mark.parametrize("ex, answer", [
+    (VRAI_FAUX, "Vrai"),
+    (VRAI_FAUX, "vrai"),
+    (VRAI_FAUX, "a"),
+    (VRAI_FAUX, "1"),
+    (VRAI_FAUX, "true"),
+    (dict(VRAI_FAUX, answer=False), "Faux"),
+    (dict(VRAI_FAUX, answer=False, options=["Falsch", "Richtig"]), "falsch"),
+    ({"type": "true_false", "question": "'Elle a' is avoir.", "answer": True}, "vrai"),
+    (LIKES, "b) likes"),
+    (LIKES, "(b) likes"),
+    (LIKES, "b"),
+    (dict(LIKES, answer="B"), "likes"),
+    (dict(LIKES, answer="b)"), "B."),
+    (dict(LIKES, answer=2), "likes"),
+    (LABELED, "likes"),
+    (LABELED, "b"),
+    (dict(LABELED, answer="b) likes"), "likes"),
+    ({"type": "fill_in_blank", "question": "Je ___ (être) étudiant.", "answer": "suis"}, "1. suis"),
+    ({"type": "fill_in_blank", "question": "Il est ___ heures.", "answer": 0}, "0"),
+])
+def test_grade_exercise_accepts_the_right_answer_in_any_form(ex, answer):
+    assert program.grade_exercise(ex, answer) == (True, "Correct.")
+
+
+@pytest.mark.parametrize("ex, answer, correct_text", [
+    (VRAI_FAUX, "Faux", "Vrai"),
+    (VRAI_FAUX, "b", "Vrai"),
+    ({"type": "true_false", "question": "'Elle a' is avoir.", "answer": True}, "false", "true"),
+    (LIKES, "a) like", "likes"),
+    (dict(LIKES, answer="B"), "like", "likes"),
+    (LABELED, "liking", "likes"),
+])
+def test_grade_exercise_rejects_another_option(ex, answer, correct_text):
+    assert program.grade_exercise(ex, answer) == (False, f"Incorrect. The correct answer is: *{correct_text}*")
+
+
+@pytest.mark.parametrize("ex, answer", [
+    (LIKES, "loves"), # Not an option
+    (LIKES, "a) likes"), # The label and the text disagree
+    (dict(LIKES, answer="d"), "likes"), # The key isn't one of the options
+    (VRAI_FAUX, "peut-être"),
+    ({"type": "fill_in_blank", "question": "Je ___ (être) étudiant.", "answer": "suis"}, "étais"),
+    ({"type": "short_answer", "question": "Translate: I am tired.", "answer": "Je suis fatigué."}, "Je suis crevé."),
+    ({"type": "essay", "question": "Describe your weekend."}, "Samedi, je suis allé au marché."),
+])
+def test_grade_exercise_leaves_answers_it_cant_place_to_the_model(ex, answer):
+    assert program.grade_exercise(ex, answer) is None
+
+
+def test_grade_exercise_points_out_missing_accents():
+    ex = {"type": "multiple_choice", "question": "Il a ___.", "options": ["été", "eu"], "answer": "a"}
+    assert program.grade_exercise(ex, "ete") == (True, "Correct, but check your accents: *été*")
+    ex = {"type": "fill_in_blank", "question": "Il a ___ malade.", "answer": "été"}
+    assert program.grade_exercise(ex, "ete") == (True, "Correct, but check your accents: *été*")
@@ -0,0 +1,44 @@
+import json
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+LESSON = {
+    "explanation_summary": "Être and avoir.",
+    "lesson_content": "Je suis, tu es, il est.",
+    "exercises": [
+        {"type": "fill_in_blank", "question": "Je ___ (être) étudiant.", "answer": "suis", "options": None, "accepted_answers": None},
+        {"type": "true_false", "question": "'Elle a' is avoir.", "options": ["Vrai", "Faux"], "answer": True},
+        {"type": None, "question": "Describe your weekend.", "answer": None, "options": None, "accepted_answers": []},
+        "Translate: I am tired.",
+    ],
+}
+
+
+def stream(schema, text, piece=7):
+    validator = program.IncrementalJSONValidator(schema)
+    for start in range(0, len(text), piece):
+        validator.feed(text[start:start + piece])
+    return validator
+
+
+def test_null_optional_exercise_fields_are_valid():
+    assert program.validate_json_schema(LESSON, program.LESSON_SCHEMA) is LESSON
+    assert stream(program.LESSON_SCHEMA, json.dumps(LESSON)).done
+
+
+@pytest.mark.parametrize("exercise, error", [
+    ({"type": "essay", "question": None}, "$.exercises[0].question should be string, got null"),
+    ({"type": "essay", "question": "Why?", "options": "a, b"}, "$.exercises[0].options should be array or null, got string"),
+    ({"type": "essay", "question": "Why?", "options": [None]}, "$.exercises[0].options[0] should be string, got null"),
+])
+def test_wrong_exercise_field_types_are_rejected(exercise, error):
+    with pytest.raises(ValueError, match=re.escape(error)):
+        program.validate_json_schema(dict(LESSON, exercises=[exercise]), program.LESSON_SCHEMA)
+    with pytest.raises(program.StreamAborted):
+        stream(program.LESSON_SCHEMA, json.dumps(dict(LESSON, exercises=[exercise])))
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+LESSON = {"explanation_summary": "Être.", "lesson_content": "Je suis.", "exercises": []}
+
+
+def test_history_lists_newest_lessons_first(tmp_path, monkeypatch):
+    store = program.SQLiteLessonStore(save_dir=str(tmp_path))
+    clock = iter(range(100))
+    monkeypatch.setattr(program.time, "time", lambda: float(next(clock)))
+    for lesson in (1, 2, 3):
+        store.save_lesson("A1", lesson, LESSON, generation_s=1.5)
+    store.save_correction("A1", 2, ["suis"], "1. ✅ Correct.", correction_s=0.5)
+
+    history = store.history()
+    assert [(row["module"], row["lesson"]) for row in history] == [("A1", 3), ("A1", 2), ("A1", 1)]
+    assert history[0]["generation_s"] == 1.5 and "data" not in history[0]
+    assert [row["lesson"] for row in store.history(limit=2)] == [3, 2]
+    assert [(row["lesson"], row["correction_s"]) for row in store.history(corrected_only=True)] == [(2, 0.5)]
+    store.close()
+
+
+def test_history_queries_are_indexed(tmp_path):
+    store = program.SQLiteLessonStore(save_dir=str(tmp_path))
+    indexes = {row["name"] for row in store._query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"lessons_by_generated_at", "lessons_by_corrected_at"} <= indexes
+    plan = " ".join(row["detail"] for row in store._query(
+        "EXPLAIN QUERY PLAN SELECT module, lesson FROM lessons ORDER BY generated_at DESC LIMIT ?", (50,)))
+    assert "lessons_by_generated_at" in plan and "TEMP B-TREE" not in plan
+    store.close()
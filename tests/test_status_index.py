@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import program  # noqa: E402
+
+LESSON = {
+    "explanation_summary": "Être and avoir.",
+    "lesson_content": "Je suis, tu es, il est.",
+    "exercises": [{"type": "fill_in_blank", "question": "Je ___ (être) étudiant.", "answer": "suis"}],
+}
+
+
+def write_lesson(save_dir, module, lesson, answer="", corrected=False):
+    filepath = program.save_lesson_md(module, lesson, LESSON, save_dir=save_dir, language="French")
+    if answer:
+        with open(filepath, "r") as f:
+            text = f.read()
+        with open(filepath, "w") as f:
+            f.write(text.replace(program.ANSWER_MARKER + " ", f"{program.ANSWER_MARKER} {answer}", 1))
+    if corrected:
+        program.append_correction_to_md(module, lesson, "1. ✅ Correct.", save_dir=save_dir)
+    return filepath
+
+
+def test_all_statuses_lists_every_lesson_in_curriculum_order(tmp_path):
+    save_dir = str(tmp_path)
+    write_lesson(save_dir, "A2", 1)
+    write_lesson(save_dir, "A1", 10, answer="suis", corrected=True)
+    write_lesson(save_dir, "A1", 2, answer="suis")
+    program.save_lesson_json("A1", 3, LESSON, save_dir=save_dir) # Not a lesson .md file
+    program.save_module_overview_md("A1", {"topics_covered": []}, save_dir=save_dir, language="French")
+
+    statuses = program.LessonStatusIndex(save_dir=save_dir).all_statuses()
+
+    assert list(statuses) == [("A1", 2), ("A1", 10), ("A2", 1)]
+    assert statuses[("A1", 2)] == {"generated": True, "answered": True, "corrected": False}
+    assert statuses[("A1", 10)] == {"generated": True, "answered": True, "corrected": True}
+    assert statuses[("A2", 1)] == {"generated": True, "answered": False, "corrected": False}
+
+
+def test_all_statuses_reuses_the_saved_index_until_a_file_changes(tmp_path, monkeypatch):
+    save_dir = str(tmp_path)
+    write_lesson(save_dir, "A1", 1)
+    write_lesson(save_dir, "A1", 2)
+    program.LessonStatusIndex(save_dir=save_dir).all_statuses()
+
+    parsed = []
+    parse_lesson_md = program.parse_lesson_md
+    monkeypatch.setattr(program, "parse_lesson_md", lambda text: parsed.append(text) or parse_lesson_md(text))
+    index = program.LessonStatusIndex(save_dir=save_dir)
+    assert index.all_statuses()[("A1", 1)]["answered"] is False
+    assert parsed == []
+
+    write_lesson(save_dir, "A1", 1, answer="suis")
+    os.remove(os.path.join(save_dir, "A1_lesson_2.md"))
+    statuses = index.all_statuses()
+    assert list(statuses) == [("A1", 1)]
+    assert statuses[("A1", 1)]["answered"] is True
+    assert len(parsed) == 1
+    with open(os.path.join(save_dir, "lesson_status.json")) as f:
+        assert json.load(f).keys() == {"A1_lesson_1.md"}
+
+
+def test_the_index_file_is_read_on_first_use(tmp_path, monkeypatch):
+    save_dir = str(tmp_path)
+    write_lesson(save_dir, "A1", 1, answer="suis")
+    program.LessonStatusIndex(save_dir=save_dir).all_statuses()
+
+    opened = []
+    monkeypatch.setattr(program, "open", lambda path, *args, **kwargs: opened.append(path) or open(path, *args, **kwargs),
+                        raising=False)
+    index = program.LessonStatusIndex(save_dir=save_dir)
+    assert opened == []
+    assert index.status("A1", 1) == {"generated": True, "answered": True, "corrected": False}
+    assert opened == [os.path.join(save_dir, "lesson_status.json")]